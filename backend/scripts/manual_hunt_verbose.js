@@ -1,7 +1,43 @@
-const { runTestAutocat } = require('../../telegram-bot/test-autocat');
+const DEFAULT_PLAN = [
+    ['20 MTB Enduro', '20 mtb enduro'],
+    ['15 MTB DH', '15 mtb dh'],
+    ['7 MTB Trail', '7 mtb trail'],
+    ['3 MTB XC', '3 mtb xc'],
+    ['15 Gravel Allroad', '15 gravel allroad'],
+    ['7 Gravel Race', '7 gravel race'],
+    ['3 Gravel Bikepacking', '3 gravel bikepacking'],
+    ['8 Road Endurance', '8 road endurance'],
+    ['8 Road Aero', '8 road aero'],
+    ['3 Road Climbing', '3 road climbing'],
+    ['1 Road TT', '1 road tt'],
+    ['8 eMTB Enduro', '8 emtb enduro'],
+    ['1 Kids Specialized', '1 kids specialized'],
+    ['1 Kids Early Rider', '1 kids early rider'],
+];
+
+// --step "<command>" (repeatable) runs only these sub-hunts, e.g. one shard of remote_hunt_trigger.py;
+// --plan prints the default plan as JSON so the trigger can split it
+function planFromArgs(argv) {
+    const steps = [];
+    for (let i = 0; i < argv.length; i++) {
+        if (argv[i] === '--step' && argv[i + 1]) {
+            steps.push([argv[i + 1], argv[i + 1]]);
+            i++;
+        }
+    }
+    return steps.length ? steps : DEFAULT_PLAN;
+}
 
 async function runManualHunt() {
-    console.log('🚀 STARTING MANUAL VERBOSE HUNT (100 BIKES)...');
+    if (process.argv.includes('--plan')) {
+        console.log(JSON.stringify(DEFAULT_PLAN));
+        return;
+    }
+    // Loaded after --plan: the hunter opens the DB and network clients on require
+    const { runTestAutocat } = require('../../telegram-bot/test-autocat');
+    const plan = planFromArgs(process.argv.slice(2));
+    const bikes = plan.reduce((sum, [, command]) => sum + (parseInt(command, 10) || 0), 0);
+    console.log(`🚀 STARTING MANUAL VERBOSE HUNT (${bikes} BIKES)...`);
     console.log('   Target: Remote Server (Self)');
 
     const mockBot = {
@@ -25,20 +61,9 @@ async function runManualHunt() {
 
     console.log('   ✅ Hunter Initialized.');
 
-    await runStep('20 MTB Enduro', '20 mtb enduro');
-    await runStep('15 MTB DH', '15 mtb dh');
-    await runStep('7 MTB Trail', '7 mtb trail');
-    await runStep('3 MTB XC', '3 mtb xc');
-    await runStep('15 Gravel Allroad', '15 gravel allroad');
-    await runStep('7 Gravel Race', '7 gravel race');
-    await runStep('3 Gravel Bikepacking', '3 gravel bikepacking');
-    await runStep('8 Road Endurance', '8 road endurance');
-    await runStep('8 Road Aero', '8 road aero');
-    await runStep('3 Road Climbing', '3 road climbing');
-    await runStep('1 Road TT', '1 road tt');
-    await runStep('8 eMTB Enduro', '8 emtb enduro');
-    await runStep('1 Kids Specialized', '1 kids specialized');
-    await runStep('1 Kids Early Rider', '1 kids early rider');
+    for (const [label, command] of plan) {
+        await runStep(label, command);
+    }
 
     if (failures.length) {
         console.log(`❌ MANUAL HUNT завершен с ошибками: ${failures.length}`);
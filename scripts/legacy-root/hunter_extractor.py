@@ -0,0 +1,454 @@
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from dataclasses import dataclass, field, asdict
+from typing import List, Optional
+
+from bs4 import BeautifulSoup
+
+# Shared parsing helpers live next to the Groq parser
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'telegram-bot'))
+from field_normalize import find_size, find_year, is_negotiable, parse_price
+from structured_data import FastPathStats, as_bytes, element_span, element_spans, fragment_text, scan_structured
+
+# Single-pass listing extractor for Kleinanzeigen ad pages.
+#
+# analyze_hunter_logic ran a separate select_one per field, compiled its regexes on
+# every call and could call soup.get_text() over the whole page up to three times.
+# Here the tag tree is walked once, collecting the first element for every field
+# selector in document order (same result as select_one), the full page text is
+# computed at most once, and every pattern is compiled at import time.
+#
+# Before any DOM is built, a byte-level fast path (telegram-bot/structured_data.py)
+# cuts the same elements out of the raw page by their id/class anchors and reads
+# meta / JSON-LD / tracking data. BeautifulSoup only runs when an anchor is missing
+# or the markup is ambiguous for the byte scanner (fragment_text returns None).
+# Structured data also fills gaps on both paths: title, price, and ZIP (tried
+# before the page-text ZIP heuristic).
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+HUB_ZIP = '35037'  # Marburg
+GREEN_ZONE_KM = 100
+TRUST_REFERENCE_YEAR = 2026
+
+# field -> (ids, classes, tag names); first match in document order wins
+FIELD_SELECTORS = {
+    'title': ((), ('boxedarticle--title',), ()),
+    'title_h1': ((), (), ('h1',)),
+    'price': ((), ('boxedarticle--price',), ()),
+    'price_fallback': ((), ('price-element',), ()),
+    'description': (('viewad-description-text',), (), ()),
+    'location': ((), ('boxedarticle--location',), ()),
+    'location_fallback': ((), ('ad-location',), ()),
+    'seller': (('viewad-contact',), (), ()),
+}
+# every match is collected for these (concatenated like the old select())
+SHIPPING_IDS = {'viewad-price'}
+SHIPPING_CLASSES = {'boxedarticle--details', 'ad-shipping-details'}
+
+ID_TARGETS = {}
+CLASS_TARGETS = {}
+TAG_TARGETS = {}
+for _field, (_ids, _classes, _tags) in FIELD_SELECTORS.items():
+    for _id in _ids:
+        ID_TARGETS.setdefault(_id, []).append(_field)
+    for _cls in _classes:
+        CLASS_TARGETS.setdefault(_cls, []).append(_field)
+    for _tag in _tags:
+        TAG_TARGETS.setdefault(_tag, []).append(_field)
+
+# Price, year and size rules are shared with the Groq parser (telegram-bot/field_normalize.py)
+PICKUP_RE = re.compile(r'Nur\s*Abholung', re.IGNORECASE)
+ZIP_RE = re.compile(r'\b(\d{5})\b')
+# Anchors the fast path needs; any of them missing -> DOM parse
+FAST_ANCHORS = {
+    'title': (('class', 'boxedarticle--title'),),
+    'price': (('class', 'boxedarticle--price'), ('class', 'price-element')),
+    'description': (('id', 'viewad-description-text'),),
+    'location': (('class', 'boxedarticle--location'), ('class', 'ad-location')),
+    'seller': (('id', 'viewad-contact'),),
+}
+SHIPPING_ANCHORS = (('class', 'boxedarticle--details'), ('id', 'viewad-price'), ('class', 'ad-shipping-details'))
+ZIP_CONTEXT_RE = re.compile(r'\b(\d{5})\s+[A-ZÄÖÜ][a-zäöü]+')
+SINCE_RE = re.compile(r'Aktiv\s*seit\s*(\d{2}\.\d{2}\.\d{4})')
+SELLER_ID_BYTES_RE = re.compile(rb'userId=(\d+)')
+SELLER_ID_RE = re.compile(r'userId=(\d+)')
+SATISFACTION_RE = re.compile(r'Zufrieden|TOP')
+
+
+class AmbiguousMarkup(ValueError):
+    # Raised inside extract_fast when the byte scanner cannot read a fragment safely
+    pass
+
+
+@dataclass
+class ListingRecord:
+    title: str = 'N/A'
+    price: float = 0
+    price_type: str = 'FIXED'
+    price_text: str = ''
+    description: str = ''
+    year: Optional[str] = None
+    year_match: Optional[str] = None
+    size: Optional[str] = None
+    size_match: Optional[str] = None
+    shipping: str = 'AVAILABLE'
+    pickup_source: Optional[str] = None      # 'details' | 'description' | 'page'
+    badges: List[str] = field(default_factory=list)
+    zip: Optional[str] = None
+    zip_source: Optional[str] = None         # 'location' | 'structured' | 'page'
+    location_text: str = ''
+    distance_km: Optional[float] = None
+    logistics_zone: Optional[str] = None
+    seller_found: bool = False
+    seller_since: Optional[str] = None
+    seller_rating: Optional[str] = None
+    seller_trust_score: Optional[int] = None
+    seller_id: Optional[str] = None
+    seller_badges: List[str] = field(default_factory=list)
+    seller_cached: bool = False
+    category: Optional[str] = None
+    fast_path: bool = False
+
+    def to_report(self):
+        # Same keys as the historical analyze_hunter_logic report
+        report = {
+            'title': self.title,
+            'price': self.price,
+            'price_type': self.price_type,
+            'description_preview': self.description[:100] + "...",
+            'year': self.year,
+            'size': self.size,
+            'shipping': self.shipping,
+        }
+        if self.badges:
+            report['badges'] = list(self.badges)
+        if self.zip:
+            report['zip'] = self.zip
+        if self.logistics_zone:
+            report['logistics_zone'] = self.logistics_zone
+        if self.seller_found:
+            report['seller_trust_score'] = self.seller_trust_score
+            report['seller_since'] = self.seller_since
+        return report
+
+
+def seller_rating(badges, badge_text=None):
+    # Same rating from the ad's contact block and the profile page: the satisfaction badge
+    # ("TOP Zufriedenheit") wherever it sits in the badge list, else the first badge
+    for text in [*badges, badge_text or '']:
+        if SATISFACTION_RE.search(text):
+            return text
+    return badges[0] if badges else (badge_text or "Unknown")
+
+
+def trust_score(since, rating):
+    score = 0
+    if since != "Unknown":
+        score += (TRUST_REFERENCE_YEAR - int(since.split('.')[2])) * 2  # 2 points per year
+    if SATISFACTION_RE.search(rating):
+        score += 5
+    return score
+
+
+def collect_fields(soup):
+    # One walk over all tags: first element per field + every shipping element
+    found = {}
+    shipping = []
+    for tag in soup.find_all(True):
+        attrs = tag.attrs
+        tag_id = attrs.get('id')
+        classes = attrs.get('class') or ()
+        if tag_id in SHIPPING_IDS or any(c in SHIPPING_CLASSES for c in classes):
+            shipping.append(tag)
+        if tag_id in ID_TARGETS:
+            for name in ID_TARGETS[tag_id]:
+                found.setdefault(name, tag)
+        for cls in classes:
+            if cls in CLASS_TARGETS:
+                for name in CLASS_TARGETS[cls]:
+                    found.setdefault(name, tag)
+        if tag.name in TAG_TARGETS:
+            for name in TAG_TARGETS[tag.name]:
+                found.setdefault(name, tag)
+    return found, shipping
+
+
+class ListingExtractor:
+    def __init__(self, hub_zip=HUB_ZIP, green_km=GREEN_ZONE_KM, distance=True, fast=True, seller_cache=None):
+        self.hub_zip = hub_zip
+        self.green_km = green_km
+        self.distance = distance
+        self.fast = fast
+        self.seller_cache = seller_cache  # seller_cache.SellerCache: trust reused per seller ID
+        self.stats = FastPathStats()
+        self.step_seconds = {'structured': 0.0, 'fast_path': 0.0, 'dom': 0.0, 'zone': 0.0}
+
+    def extract(self, html):
+        # Cumulative time per step in step_seconds (read by the offline benchmark)
+        steps = self.step_seconds
+        t0 = time.perf_counter()
+        raw = as_bytes(html)
+        structured = scan_structured(raw)
+        t1 = time.perf_counter()
+        record, missing = self.extract_fast(raw, structured) if self.fast else (None, ['disabled'])
+        self.stats.record(missing)
+        t2 = time.perf_counter()
+        steps['structured'] += t1 - t0
+        steps['fast_path'] += t2 - t1
+        if record is None:
+            record = self.extract_dom(html, structured)
+            t3 = time.perf_counter()
+            steps['dom'] += t3 - t2
+            t2 = t3
+        if record.zip and self.distance:
+            self._zone(record)
+            steps['zone'] += time.perf_counter() - t2
+        return record
+
+    def extract_fast(self, raw, structured):
+        texts = {}
+        missing = []
+        for name, anchors in FAST_ANCHORS.items():
+            for kind, value in anchors:
+                span = element_span(raw, kind, value)
+                if span is not None:
+                    texts[name] = span
+                    break
+            else:
+                missing.append(name)
+        if missing:
+            return None, missing
+
+        def fragment(start, end, strip):
+            value = fragment_text(raw[start:end], strip=strip)
+            if value is None:
+                raise AmbiguousMarkup
+            return value
+
+        def text(name, strip=True):
+            return fragment(*texts[name], strip)
+
+        full_text = None
+
+        def page_text():
+            nonlocal full_text
+            if full_text is None:
+                full_text = fragment(0, len(raw), False)
+            return full_text
+
+        def shipping_text():
+            spans = [element_span(raw, kind, value) for kind, value in SHIPPING_ANCHORS]
+            return "".join(" " + (fragment(*span, False) if span else "") for span in spans)
+
+        record = ListingRecord(fast_path=True)
+        start, end = texts['seller']
+
+        def seller_block():
+            badges = [fragment(*span, True) for _, span in element_spans(raw, 'class', 'userbadge-tag', start, end) if span]
+            rating_span = element_span(raw, 'class', 'userbadge', start, end)
+            return text('seller', strip=False), fragment(*rating_span, True) if rating_span else None, badges
+
+        try:
+            self._fill(record, text('title'), text('price'), text('description'), text('location'),
+                       shipping_text, page_text, structured)
+            record.seller_found = True
+            id_match = SELLER_ID_BYTES_RE.search(raw, start, end)
+            self._seller(record, id_match.group(1).decode() if id_match else None, seller_block)
+        except AmbiguousMarkup:
+            return None, ['ambiguous']
+        return record, missing
+
+    def extract_dom(self, html, structured):
+        soup = BeautifulSoup(html, HTML_PARSER)
+        found, shipping_els = collect_fields(soup)
+        full_text = None
+
+        def page_text():
+            nonlocal full_text
+            if full_text is None:
+                full_text = soup.get_text()
+            return full_text
+
+        def text_of(*names):
+            for name in names:
+                if name in found:
+                    return found[name].get_text(strip=True)
+            return None
+
+        record = ListingRecord()
+        self._fill(record, text_of('title', 'title_h1'), text_of('price', 'price_fallback'),
+                   text_of('description'), text_of('location', 'location_fallback'),
+                   lambda: "".join(" " + el.get_text() for el in shipping_els), page_text, structured)
+
+        seller_el = found.get('seller')
+        if seller_el is not None:
+            record.seller_found = True
+            link = seller_el.find('a', href=SELLER_ID_RE)
+
+            def seller_block():
+                rating_el = seller_el.find(class_='userbadge')
+                badges = [el.get_text(strip=True) for el in seller_el.find_all(class_='userbadge-tag')]
+                return seller_el.get_text(), rating_el.get_text(strip=True) if rating_el else None, badges
+
+            self._seller(record, SELLER_ID_RE.search(link['href']).group(1) if link else None, seller_block)
+        return record
+
+    def _fill(self, record, title, price_text, description, location, shipping_text, page_text, structured):
+        # Shared field logic for both paths; shipping_text/page_text are callables (computed on demand)
+        record.title = title or structured.get('title') or "N/A"
+
+        record.price_text = price_text or ""
+        record.price = parse_price(record.price_text) or structured.get('price') or 0
+        if is_negotiable(record.price_text):
+            record.price_type = 'VB'
+
+        record.description = description or ""
+        record.year_match, record.year = find_year(record.description)
+        record.size_match, record.size = find_size(record.description, record.title)
+
+        if PICKUP_RE.search(shipping_text()):
+            record.pickup_source = 'details'
+        elif PICKUP_RE.search(record.description):
+            record.pickup_source = 'description'
+        elif PICKUP_RE.search(page_text()):
+            record.pickup_source = 'page'
+        if record.pickup_source:
+            record.shipping = 'PICKUP_ONLY'
+            record.badges = ['LOCAL_LOT']
+
+        record.location_text = location or ""
+        zip_match = ZIP_RE.search(record.location_text)
+        if zip_match:
+            record.zip, record.zip_source = zip_match.group(1), 'location'
+        elif structured.get('zip'):
+            record.zip, record.zip_source = structured['zip'], 'structured'
+        else:
+            zip_match = ZIP_CONTEXT_RE.search(page_text())
+            if zip_match:
+                record.zip, record.zip_source = zip_match.group(1), 'page'
+        record.category = structured.get('category')
+
+    def _seller(self, record, seller_id, seller_block):
+        # seller_block() -> (contact text, rating, badges); skipped on a fresh cache hit
+        record.seller_id = seller_id
+        profile = self.seller_cache.get(seller_id) if self.seller_cache is not None and seller_id else None
+        if profile is not None:
+            record.seller_cached = True
+            record.seller_since = profile['since']
+            record.seller_rating = profile['rating']
+            record.seller_badges = list(profile['badges'])
+            record.seller_trust_score = profile['score']
+            return
+
+        contact_text, rating, badges = seller_block()
+        since_match = SINCE_RE.search(contact_text)
+        record.seller_since = since_match.group(1) if since_match else "Unknown"
+        record.seller_badges = [badge for badge in badges if badge]
+        record.seller_rating = seller_rating(record.seller_badges, rating)
+        record.seller_trust_score = trust_score(record.seller_since, record.seller_rating)
+        if self.seller_cache is not None and seller_id:
+            self.seller_cache.put(seller_id, record.seller_since, record.seller_rating, record.seller_badges)
+
+    def _zone(self, record):
+        from plz_geo import default_table, distances_to_hub
+        dist = distances_to_hub(default_table(), [record.zip], self.hub_zip)[0]
+        if dist == dist:  # NaN -> PLZ not in table
+            record.distance_km = round(float(dist), 1)
+            record.logistics_zone = 'GREEN' if record.distance_km < self.green_km else 'YELLOW'
+
+
+_default_extractor = ListingExtractor()
+
+def extract_listing(html):
+    return _default_extractor.extract(html)
+
+
+def extract_page_bytes(raw):
+    # Process pool worker (see telegram-bot/html_pool.py): bytes in, compact report out
+    return extract_listing(raw.decode('utf-8', errors='replace')).to_report()
+
+
+def run_benchmark(pages, repeat, golden=None):
+    # pages: [(name, html)]. The reference is the original multi-scan function
+    # (hunter_baseline.analyze_hunter_logic); golden: optional saved reports from
+    # hunter_test_agent.py --offline DIR --golden FILE for a regression diff
+    from hunter_baseline import analyze_hunter_logic
+    from hunter_test_agent import diff_golden
+
+    def timed(fn):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            outputs = [fn(html) for _, html in pages]
+        elapsed = time.perf_counter() - start
+        return outputs, round(len(pages) * repeat / elapsed, 1)
+
+    def by_name(outputs):
+        return {name: report for (name, _), report in zip(pages, outputs)}
+
+    dom = ListingExtractor(fast=False)
+    fast = ListingExtractor()
+    baseline_out, baseline_rate = timed(analyze_hunter_logic)
+    dom_out, dom_rate = timed(lambda html: dom.extract(html).to_report())
+    fast_out, fast_rate = timed(lambda html: fast.extract(html).to_report())
+    fast.stats = FastPathStats()
+    for _, html in pages:
+        fast.extract(html)
+    result = {
+        'pages': len(pages),
+        'repeat': repeat,
+        'parser': HTML_PARSER,
+        'baseline_pages_per_sec': baseline_rate,
+        'extractor_pages_per_sec': dom_rate,
+        'fast_path_pages_per_sec': fast_rate,
+        'speedup': round(fast_rate / baseline_rate, 2) if baseline_rate else 0.0,
+        'fast_path': fast.stats.summary(),
+        # Field-level changes against the original function (structured data may fill gaps it left)
+        'baseline_diff': diff_golden(by_name(baseline_out), by_name(fast_out)),
+        'fast_vs_dom_mismatched_pages': [name for (name, _), a, b in zip(pages, dom_out, fast_out) if a != b],
+    }
+    if golden is not None:
+        result['golden'] = diff_golden(golden, by_name(fast_out))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Single-pass Kleinanzeigen listing extractor')
+    parser.add_argument('html', nargs='*', help='Saved ad pages to extract')
+    parser.add_argument('--bench', metavar='DIR',
+                        help='Compare pages/sec and fields (original function, DOM, fast path) over saved pages')
+    parser.add_argument('--golden', help='With --bench: diff reports against hunter_test_agent.py --offline --golden output')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    if args.bench:
+        names = sorted(n for n in os.listdir(args.bench) if n.endswith(('.html', '.htm')))
+        pages = []
+        for name in names:
+            with open(os.path.join(args.bench, name), 'r', encoding='utf-8', errors='replace') as f:
+                pages.append((name, f.read()))
+        if not pages:
+            print(f"No .html files in {args.bench}", file=sys.stderr)
+            sys.exit(1)
+        golden = None
+        if args.golden:
+            with open(args.golden, 'r', encoding='utf-8') as f:
+                golden = json.load(f)
+        print(json.dumps(run_benchmark(pages, args.repeat, golden), indent=2))
+        return
+
+    for path in args.html:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            print(json.dumps(asdict(extract_listing(f.read())), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
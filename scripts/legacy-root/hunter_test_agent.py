@@ -1,44 +1,48 @@
-import paramiko
 import sys
 import os
-import re
 import json
-import math
-from bs4 import BeautifulSoup
+import time
+import argparse
 from datetime import datetime
 
+# Shared parsing helpers live next to the Groq parser, the SSH session next to the remote_* scripts
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'telegram-bot'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
 # Configuration
-HOST = '45.9.41.232'
-USER = 'root'
-PASS_FILE = 'deploy_password.txt'
 TARGET_URL = 'https://www.kleinanzeigen.de/s-anzeige/canyon-spectral-5/3302127274-217-4855'
 MARBURG_ZIP = '35037'
-MARBURG_COORDS = (50.8022, 8.7667) # Lat, Lon approx
 
 # Setup Logging
-def log(step, status, message):
-    print(f"[{step}][{status}] {message}")
+LOG_ENABLED = True
 
-def read_password():
-    try:
-        with open(PASS_FILE, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        log("SETUP", "ERROR", f"Password file {PASS_FILE} not found.")
-        sys.exit(1)
+def log(step, status, message):
+    if LOG_ENABLED:
+        print(f"[{step}][{status}] {message}")
 
 def ssh_connect(host, user, password):
+    # Shared session (scripts/ssh_session.py): keepalive, reconnect, concurrent channels
+    from ssh_session import SshSession
     log("STEP 1", "INFO", f"Connecting to {user}@{host}...")
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(host, username=user, password=password, timeout=10)
+        client = SshSession(host, user, password).connect()
         log("STEP 1", "SUCCESS", "SSH Connection established.")
         return client
     except Exception as e:
         log("STEP 1", "ERROR", f"SSH Connection failed: {str(e)}")
         sys.exit(1)
 
+_html_archive = None
+
+def archive_page(url, html):
+    # Keep every fetched page in the pack archive (html_archive.py) when --archive-html is set
+    if _html_archive is None:
+        return
+    try:
+        _html_archive.append(url, html)
+    except OSError as e:
+        log("STEP 2", "WARN", f"Could not archive page: {e}")
+
 def fetch_html_remote(client, url):
     log("STEP 2", "INFO", f"Fetching URL via remote: {url}")
     # Use curl with headers to mimic browser
@@ -50,220 +54,433 @@ def fetch_html_remote(client, url):
     
     if html and len(html) > 1000:
         log("STEP 2", "SUCCESS", f"Fetched {len(html)} bytes.")
+        archive_page(url, html)
         return html
     else:
         log("STEP 2", "ERROR", f"Fetch failed. Stderr: {error[:200]}...")
         return None
 
-def parse_price(text):
-    clean = re.sub(r'[^0-9.,]', '', text).strip()
-    if not clean: return 0
-    # Handle German format 1.200,00 -> 1200.00
-    if ',' in clean and '.' in clean:
-         # Assume . is thousand sep, , is decimal
-         clean = clean.replace('.', '').replace(',', '.')
-    elif ',' in clean:
-         clean = clean.replace(',', '.')
-    elif '.' in clean:
-         # If only dot, check if it's thousand sep (e.g. 1.200) or decimal (12.50)
-         # If 3 digits after dot, usually thousand sep
-         if re.match(r'.*\.\d{3}$', clean):
-             clean = clean.replace('.', '')
-    
+def fetch_html_tunnel(fetcher, url):
+    # Same contract as fetch_html_remote, but over the persistent direct-tcpip tunnel
+    log("STEP 2", "INFO", f"Fetching URL via tunnel: {url}")
     try:
-        return float(clean)
-    except:
-        return 0
-
-def calculate_distance(zip_code):
-    # Mock coordinates for demo
-    # In real app this would query a DB
-    mock_db = {
-        '35789': (50.4167, 8.3833), # Weilmünster
-        '35037': MARBURG_COORDS
-    }
-    
-    if zip_code in mock_db:
-        lat1, lon1 = mock_db[zip_code]
-        lat2, lon2 = MARBURG_COORDS
-        
-        # Haversine formula
-        R = 6371 # km
-        dlat = math.radians(lat2 - lat1)
-        dlon = math.radians(lon2 - lon1)
-        a = math.sin(dlat/2) * math.sin(dlat/2) + \
-            math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * \
-            math.sin(dlon/2) * math.sin(dlon/2)
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-        d = R * c
-        
-        return round(d, 1)
+        html = fetcher.fetch(url)
+    except Exception as e:
+        log("STEP 2", "ERROR", f"Tunnel fetch failed: {str(e)[:200]}")
+        return None
+    if html and len(html) > 1000:
+        log("STEP 2", "SUCCESS", f"Fetched {len(html)} bytes.")
+        archive_page(url, html)
+        return html
+    log("STEP 2", "ERROR", f"Tunnel fetch returned {len(html or '')} bytes.")
     return None
 
+def fetch_html_batch(client, urls, on_page):
+    # One SSH channel and one compressed stream for the whole URL list;
+    # on_page(url, html) runs as soon as each page is decoded
+    from remote_fetch import fetch_batch
+    log("STEP 2", "INFO", f"Fetching {len(urls)} URLs in one remote batch...")
+    stream = fetch_batch(client, urls)
+    while True:
+        try:
+            url, status, body = next(stream)
+        except StopIteration as done:
+            stats = done.value
+            log("STEP 2", "SUCCESS" if stats['exit_status'] == 0 else "ERROR", f"Batch transfer: {json.dumps(stats)}")
+            return stats
+        html = body.decode('utf-8', errors='replace')
+        if status == 200 and len(html) > 1000:
+            log("STEP 2", "SUCCESS", f"Fetched {len(html)} bytes: {url}")
+            archive_page(url, body)
+            on_page(url, html)
+        else:
+            log("STEP 2", "ERROR", f"Fetch failed (status {status}): {url} {' '.join(html[:200].split())}")
+
+def compare_fetch_paths(client, urls):
+    # Throughput of one-curl-per-URL vs the pooled tunnel session over the same URLs
+    from remote_fetch import RemoteFetcher
+    results = {}
+
+    start = time.perf_counter()
+    ok = sum(1 for url in urls if fetch_html_remote(client, url))
+    elapsed = time.perf_counter() - start
+    results['exec'] = {'pages': ok, 'seconds': round(elapsed, 3), 'pages_per_sec': round(len(urls) / elapsed, 2)}
+
+    fetcher = RemoteFetcher(client)
+    try:
+        start = time.perf_counter()
+        ok = sum(1 for url in urls if fetch_html_tunnel(fetcher, url))
+        elapsed = time.perf_counter() - start
+        results['tunnel'] = {'pages': ok, 'seconds': round(elapsed, 3), 'pages_per_sec': round(len(urls) / elapsed, 2)}
+        results['tunnel_reuse'] = fetcher.reuse_stats()
+    finally:
+        fetcher.close()
+
+    start = time.perf_counter()
+    pages = []
+    results['batch_transfer'] = fetch_html_batch(client, urls, lambda url, html: pages.append(url))
+    elapsed = time.perf_counter() - start
+    results['batch'] = {'pages': len(pages), 'seconds': round(elapsed, 3), 'pages_per_sec': round(len(urls) / elapsed, 2)}
+
+    for mode in ('tunnel', 'batch'):
+        if results['exec']['seconds'] and results[mode]['seconds']:
+            results[f'{mode}_speedup'] = round(results['exec']['seconds'] / results[mode]['seconds'], 2)
+    return results
+
+_plz_warned = False
+
+def get_plz_table():
+    global _plz_warned
+    from plz_geo import default_table
+    table = default_table()
+    if table.source == 'fallback' and not _plz_warned:
+        _plz_warned = True
+        log("SETUP", "WARNING", "PLZ table not built (python plz_geo.py --fetch); only fallback ZIPs resolve.")
+    return table
+
+def calculate_distance(zip_code, hub_zip=MARBURG_ZIP):
+    from plz_geo import distances_to_hub
+    dist = distances_to_hub(get_plz_table(), [zip_code], hub_zip)[0]
+    return None if dist != dist else round(float(dist), 1)  # NaN -> unknown PLZ
+
+def logistics_zones(zip_codes, hub_zip=MARBURG_ZIP, green_km=100):
+    # Vectorised zoning for many listings at once: GREEN / YELLOW / None (unknown PLZ)
+    from plz_geo import distances_to_hub
+    dist = distances_to_hub(get_plz_table(), zip_codes, hub_zip)
+    return [None if d != d else ('GREEN' if d < green_km else 'YELLOW') for d in dist.tolist()]
+
+_extractor = None
+
+def get_extractor(seller_cache=None):
+    # First call decides the seller cache; pool workers run without one
+    global _extractor
+    if _extractor is None:
+        from hunter_extractor import ListingExtractor
+        _extractor = ListingExtractor(hub_zip=MARBURG_ZIP, distance=False, seller_cache=seller_cache)
+    return _extractor
+
 def analyze_hunter_logic(html):
+    return analyze_listing(html).to_report()
+
+def analyze_listing(html):
+    # Single-pass extraction (hunter_extractor); the trace is emitted from the typed record
     log("STEP 3", "INFO", "Starting Raw Parsing & Logic Trace...")
-    soup = BeautifulSoup(html, 'html.parser')
-    report = {}
-    
-    # 1. Title
-    title_el = soup.select_one('.boxedarticle--title') or soup.select_one('h1')
-    title = title_el.get_text(strip=True) if title_el else "N/A"
-    log("STEP 3", "DEBUG", f"Found Title: '{title}'")
-    report['title'] = title
-
-    # 2. Price & Type
-    price_el = soup.select_one('.boxedarticle--price') or soup.select_one('.price-element')
-    price_text = price_el.get_text(strip=True) if price_el else ""
-    price_val = parse_price(price_text)
-    is_vb = 'VB' in price_text or 'Verhandlungsbasis' in price_text
-    log("STEP 3", "DEBUG", f"Found Price String: '{price_text}' -> Value: {price_val}, Type: {'VB' if is_vb else 'Fixed'}")
-    report['price'] = price_val
-    report['price_type'] = 'VB' if is_vb else 'FIXED'
-
-    # 3. Description & Specs
-    desc_el = soup.select_one('#viewad-description-text')
-    desc_text = desc_el.get_text(strip=True) if desc_el else ""
-    log("STEP 3", "DEBUG", f"Extracted Description ({len(desc_text)} chars).")
-    report['description_preview'] = desc_text[:100] + "..."
-
-    # Specs Regex Logic
-    # Year
-    year_match = re.search(r'(?:Neukauf|Rechnung|Baujahr|Year)\s*[:\s]*(\d{2}[./]\d{2}|\d{4})', desc_text, re.IGNORECASE)
-    if year_match:
-        val = year_match.group(1)
-        # Normalize "06/24" -> 2024
-        if '/' in val and len(val) <= 5:
-            parts = val.split('/')
-            if len(parts[1]) == 2: val = '20' + parts[1]
-        log("STEP 3", "DEBUG", f"Found Year Keyword: '{year_match.group(0)}' -> Mapped: {val}")
-        report['year'] = val
+    rec = get_extractor().extract(html)
+    log("STEP 3", "DEBUG", f"Extraction path: {'fast (structured data + anchors)' if rec.fast_path else 'DOM'}")
+
+    log("STEP 3", "DEBUG", f"Found Title: '{rec.title}'")
+    log("STEP 3", "DEBUG", f"Found Price String: '{rec.price_text}' -> Value: {rec.price}, Type: {'VB' if rec.price_type == 'VB' else 'Fixed'}")
+    log("STEP 3", "DEBUG", f"Extracted Description ({len(rec.description)} chars).")
+    if rec.year_match:
+        log("STEP 3", "DEBUG", f"Found Year Keyword: '{rec.year_match}' -> Mapped: {rec.year}")
     else:
         log("STEP 3", "DEBUG", "No Year keyword found.")
-        report['year'] = None
-
-    # Size
-    size_match = re.search(r'(?:Rahmengröße|Größe|Size)\s*[:\s-]*([LMS]|XL|XXL|\d{2}\s*cm|\d{2}\s*Zoll)', desc_text, re.IGNORECASE) or \
-                 re.search(r'\b(L|XL|M|S)\b', title) # Fallback to title
-    
-    if size_match:
-        val = size_match.group(1)
-        log("STEP 3", "DEBUG", f"Found Size Keyword: '{size_match.group(0)}' -> Mapped: {val}")
-        report['size'] = val
+    if rec.size_match:
+        log("STEP 3", "DEBUG", f"Found Size Keyword: '{rec.size_match}' -> Mapped: {rec.size}")
     else:
         log("STEP 3", "DEBUG", "No Size keyword found.")
-        report['size'] = None
-
-    # 4. Shipping / Local Lot
-    # Check "Nur Abholung" in price area or details
-    shipping_text = ""
-    shipping_els = soup.select('.boxedarticle--details, #viewad-price, .ad-shipping-details')
-    for el in shipping_els:
-        shipping_text += " " + el.get_text()
-    
-    is_local_lot = False
-    
-    # Primary check: Specific elements
-    if re.search(r'Nur\s*Abholung', shipping_text, re.IGNORECASE):
-        log("STEP 4", "DEBUG", f"Found 'Nur Abholung' trigger in details/price block.")
-        is_local_lot = True
-    elif re.search(r'Nur\s*Abholung', desc_text, re.IGNORECASE):
-        log("STEP 4", "DEBUG", f"Found 'Nur Abholung' trigger in description.")
-        is_local_lot = True
-    # Fallback: Check full body text if not found yet (Robustness)
-    elif re.search(r'Nur\s*Abholung', soup.get_text(), re.IGNORECASE):
-        log("STEP 4", "DEBUG", f"Found 'Nur Abholung' trigger in global page text (Fallback).")
-        is_local_lot = True
-    
-    if is_local_lot:
+
+    pickup_where = {'details': "details/price block", 'description': "description", 'page': "global page text (Fallback)"}
+    if rec.pickup_source:
+        log("STEP 4", "DEBUG", f"Found 'Nur Abholung' trigger in {pickup_where[rec.pickup_source]}.")
         log("STEP 4", "ACTION", "Setting LOCAL_LOT status. Activating Free Booking Protocol.")
-        report['shipping'] = 'PICKUP_ONLY'
-        report['badges'] = ['LOCAL_LOT']
     else:
         log("STEP 4", "DEBUG", "No 'Nur Abholung' found. Assuming Shipping Available.")
-        report['shipping'] = 'AVAILABLE'
 
-    # 5. Geodata
-    # Extract Zip
-    location_el = soup.select_one('.boxedarticle--location') or soup.select_one('.ad-location')
-    location_text = location_el.get_text(strip=True) if location_el else ""
-    zip_match = re.search(r'\b(\d{5})\b', location_text)
-    
-    if not zip_match:
-         # Fallback: Look for "PLZ" or just 5 digits in likely areas
-         log("STEP 5", "DEBUG", "ZIP not found in location element. Scanning full text for 'PLZ XXXXX' or 'XXXXX City'...")
-         full_text = soup.get_text()
-         # Look for 5 digits followed by City name (simplified)
-         # Or just the first 5 digit number that looks like a zip (3xxxx, 4xxxx etc)
-         # Try to find near "Hessen" or "Weilmünster"
-         context_match = re.search(r'\b(\d{5})\s+[A-ZÄÖÜ][a-zäöü]+', full_text)
-         if context_match:
-             zip_match = context_match
-             log("STEP 5", "DEBUG", f"Found potential ZIP in text: {zip_match.group(0)}")
-
-    if zip_match:
-        zip_code = zip_match.group(1)
-        log("STEP 5", "DEBUG", f"Found ZIP: {zip_code} in '{location_text}'")
-        report['zip'] = zip_code
-        
-        # Distance Logic
-        dist = calculate_distance(zip_code)
+    locate(rec)
+
+    if rec.seller_found:
+        if rec.seller_cached:
+            log("STEP 6", "DEBUG", f"Seller {rec.seller_id}: cached profile reused (Active since {rec.seller_since}, Rating: {rec.seller_rating})")
+        else:
+            log("STEP 6", "DEBUG", f"Seller {rec.seller_id or '?'}: Active since {rec.seller_since}, Rating: {rec.seller_rating}")
+        log("STEP 6", "INFO", f"Trust Score Calculated: {rec.seller_trust_score}/10")
+
+    return rec
+
+def locate(rec):
+    # STEP 5: distance to the hub and logistics zone for the extracted ZIP
+    if rec.zip_source == 'structured':
+        log("STEP 5", "DEBUG", "ZIP not found in location element. Taken from embedded tracking data.")
+    elif rec.zip_source == 'page':
+        log("STEP 5", "DEBUG", "ZIP not found in location element. Found potential ZIP in page text.")
+    if rec.zip:
+        log("STEP 5", "DEBUG", f"Found ZIP: {rec.zip} in '{rec.location_text}'")
+        dist = calculate_distance(rec.zip)
         if dist is not None:
-            log("STEP 5", "INFO", f"Coordinates {zip_code}: Looked up. Distance to Marburg ({MARBURG_ZIP}): {dist} km.")
+            rec.distance_km = dist
+            log("STEP 5", "INFO", f"Coordinates {rec.zip}: Looked up. Distance to Marburg ({MARBURG_ZIP}): {dist} km.")
             if dist < 100:
                 log("STEP 5", "SUCCESS", "Status: In Range (Green Zone).")
-                report['logistics_zone'] = 'GREEN'
+                rec.logistics_zone = 'GREEN'
             else:
                 log("STEP 5", "WARNING", "Status: Out of Range (Yellow Zone).")
-                report['logistics_zone'] = 'YELLOW'
+                rec.logistics_zone = 'YELLOW'
         else:
-             log("STEP 5", "WARNING", f"ZIP {zip_code} not in mock DB. Cannot calc distance.")
+            log("STEP 5", "WARNING", f"ZIP {rec.zip} not in PLZ table. Cannot calc distance.")
     else:
         log("STEP 5", "ERROR", "ZIP code not found.")
 
-    # 6. Seller Trust
-    seller_el = soup.select_one('#viewad-contact')
-    if seller_el:
-        since_match = re.search(r'Aktiv\s*seit\s*(\d{2}\.\d{2}\.\d{4})', seller_el.get_text())
-        since = since_match.group(1) if since_match else "Unknown"
-        
-        rating_el = seller_el.select_one('.userbadge')
-        rating = rating_el.get_text(strip=True) if rating_el else "Unknown"
-        
-        log("STEP 6", "DEBUG", f"Seller: Active since {since}, Rating: {rating}")
-        
-        # Trust Score Calc
-        score = 0
-        if since != "Unknown":
-            year = int(since.split('.')[2])
-            age = 2026 - year
-            score += age * 2 # 2 points per year
-        
-        if "Zufrieden" in rating or "TOP" in rating:
-            score += 5
-            
-        log("STEP 6", "INFO", f"Trust Score Calculated: {score}/10")
-        report['seller_trust_score'] = score
-        report['seller_since'] = since
-
-    return report
+def analyze_page_bytes(raw):
+    # Process pool worker (html_pool.py --func hunter_test_agent:analyze_page_bytes): raw page bytes in,
+    # compact report out. No trace output; the flag is restored because HtmlPool runs in-process for 1 worker
+    global LOG_ENABLED
+    from html_pool import decode_html
+    enabled, LOG_ENABLED = LOG_ENABLED, False
+    try:
+        return analyze_hunter_logic(decode_html(raw))
+    finally:
+        LOG_ENABLED = enabled
+
+_deal_scorer = None
+
+def deal_percentile(rec):
+    # Market percentile of the price within the ad's category (price_sketch.py); None without sketches
+    global _deal_scorer
+    if _deal_scorer is None:
+        from price_sketch import SKETCH_FILE, DealScorer
+        _deal_scorer = DealScorer(SKETCH_FILE if os.path.exists(SKETCH_FILE) else None)
+    from price_sketch import market_category
+    # rec.category is the site's tracking category; sketches are keyed by the Groq categories
+    deal = _deal_scorer.score(None, None, market_category(rec.category), rec.price)
+    return deal['percentile'] if deal else None
+
+COVERAGE_FIELDS = {
+    'title': lambda rec: rec.title not in (None, '', 'N/A'),
+    'price': lambda rec: bool(rec.price),
+    'size': lambda rec: rec.size is not None,
+    'year': lambda rec: rec.year is not None,
+    'zip': lambda rec: rec.zip is not None,
+    'seller': lambda rec: rec.seller_found,
+}
+
+def load_snapshots(directory):
+    # A pack archive written with --archive-html: latest version of every URL, streamed in order
+    from html_archive import PACK_NAME, HtmlArchive
+    if os.path.exists(os.path.join(directory, PACK_NAME)):
+        latest = {}
+        for snapshot in HtmlArchive(directory, auto_train_after=None):
+            latest[snapshot.url] = snapshot.body.decode('utf-8', errors='replace')
+        return sorted(latest.items())
+    names = sorted(n for n in os.listdir(directory) if n.endswith(('.html', '.htm')))
+    pages = []
+    for name in names:
+        with open(os.path.join(directory, name), 'r', encoding='utf-8', errors='replace') as f:
+            pages.append((name, f.read()))
+    return pages
+
+def diff_golden(golden, reports):
+    # {page: {field: [golden, current]}} plus pages present on only one side
+    changed = {}
+    for name, report in reports.items():
+        expected = golden.get(name)
+        if expected is None:
+            continue
+        fields = {key: [expected.get(key), report.get(key)] for key in sorted(set(expected) | set(report))
+                  if expected.get(key) != report.get(key)}
+        if fields:
+            changed[name] = fields
+    return {
+        'changed_pages': len(changed),
+        'new_pages': sorted(set(reports) - set(golden)),
+        'missing_pages': sorted(set(golden) - set(reports)),
+        'changes': changed,
+    }
+
+def run_offline(directory, golden_path=None, update_golden=False):
+    # Offline batch over saved pages: per-step timing, field coverage, pages/sec, golden diff
+    global LOG_ENABLED
+    LOG_ENABLED = False
+    start = time.perf_counter()
+    pages = load_snapshots(directory)
+    read_s = time.perf_counter() - start
+    if not pages:
+        raise SystemExit(f"No .html files in {directory}")
+
+    extractor = get_extractor()
+    steps = {'read': read_s, 'extract': 0.0, 'locate': 0.0, 'report': 0.0}
+    coverage = dict.fromkeys(COVERAGE_FIELDS, 0)
+    reports = {}
+    for name, html in pages:
+        t0 = time.perf_counter()
+        rec = extractor.extract(html)
+        t1 = time.perf_counter()
+        locate(rec)
+        t2 = time.perf_counter()
+        reports[name] = rec.to_report()
+        steps['extract'] += t1 - t0
+        steps['locate'] += t2 - t1
+        steps['report'] += time.perf_counter() - t2
+        for field, present in COVERAGE_FIELDS.items():
+            coverage[field] += present(rec)
+    elapsed = time.perf_counter() - start
+
+    total = len(pages)
+    result = {
+        'pages': total,
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(total / elapsed, 1),
+        'step_ms_per_page': {step: round(seconds * 1000 / total, 3) for step, seconds in steps.items()},
+        'extract_step_ms_per_page': {step: round(seconds * 1000 / total, 3)
+                                     for step, seconds in extractor.step_seconds.items()},
+        'coverage': {field: round(count / total, 3) for field, count in coverage.items()},
+        'fast_path': extractor.stats.summary(),
+    }
+    if golden_path and os.path.exists(golden_path) and not update_golden:
+        with open(golden_path, 'r', encoding='utf-8') as f:
+            result['golden'] = diff_golden(json.load(f), reports)
+    elif golden_path:
+        with open(golden_path, 'w', encoding='utf-8') as f:
+            json.dump(reports, f, indent=1, ensure_ascii=False, sort_keys=True)
+        result['golden'] = {'written': golden_path, 'pages': total}
+    return result
+
+def report_sellers(cache, sellers, fetch_many, refresh, scheduler=None):
+    # Seller profile pages are fetched once per seller and TTL, then scored for all their listings
+    if refresh:
+        seller_ids = [seller_id for seller_id in sellers.values() if seller_id]
+        limit = None
+        if scheduler is not None:
+            # In a revisit run profile fetches are charged to the same hourly budget as listings
+            limit = scheduler.take_tokens(len(cache.stale_ids(seller_ids)))
+        refreshed = cache.refresh(seller_ids, fetch_many, limit)
+        log("STEP 6", "INFO", f"Refreshed {len(refreshed)} seller profiles.")
+    print("\n=== SELLER TRUST (per seller) ===")
+    print(json.dumps(cache.score_listings(sellers), indent=2, ensure_ascii=False))
+    cache.save()
+    log("STEP 6", "INFO", f"Seller cache: {json.dumps(cache.summary())}")
 
 def main():
+    parser = argparse.ArgumentParser(description='Hunter diagnostic probe')
+    parser.add_argument('urls', nargs='*', default=[TARGET_URL], help='Listing URLs to probe')
+    parser.add_argument('--fetch', choices=['tunnel', 'batch', 'exec'], default='tunnel',
+                        help='tunnel: pooled session over SSH direct-tcpip; batch: whole URL list fetched '
+                             'server-side in one channel, compressed stream; exec: one remote curl per URL')
+    parser.add_argument('--urls-file', help='File with one listing URL per line')
+    parser.add_argument('--compare', action='store_true', help='Fetch URLs with every path and compare throughput')
+    parser.add_argument('--seller-cache', help='Seller trust cache file (default: seller_cache.json, TTL SELLER_CACHE_TTL_HOURS)')
+    parser.add_argument('--no-seller-cache', action='store_true', help='Score every seller from the ad page')
+    parser.add_argument('--refresh-sellers', action='store_true',
+                        help='Fetch profile pages of sellers not refreshed within the TTL')
+    parser.add_argument('--track', action='store_true', help='Add the probed URLs to the revisit queue')
+    parser.add_argument('--revisit', action='store_true',
+                        help='Probe the batch of tracked listings that is due (instead of the given URLs)')
+    parser.add_argument('--revisit-file', help='Revisit queue file (default: revisit_queue.json)')
+    parser.add_argument('--budget-per-hour', type=float, help='Revisit fetch budget (default: REVISIT_BUDGET_PER_HOUR or 120)')
+    parser.add_argument('--offline', metavar='DIR',
+                        help='No SSH: run the extraction over saved .html pages and report timing and coverage')
+    parser.add_argument('--golden', help='With --offline: diff reports against this JSON (written if it does not exist)')
+    parser.add_argument('--update-golden', action='store_true', help='With --offline: overwrite the golden file')
+    parser.add_argument('--archive-html', metavar='DIR', default=os.getenv('HTML_ARCHIVE_DIR'),
+                        help='Append every fetched page to this pack archive (html_archive.py); --offline reads it back')
+    args = parser.parse_args()
+
+    if args.offline:
+        result = run_offline(args.offline, args.golden, args.update_golden)
+        print(json.dumps(result, indent=2, ensure_ascii=False))
+        # Non-zero exit on any regression against the golden output
+        golden = result.get('golden', {})
+        sys.exit(1 if golden.get('changed_pages') or golden.get('missing_pages') else 0)
+    if args.urls_file:
+        with open(args.urls_file, 'r', encoding='utf-8') as f:
+            args.urls = [line.strip() for line in f if line.strip()]
+
+    scheduler = None
+    if args.track or args.revisit:
+        from revisit_scheduler import FETCH_BUDGET_PER_HOUR, REVISIT_FILE, RevisitScheduler
+        scheduler = RevisitScheduler(args.revisit_file or REVISIT_FILE, args.budget_per_hour or FETCH_BUDGET_PER_HOUR)
+        if args.track:
+            for url in args.urls:
+                scheduler.add(url)
+        if args.revisit:
+            args.urls = scheduler.due_batch()
+            log("SETUP", "INFO", f"Revisit batch: {len(args.urls)} due listings.")
+            if not args.urls:
+                scheduler.save()
+                log("SETUP", "INFO", f"Revisit queue: {json.dumps(scheduler.summary())}")
+                return
+
+    if args.archive_html:
+        global _html_archive
+        from html_archive import HtmlArchive
+        _html_archive = HtmlArchive(args.archive_html)
+
     print("=== STARTING HUNTER DIAGNOSTIC PROBE ===")
+    # Host, user and password file are shared with the remote_* scripts (scripts/ssh_session.py)
+    from ssh_session import HOST, USER, read_password
     pwd = read_password()
     client = ssh_connect(HOST, USER, pwd)
-    
-    html = fetch_html_remote(client, TARGET_URL)
-    if not html:
-        print("CRITICAL: Failed to get HTML.")
+
+    if args.compare:
+        print("\n=== FETCH PATH COMPARISON ===")
+        print(json.dumps(compare_fetch_paths(client, args.urls), indent=2))
         client.close()
         return
 
-    final_data = analyze_hunter_logic(html)
-    
-    print("\n=== FINAL JSON OUTPUT ===")
-    print(json.dumps(final_data, indent=2, ensure_ascii=False))
-    
+    seller_cache = None
+    if not args.no_seller_cache:
+        from seller_cache import SELLER_CACHE_FILE, SellerCache
+        seller_cache = SellerCache(args.seller_cache or SELLER_CACHE_FILE)
+    get_extractor(seller_cache)
+    sellers = {}
+    reported = set()
+
+    def report(url, html):
+        rec = analyze_listing(html)
+        reported.add(url)
+        sellers[url] = rec.seller_id
+        if scheduler is not None:
+            scheduler.add(url)
+            if scheduler.observe(url, rec, deal_percentile(rec)):
+                log("STEP 7", "ACTION", f"Listing changed since the last visit: {url}")
+        print(f"\n=== FINAL JSON OUTPUT ({url}) ===")
+        print(json.dumps(rec.to_report(), indent=2, ensure_ascii=False))
+
+    fetcher = None
+    if args.fetch == 'batch':
+        fetch_html_batch(client, args.urls, report)
+
+        def fetch_many(urls):
+            pages = {}
+            fetch_html_batch(client, urls, pages.__setitem__)
+            return pages
+    else:
+        if args.fetch == 'tunnel':
+            from remote_fetch import RemoteFetcher
+            fetcher = RemoteFetcher(client)
+
+        def fetch_one(url):
+            return fetch_html_tunnel(fetcher, url) if fetcher else fetch_html_remote(client, url)
+
+        for url in args.urls:
+            html = fetch_one(url)
+            if not html:
+                print(f"CRITICAL: Failed to get HTML for {url}.")
+                continue
+            report(url, html)
+
+        def fetch_many(urls):
+            if fetcher:
+                return {url: fetch_one(url) for url in urls}
+            # exec: one channel per URL, run concurrently on the shared transport
+            from concurrent.futures import ThreadPoolExecutor
+            from ssh_session import MAX_CHANNELS
+            with ThreadPoolExecutor(max_workers=MAX_CHANNELS) as executor:
+                return dict(zip(urls, executor.map(fetch_one, urls)))
+
+    if seller_cache is not None:
+        report_sellers(seller_cache, sellers, fetch_many, args.refresh_sellers, scheduler if args.revisit else None)
+    if scheduler is not None:
+        for url in args.urls:
+            if url not in reported:
+                scheduler.failed(url)
+        scheduler.save()
+        log("STEP 7", "INFO", f"Revisit queue: {json.dumps(scheduler.summary())}")
+    if fetcher:
+        log("STEP 2", "INFO", f"Tunnel reuse: {json.dumps(fetcher.reuse_stats())}")
+        fetcher.close()
     client.close()
+    log("STEP 3", "INFO", f"Fast path: {json.dumps(get_extractor().stats.summary())}")
     print("\n=== PROBE COMPLETE ===")
 
 if __name__ == '__main__':
@@ -0,0 +1,393 @@
+import os
+import sys
+import json
+import hashlib
+import time
+import signal
+import socket
+import sqlite3
+import argparse
+import threading
+import multiprocessing
+
+# Durable local job queue for parallel hunt workers (SQLite, no external service).
+#
+# Workers claim jobs under a lease (status 'leased', lease_until) inside BEGIN IMMEDIATE,
+# so two processes never get the same job. A background heartbeat extends the lease
+# while the handler runs; if the worker dies, the lease runs out and the next claim
+# takes the job again (attempts + 1, up to max_attempts). Failed jobs are retried with
+# exponential backoff. The database runs in WAL mode so stats readers never block workers.
+# dedupe_key only guards active jobs: it is cleared when a job ends (done or failed), so
+# the same URL can be enqueued again once its previous job has finished.
+#
+# Built-in pipeline: fetch (URL -> spooled HTML) -> parse (hunter_extractor) -> score
+# (price_sketch market percentile). Each stage enqueues the next one.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+QUEUE_DB = os.getenv('JOB_QUEUE_DB', os.path.join(SCRIPT_DIR, 'hunt_queue.db'))
+SPOOL_DIR = os.getenv('JOB_SPOOL_DIR', os.path.join(SCRIPT_DIR, 'hunt_spool'))
+DEFAULT_LEASE_S = 60.0
+DEFAULT_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_S = 10.0
+POLL_S = 0.5
+IDLE_EXIT_S = 30.0          # `work` returns (and prints stats) once the queue stays empty this long
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',      -- queued | leased | done | failed
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    dedupe_key TEXT UNIQUE,                     -- NULL once the job is done or failed
+    worker TEXT,
+    available_at REAL NOT NULL,
+    lease_until REAL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_claim ON jobs (status, priority DESC, available_at, id);
+CREATE INDEX IF NOT EXISTS jobs_finished ON jobs (finished_at);
+'''
+
+
+class LeaseLost(Exception):
+    pass
+
+
+class JobQueue:
+    def __init__(self, path=QUEUE_DB):
+        self.path = path
+        self._local = threading.local()
+        self.conn.executescript(SCHEMA)
+
+    @property
+    def conn(self):
+        # One connection per thread (the heartbeat thread has its own)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _transaction(self):
+        conn = self.conn
+        conn.execute('BEGIN IMMEDIATE')  # write lock up front: claims never interleave
+        return conn
+
+    def enqueue(self, kind, payload, priority=0, dedupe_key=None, delay_s=0.0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        return self.enqueue_many(kind, [payload], priority, [dedupe_key], delay_s, max_attempts)[0]
+
+    def enqueue_many(self, kind, payloads, priority=0, dedupe_keys=None, delay_s=0.0, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        # Returns new job ids; None where a queued or leased job already has the dedupe_key
+        now = time.time()
+        dedupe_keys = dedupe_keys or [None] * len(payloads)
+        ids = []
+        conn = self._transaction()
+        try:
+            for payload, key in zip(payloads, dedupe_keys):
+                cursor = conn.execute(
+                    'INSERT OR IGNORE INTO jobs (kind, payload, priority, dedupe_key, max_attempts, available_at, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (kind, json.dumps(payload, ensure_ascii=False), priority, key, max_attempts, now + delay_s, now))
+                ids.append(cursor.lastrowid if cursor.rowcount else None)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return ids
+
+    def claim(self, worker, kinds=None, limit=1, lease_s=DEFAULT_LEASE_S):
+        # Queued jobs that are due, plus leased jobs whose worker stopped heartbeating
+        now = time.time()
+        kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})" if kinds else ''
+        conn = self._transaction()
+        try:
+            # Expired leases that used up their attempts are failed instead of handed out again
+            conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = 'lease expired', dedupe_key = NULL "
+                         "WHERE status = 'leased' AND lease_until < ? AND attempts >= max_attempts", (now, now))
+            rows = conn.execute(
+                "SELECT id FROM jobs WHERE ((status = 'queued' AND available_at <= ?) "
+                f"OR (status = 'leased' AND lease_until < ?)){kind_filter} "
+                'ORDER BY priority DESC, available_at, id LIMIT ?',
+                [now, now] + list(kinds or []) + [limit]).fetchall()
+            ids = [row['id'] for row in rows]
+            if ids:
+                marks = ','.join('?' * len(ids))
+                conn.execute(f"UPDATE jobs SET status = 'leased', worker = ?, lease_until = ?, started_at = ?, "
+                             f"attempts = attempts + 1 WHERE id IN ({marks})", [worker, now + lease_s, now] + ids)
+                rows = conn.execute(f'SELECT * FROM jobs WHERE id IN ({marks}) ORDER BY priority DESC, id', ids).fetchall()
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return [dict(row, payload=json.loads(row['payload'])) for row in rows] if ids else []
+
+    def heartbeat(self, job_ids, worker, lease_s=DEFAULT_LEASE_S):
+        # Extend leases still held by this worker; returns the ids it still owns
+        if not job_ids:
+            return []
+        marks = ','.join('?' * len(job_ids))
+        conn = self._transaction()
+        try:
+            conn.execute(f"UPDATE jobs SET lease_until = ? WHERE id IN ({marks}) AND worker = ? AND status = 'leased'",
+                         [time.time() + lease_s] + list(job_ids) + [worker])
+            owned = [row[0] for row in conn.execute(
+                f"SELECT id FROM jobs WHERE id IN ({marks}) AND worker = ? AND status = 'leased'", list(job_ids) + [worker])]
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return owned
+
+    def complete(self, job_id, worker, result=None):
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'done', finished_at = ?, result = ?, error = NULL, dedupe_key = NULL "
+            "WHERE id = ? AND worker = ? AND status = 'leased'",
+            (time.time(), json.dumps(result, ensure_ascii=False) if result is not None else None, job_id, worker))
+        if not cursor.rowcount:
+            raise LeaseLost(f'job {job_id} is no longer leased by {worker}')
+
+    def fail(self, job_id, worker, error, retry=True):
+        # Back to the queue with exponential backoff, or 'failed' once attempts are used up
+        now = time.time()
+        conn = self._transaction()
+        try:
+            row = conn.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ? AND worker = ? AND status = 'leased'",
+                               (job_id, worker)).fetchone()
+            if row is not None:
+                if retry and row['attempts'] < row['max_attempts']:
+                    conn.execute("UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, error = ?, "
+                                 "available_at = ? WHERE id = ?",
+                                 (error, now + RETRY_BACKOFF_S * 2 ** (row['attempts'] - 1), job_id))
+                else:
+                    conn.execute("UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, dedupe_key = NULL "
+                                 "WHERE id = ?", (now, error, job_id))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def recover(self):
+        # Explicitly requeue jobs of dead workers (claim() also picks them up on its own)
+        now = time.time()
+        cursor = self.conn.execute(
+            "UPDATE jobs SET status = 'queued', worker = NULL, lease_until = NULL, available_at = ? "
+            "WHERE status = 'leased' AND lease_until < ? AND attempts < max_attempts", (now, now))
+        return cursor.rowcount
+
+    def purge(self, older_than_s):
+        cursor = self.conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?",
+                                   (time.time() - older_than_s,))
+        return cursor.rowcount
+
+    def stats(self, window_s=60.0):
+        now = time.time()
+        conn = self.conn
+        depth = {}
+        for row in conn.execute('SELECT kind, status, COUNT(*) AS n FROM jobs GROUP BY kind, status'):
+            depth.setdefault(row['kind'], {})[row['status']] = row['n']
+        stale = conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'leased' AND lease_until < ?", (now,)).fetchone()[0]
+        oldest = conn.execute("SELECT MIN(available_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        recent = conn.execute(
+            "SELECT kind, COUNT(*) AS n, AVG(finished_at - started_at) AS run_s FROM jobs "
+            "WHERE status = 'done' AND finished_at >= ? GROUP BY kind", (now - window_s,)).fetchall()
+        workers = conn.execute("SELECT COUNT(DISTINCT worker) FROM jobs WHERE status = 'leased' AND lease_until >= ?",
+                               (now,)).fetchone()[0]
+        return {
+            'depth': depth,
+            'queued': sum(d.get('queued', 0) for d in depth.values()),
+            'leased': sum(d.get('leased', 0) for d in depth.values()),
+            'stale_leases': stale,
+            'active_workers': workers,
+            'oldest_queued_s': round(max(0.0, now - oldest), 1) if oldest else 0.0,
+            'window_s': window_s,
+            'throughput_per_min': {row['kind']: round(row['n'] * 60 / window_s, 2) for row in recent},
+            'avg_run_s': {row['kind']: round(row['run_s'] or 0.0, 3) for row in recent},
+        }
+
+
+class Heartbeat:
+    # Keeps a job's lease alive while its handler runs; .lost is set if the lease was taken away
+    def __init__(self, queue, job_id, worker, lease_s):
+        self.queue, self.job_id, self.worker, self.lease_s = queue, job_id, worker, lease_s
+        self.lost = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.lease_s / 3):
+            if self.job_id not in self.queue.heartbeat([self.job_id], self.worker, self.lease_s):
+                self.lost = True
+                return
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+# --- Hunt pipeline handlers: handler(payload, queue) -> result dict ---
+
+_session = None
+_extractor = None
+_scorer = None
+
+
+def handle_fetch(payload, queue):
+    global _session
+    if _session is None:
+        import requests
+        from remote_fetch import USER_AGENT
+        _session = requests.Session()
+        _session.headers['User-Agent'] = USER_AGENT
+    response = _session.get(payload['url'], timeout=20)
+    response.raise_for_status()
+    os.makedirs(SPOOL_DIR, exist_ok=True)
+    path = os.path.join(SPOOL_DIR, hashlib.sha1(payload['url'].encode()).hexdigest() + '.html')
+    with open(path, 'wb') as f:
+        f.write(response.content)
+    queue.enqueue('parse', {'url': payload['url'], 'path': path}, dedupe_key=f"parse:{payload['url']}")
+    return {'bytes': len(response.content), 'path': path}
+
+
+def handle_parse(payload, queue):
+    global _extractor
+    if _extractor is None:
+        from hunter_extractor import ListingExtractor
+        _extractor = ListingExtractor(distance=False)
+    with open(payload['path'], 'rb') as f:
+        record = _extractor.extract(f.read())
+    report = record.to_report()
+    queue.enqueue('score', {'url': payload['url'], 'price': record.price, 'category': record.category},
+                  dedupe_key=f"score:{payload['url']}")
+    return report
+
+
+def handle_score(payload, queue):
+    global _scorer
+    if _scorer is None:
+        sys.path.insert(0, os.path.join(SCRIPT_DIR, '..', '..', 'telegram-bot'))
+        from price_sketch import SKETCH_FILE, DealScorer
+        _scorer = DealScorer(SKETCH_FILE if os.path.exists(SKETCH_FILE) else None)
+    from price_sketch import market_category
+    # The parsed category is the site's tracking category; sketches are keyed by the Groq categories
+    category = market_category(payload.get('category'))
+    return {'url': payload['url'], 'deal': _scorer.score(None, None, category, payload.get('price'))}
+
+
+HANDLERS = {'fetch': handle_fetch, 'parse': handle_parse, 'score': handle_score}
+
+
+def run_worker(db_path, kinds=None, lease_s=DEFAULT_LEASE_S, idle_exit_s=None, max_jobs=None, handlers=None):
+    handlers = handlers or HANDLERS
+    queue = JobQueue(db_path)
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    done = failed = 0
+    # Ctrl+C: finish the current job, then return the counters instead of dying mid-job
+    stop = threading.Event()
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+    idle_since = time.monotonic()
+    while not stop.is_set() and (max_jobs is None or done + failed < max_jobs):
+        jobs = queue.claim(worker, kinds, 1, lease_s)
+        if not jobs:
+            if idle_exit_s is not None and time.monotonic() - idle_since >= idle_exit_s:
+                break
+            time.sleep(POLL_S)
+            continue
+        job = jobs[0]
+        with Heartbeat(queue, job['id'], worker, lease_s) as beat:
+            try:
+                result = handlers[job['kind']](job['payload'], queue)
+            except Exception as e:
+                if not beat.lost:
+                    queue.fail(job['id'], worker, f'{type(e).__name__}: {e}'[:500])
+                failed += 1
+            else:
+                try:
+                    queue.complete(job['id'], worker, result)
+                    done += 1
+                except LeaseLost:
+                    failed += 1  # someone else took it over after our lease ran out
+        idle_since = time.monotonic()
+    return {'worker': worker, 'done': done, 'failed': failed, 'interrupted': stop.is_set()}
+
+
+def _worker_entry(args):
+    return run_worker(*args)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='SQLite job queue for hunt workers')
+    parser.add_argument('--db', default=QUEUE_DB)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    enqueue_parser = commands.add_parser('enqueue', help='Add fetch jobs (or any kind with --kind/--payload)')
+    enqueue_parser.add_argument('urls', nargs='*')
+    enqueue_parser.add_argument('--urls-file')
+    enqueue_parser.add_argument('--kind', default='fetch')
+    enqueue_parser.add_argument('--payload', help='JSON payload for a single job')
+    enqueue_parser.add_argument('--priority', type=int, default=0)
+
+    work_parser = commands.add_parser('work', help='Run worker processes')
+    work_parser.add_argument('--workers', type=int, default=4)
+    work_parser.add_argument('--kinds', help='Comma-separated job kinds (default: all)')
+    work_parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_S)
+    work_parser.add_argument('--idle-exit', type=float, default=IDLE_EXIT_S,
+                             help='Stop after the queue was empty for N seconds (0: keep polling until Ctrl+C)')
+
+    commands.add_parser('stats', help='Queue depth and throughput')
+    commands.add_parser('recover', help='Requeue jobs whose lease expired')
+    purge_parser = commands.add_parser('purge', help='Delete finished jobs')
+    purge_parser.add_argument('--older-than-hours', type=float, default=24)
+    args = parser.parse_args()
+
+    queue = JobQueue(args.db)
+    if args.command == 'enqueue':
+        if args.payload:
+            print(queue.enqueue(args.kind, json.loads(args.payload), args.priority))
+            return
+        urls = list(args.urls)
+        if args.urls_file:
+            with open(args.urls_file, 'r', encoding='utf-8') as f:
+                urls.extend(line.strip() for line in f if line.strip())
+        ids = queue.enqueue_many('fetch', [{'url': url} for url in urls], args.priority, [f'fetch:{url}' for url in urls])
+        print(f"Enqueued {sum(1 for i in ids if i)} of {len(urls)} (rest already queued or running)")
+    elif args.command == 'work':
+        kinds = [kind.strip() for kind in args.kinds.split(',')] if args.kinds else None
+        idle_exit = args.idle_exit or None
+        start = time.perf_counter()
+        # Ctrl+C reaches every worker, which stops after its current job; the parent waits and reports
+        previous = signal.signal(signal.SIGINT, signal.SIG_IGN)
+        try:
+            with multiprocessing.Pool(args.workers) as pool:
+                results = pool.map(_worker_entry, [(args.db, kinds, args.lease, idle_exit)] * args.workers)
+        finally:
+            signal.signal(signal.SIGINT, previous)
+        elapsed = time.perf_counter() - start
+        done = sum(r['done'] for r in results)
+        print(json.dumps({'workers': results, 'seconds': round(elapsed, 3),
+                          'jobs_per_sec': round(done / elapsed, 2) if elapsed else 0.0,
+                          'queue': queue.stats()}, indent=2))
+    elif args.command == 'recover':
+        print(f"Requeued {queue.recover()} jobs")
+    elif args.command == 'purge':
+        print(f"Deleted {queue.purge(args.older_than_hours * 3600)} jobs")
+    else:
+        print(json.dumps(queue.stats(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,277 @@
+import os
+import sys
+import json
+import time
+import math
+import zipfile
+import argparse
+import tempfile
+import urllib.request
+
+import numpy as np
+
+# German PLZ -> centroid geodata for logistics zoning.
+#
+# The table is a single structured .npy (plz uint32, lat/lon float32, sorted by plz,
+# ~12 bytes per PLZ) opened with mmap_mode='r', so loading is O(1) and only the pages
+# touched by a lookup are read. Build it from the GeoNames postal code dump
+# (https://download.geonames.org/export/zip/DE.zip, CC BY 4.0):
+#
+#   python plz_geo.py --build DE.txt
+#   python plz_geo.py --fetch          (download DE.zip and build in one step)
+#
+# GeoNames lists one row per (PLZ, place); the centroid is the mean of those rows.
+# The table is only ever built by one of the commands above: library lookups never touch
+# the network. Without it default_table() reports the missing table once and only the
+# two fallback entries resolve.
+
+TABLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'plz_centroids.npy')
+GEONAMES_URL = 'https://download.geonames.org/export/zip/DE.zip'
+TABLE_DTYPE = np.dtype([('plz', '<u4'), ('lat', '<f4'), ('lon', '<f4')])
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEG_LAT = 111.195
+
+# Used only when the table has not been built yet (same entries the probe always had)
+FALLBACK_CENTROIDS = {
+    '35789': (50.4167, 8.3833),  # Weilmünster
+    '35037': (50.8022, 8.7667),  # Marburg
+}
+
+
+def build_table(geonames_path, out_path=TABLE_FILE):
+    # GeoNames format: country \t postal code \t place \t ... \t lat (col 9) \t lon (col 10) \t accuracy
+    sums = {}
+    with open(geonames_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            cols = line.rstrip('\n').split('\t')
+            if len(cols) < 11 or cols[0] != 'DE' or not cols[1].isdigit():
+                continue
+            lat, lon = float(cols[9]), float(cols[10])
+            acc = sums.setdefault(int(cols[1]), [0.0, 0.0, 0])
+            acc[0] += lat
+            acc[1] += lon
+            acc[2] += 1
+
+    table = np.empty(len(sums), dtype=TABLE_DTYPE)
+    for i, plz in enumerate(sorted(sums)):
+        lat_sum, lon_sum, count = sums[plz]
+        table[i] = (plz, lat_sum / count, lon_sum / count)
+    tmp_path = f'{out_path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, table)
+    os.replace(tmp_path, out_path)
+    return len(table)
+
+
+def fetch_table(out_path=TABLE_FILE, url=GEONAMES_URL, timeout=60):
+    # Download the GeoNames dump, extract DE.txt and build the table from it
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        archive = os.path.join(tmp_dir, 'DE.zip')
+        with urllib.request.urlopen(url, timeout=timeout) as response, open(archive, 'wb') as f:
+            f.write(response.read())
+        with zipfile.ZipFile(archive) as z:
+            geonames_path = z.extract('DE.txt', tmp_dir)
+        return build_table(geonames_path, out_path)
+
+
+class PlzTable:
+    def __init__(self, path=TABLE_FILE):
+        if os.path.exists(path):
+            table = np.load(path, mmap_mode='r')
+            self.source = path
+        else:
+            table = np.array(
+                sorted((int(plz), lat, lon) for plz, (lat, lon) in FALLBACK_CENTROIDS.items()),
+                dtype=TABLE_DTYPE,
+            )
+            self.source = 'fallback'
+        self.plz = table['plz']
+        self.lat = table['lat']
+        self.lon = table['lon']
+
+    def __len__(self):
+        return len(self.plz)
+
+    def lookup(self, zip_codes):
+        # Vectorised PLZ -> (lat, lon, found) for a list/array of 5-digit codes
+        codes = np.asarray(zip_codes)
+        if codes.dtype.kind not in 'iu':
+            text = codes.astype(str)
+            valid = np.char.isdigit(text)
+            codes = np.zeros(len(text), dtype=np.uint32)
+            codes[valid] = text[valid].astype(np.uint32)
+        codes = codes.astype(np.uint32)
+        pos = np.searchsorted(self.plz, codes)
+        pos = np.minimum(pos, len(self.plz) - 1)
+        found = self.plz[pos] == codes
+        lat = np.where(found, self.lat[pos], np.nan).astype(np.float64)
+        lon = np.where(found, self.lon[pos], np.nan).astype(np.float64)
+        return lat, lon, found
+
+    def coords(self, zip_code):
+        lat, lon, found = self.lookup([zip_code])
+        return (float(lat[0]), float(lon[0])) if found[0] else None
+
+
+_default_table = None
+
+def default_table():
+    # Process-wide table, mapped on first use; never downloads anything
+    global _default_table
+    if _default_table is None:
+        _default_table = PlzTable()
+        if _default_table.source == 'fallback':
+            print(f"ERROR: PLZ table {TABLE_FILE} is missing, only {len(_default_table)} fallback PLZs resolve. "
+                  f"Build it with: python plz_geo.py --fetch (or --build DE.txt)", file=sys.stderr)
+    return _default_table
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    # Broadcasting haversine: scalars, arrays or (N,1) x (1,M) for distance matrices
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def distances_to_hub(table, zip_codes, hub_zip):
+    # km from every listing PLZ to the hub; NaN where a PLZ is unknown
+    hub = table.coords(hub_zip)
+    lat, lon, _ = table.lookup(zip_codes)
+    if hub is None:
+        return np.full(len(lat), np.nan)
+    return haversine_km(lat, lon, hub[0], hub[1])
+
+
+class GridIndex:
+    # Uniform lat/lon grid over listing points; cells are ~cell_km on a side.
+    # Answers "all points within R km of (lat, lon)" by scanning only the covering cells.
+    def __init__(self, lat, lon, cell_km=25.0):
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        valid = ~(np.isnan(self.lat) | np.isnan(self.lon))
+        ref_lat = np.nanmax(np.abs(self.lat)) if valid.any() else 0.0
+        self.dlat = cell_km / KM_PER_DEG_LAT
+        self.dlon = cell_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(ref_lat)), 0.1))
+
+        ids = np.nonzero(valid)[0]
+        keys = self._keys(self.lat[ids], self.lon[ids])
+        order = np.argsort(keys, kind='stable')
+        self.ids = ids[order]
+        self.keys = keys[order]
+
+    def _keys(self, lat, lon):
+        row = np.floor(lat / self.dlat).astype(np.int64)
+        col = np.floor(lon / self.dlon).astype(np.int64)
+        return (row << 32) + (col & 0xFFFFFFFF)
+
+    def query(self, lat, lon, radius_km):
+        rows = np.arange(math.floor((lat - radius_km / KM_PER_DEG_LAT) / self.dlat),
+                         math.floor((lat + radius_km / KM_PER_DEG_LAT) / self.dlat) + 1)
+        lon_span = radius_km / (KM_PER_DEG_LAT * max(math.cos(math.radians(abs(lat) + radius_km / KM_PER_DEG_LAT)), 0.1))
+        cols = np.arange(math.floor((lon - lon_span) / self.dlon), math.floor((lon + lon_span) / self.dlon) + 1)
+        cell_keys = ((rows[:, None] << 32) + (cols[None, :] & 0xFFFFFFFF)).ravel()
+
+        left = np.searchsorted(self.keys, cell_keys, side='left')
+        right = np.searchsorted(self.keys, cell_keys, side='right')
+        parts = [self.ids[l:r] for l, r in zip(left, right) if r > l]
+        if not parts:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        candidates = np.concatenate(parts)
+        dist = haversine_km(self.lat[candidates], self.lon[candidates], lat, lon)
+        keep = dist <= radius_km
+        return candidates[keep], dist[keep]
+
+    def within(self, table, hubs, radius_km):
+        # {hub PLZ: (listing positions, km)} for several hubs at once
+        result = {}
+        for hub in hubs:
+            coords = table.coords(hub)
+            result[hub] = self.query(coords[0], coords[1], radius_km) if coords else (np.empty(0, dtype=np.int64), np.empty(0))
+        return result
+
+
+def run_benchmark(table, listings, hub_zip, radius_km):
+    rng = np.random.default_rng(7)
+    zips = table.plz[rng.integers(0, len(table), size=listings)].astype(str)
+
+    start = time.perf_counter()
+    hub = table.coords(hub_zip)
+    scalar = []
+    for z in zips:
+        c = table.coords(z)
+        lat1, lon1 = math.radians(c[0]), math.radians(c[1])
+        lat2, lon2 = math.radians(hub[0]), math.radians(hub[1])
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        scalar.append(2 * EARTH_RADIUS_KM * math.atan2(math.sqrt(a), math.sqrt(1 - a)))
+    scalar_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    vector = distances_to_hub(table, zips, hub_zip)
+    vector_s = time.perf_counter() - start
+
+    lat, lon, _ = table.lookup(zips)
+    start = time.perf_counter()
+    index = GridIndex(lat, lon)
+    build_s = time.perf_counter() - start
+    start = time.perf_counter()
+    hits, _ = index.query(hub[0], hub[1], radius_km)
+    query_s = time.perf_counter() - start
+
+    return {
+        'table': table.source,
+        'listings': listings,
+        'scalar_ms': round(scalar_s * 1000, 1),
+        'vectorized_ms': round(vector_s * 1000, 1),
+        'max_abs_diff_km': round(float(np.nanmax(np.abs(vector - np.array(scalar)))), 6),
+        'grid_build_ms': round(build_s * 1000, 1),
+        'grid_query_ms': round(query_s * 1000, 3),
+        'within_radius': int(len(hits)),
+        'within_radius_bruteforce': int(np.sum(vector <= radius_km)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='German PLZ centroid table')
+    parser.add_argument('--build', metavar='DE_TXT', help='Build the table from the GeoNames DE.txt dump')
+    parser.add_argument('--fetch', action='store_true', help=f'Download {GEONAMES_URL} and build the table')
+    parser.add_argument('--table', default=TABLE_FILE)
+    parser.add_argument('--near', action='append', metavar='HUB_PLZ', help='Hub PLZ (repeatable)')
+    parser.add_argument('--radius', type=float, default=100.0, help='Radius in km')
+    parser.add_argument('--zips-file', help='Listing PLZs, one per line (for --near)')
+    parser.add_argument('--bench', type=int, metavar='N', help='Benchmark scalar vs vectorised distance for N listings')
+    parser.add_argument('--hub', default='35037', help='Hub PLZ for --bench')
+    args = parser.parse_args()
+
+    if args.build:
+        count = build_table(args.build, args.table)
+        print(f"Wrote {count} PLZ centroids to {args.table}")
+        return
+    if args.fetch:
+        count = fetch_table(args.table)
+        print(f"Wrote {count} PLZ centroids to {args.table}")
+        return
+
+    table = PlzTable(args.table)
+    if table.source == 'fallback':
+        print(f"WARNING: {args.table} not built, using {len(table)} fallback entries", file=sys.stderr)
+
+    if args.bench:
+        print(json.dumps(run_benchmark(table, args.bench, args.hub, args.radius), indent=2))
+        return
+
+    if args.near and args.zips_file:
+        with open(args.zips_file, 'r', encoding='utf-8') as f:
+            zips = [line.strip() for line in f if line.strip()]
+        lat, lon, _ = table.lookup(zips)
+        index = GridIndex(lat, lon)
+        output = {}
+        for hub, (ids, dist) in index.within(table, args.near, args.radius).items():
+            output[hub] = sorted(({'plz': zips[i], 'km': round(float(d), 1)} for i, d in zip(ids, dist)), key=lambda r: r['km'])
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+        return
+
+    parser.print_help()
+
+
+if __name__ == '__main__':
+    main()
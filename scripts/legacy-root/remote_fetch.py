@@ -0,0 +1,253 @@
+import base64
+import select
+import shlex
+import socketserver
+import struct
+import threading
+import time
+import zlib
+
+# Persistent fetch path over an existing paramiko transport.
+#
+# A local HTTP CONNECT proxy turns every CONNECT into a 'direct-tcpip' channel on
+# the SSH transport, so TCP/TLS egress happens from the remote server's IP. A
+# pooled requests.Session keeps the TLS connection (and thus the channel) alive
+# across requests, instead of one `curl` process + fresh TLS handshake per URL.
+
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+BUFFER_SIZE = 64 * 1024
+REMOTE_PYTHON = 'python3'
+
+# Batch mode: the URL list is written once to a single exec channel. The server
+# fetches in parallel (stdlib only, nothing to install there) and streams back one
+# zlib stream of frames: >IHI header (url index, HTTP status, body length) + body.
+# Each frame ends with Z_SYNC_FLUSH, so records decode as soon as they arrive while
+# later pages still compress against the boilerplate of earlier ones.
+FRAME_HEADER = struct.Struct('>IHI')
+BATCH_FETCH_SCRIPT = r'''
+import sys, zlib, struct, urllib.request, urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+ua, workers, timeout = sys.argv[1], int(sys.argv[2]), float(sys.argv[3])
+urls = [line.strip() for line in sys.stdin.read().splitlines() if line.strip()]
+def get(i, url):
+    req = urllib.request.Request(url, headers={'User-Agent': ua, 'Accept-Language': 'de-DE,de;q=0.9'})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as r:
+            return i, r.status, r.read()
+    except urllib.error.HTTPError as e:
+        return i, e.code, e.read()
+    except Exception as e:
+        return i, 0, repr(e).encode()
+out = sys.stdout.buffer
+z = zlib.compressobj(6)
+with ThreadPoolExecutor(workers) as ex:
+    for f in as_completed([ex.submit(get, i, u) for i, u in enumerate(urls)]):
+        i, status, body = f.result()
+        out.write(z.compress(struct.pack('>IHI', i, status, len(body)) + body) + z.flush(zlib.Z_SYNC_FLUSH))
+        out.flush()
+out.write(z.flush())
+out.flush()
+'''
+
+
+class _ConnectHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        proxy = self.server.tunnel
+        sock = self.request
+        header = b''
+        while b'\r\n\r\n' not in header:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return
+            header += chunk
+            if len(header) > 16384:
+                return
+
+        request_line = header.split(b'\r\n', 1)[0].decode('latin-1')
+        parts = request_line.split()
+        if len(parts) < 2 or parts[0].upper() != 'CONNECT':
+            # Only https targets are tunnelled; plain http would need request rewriting
+            sock.sendall(b'HTTP/1.1 501 Not Implemented\r\nContent-Length: 0\r\n\r\n')
+            return
+
+        host, _, port = parts[1].rpartition(':')
+        try:
+            channel = proxy.transport.open_channel('direct-tcpip', (host, int(port or 443)), sock.getpeername())
+        except Exception as e:
+            proxy.count('channel_errors')
+            sock.sendall(f'HTTP/1.1 502 Bad Gateway\r\nContent-Length: 0\r\nX-Error: {e}\r\n\r\n'.encode('latin-1', 'replace'))
+            return
+
+        proxy.count('channels_opened')
+        sock.sendall(b'HTTP/1.1 200 Connection established\r\n\r\n')
+        try:
+            self._pump(sock, channel, proxy)
+        finally:
+            channel.close()
+
+    def _pump(self, sock, channel, proxy):
+        while True:
+            readable, _, _ = select.select([sock, channel], [], [], 60)
+            if not readable:
+                return
+            if sock in readable:
+                data = sock.recv(BUFFER_SIZE)
+                if not data:
+                    return
+                channel.sendall(data)
+                proxy.count('bytes_out', len(data))
+            if channel in readable:
+                data = channel.recv(BUFFER_SIZE)
+                if not data:
+                    return
+                sock.sendall(data)
+                proxy.count('bytes_in', len(data))
+
+
+class _ThreadingServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class TunnelProxy:
+    # Local CONNECT proxy on 127.0.0.1:<random port> backed by SSH direct-tcpip channels
+    def __init__(self, transport):
+        self.transport = transport
+        self.stats = {'channels_opened': 0, 'channel_errors': 0, 'bytes_in': 0, 'bytes_out': 0}
+        self._lock = threading.Lock()
+        self._server = _ThreadingServer(('127.0.0.1', 0), _ConnectHandler)
+        self._server.tunnel = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class RemoteFetcher:
+    # Pooled HTTP session whose traffic egresses from the SSH server
+    def __init__(self, client, pool_size=4, timeout=20):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.proxy = TunnelProxy(client.get_transport())
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        self.session.trust_env = False  # HTTPS_PROXY from the environment must not bypass the tunnel
+        self.session.proxies = {'https': self.proxy.url, 'http': self.proxy.url}
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.requests_made = 0
+        self.errors = 0
+        self.seconds = 0.0
+
+    def fetch(self, url):
+        start = time.perf_counter()
+        self.requests_made += 1
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            return response.text
+        except Exception:
+            self.errors += 1
+            raise
+        finally:
+            self.seconds += time.perf_counter() - start
+
+    def reuse_stats(self):
+        channels = self.proxy.stats['channels_opened']
+        return {
+            'requests': self.requests_made,
+            'errors': self.errors,
+            'channels_opened': channels,
+            'requests_per_channel': round(self.requests_made / channels, 2) if channels else 0.0,
+            'bytes_in': self.proxy.stats['bytes_in'],
+            'seconds': round(self.seconds, 3),
+            'pages_per_sec': round(self.requests_made / self.seconds, 2) if self.seconds else 0.0,
+        }
+
+    def close(self):
+        self.session.close()
+        self.proxy.close()
+
+
+class FrameDecoder:
+    # Incremental decoder for the batch stream: feed wire bytes, get complete frames
+    def __init__(self):
+        self._inflate = zlib.decompressobj()
+        self._buffer = bytearray()
+        self.wire_bytes = 0
+        self.raw_bytes = 0
+
+    def feed(self, data):
+        self.wire_bytes += len(data)
+        plain = self._inflate.decompress(data)
+        self.raw_bytes += len(plain)
+        self._buffer += plain
+        frames = []
+        while len(self._buffer) >= FRAME_HEADER.size:
+            index, status, length = FRAME_HEADER.unpack_from(self._buffer)
+            end = FRAME_HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append((index, status, bytes(self._buffer[FRAME_HEADER.size:end])))
+            del self._buffer[:end]
+        return frames
+
+
+def fetch_batch(client, urls, workers=8, timeout=20):
+    # Fetch many URLs in one SSH channel; yields (url, status, body bytes) as pages arrive.
+    # The generator's return value (StopIteration.value) is the transfer stats dict.
+    script = base64.b64encode(BATCH_FETCH_SCRIPT.encode()).decode()
+    cmd = (f"{REMOTE_PYTHON} -c \"import base64;exec(base64.b64decode('{script}'))\" "
+           f"{shlex.quote(USER_AGENT)} {int(workers)} {float(timeout)}")
+
+    start = time.perf_counter()
+    channel = client.get_transport().open_session()
+    channel.exec_command(cmd)
+    channel.sendall('\n'.join(urls).encode() + b'\n')
+    channel.shutdown_write()
+
+    decoder = FrameDecoder()
+    first_page = None
+    pages = 0
+    try:
+        while True:
+            data = channel.recv(BUFFER_SIZE)
+            if not data:
+                break
+            for index, status, body in decoder.feed(data):
+                pages += 1
+                first_page = first_page or time.perf_counter() - start
+                yield urls[index], status, body
+        exit_status = channel.recv_exit_status()
+        errors = b''
+        while channel.recv_stderr_ready():
+            errors += channel.recv_stderr(BUFFER_SIZE)
+    finally:
+        channel.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        'urls': len(urls),
+        'pages': pages,
+        'exit_status': exit_status,
+        'stderr': errors.decode('utf-8', 'replace')[:500],
+        'raw_bytes': decoder.raw_bytes,
+        'wire_bytes': decoder.wire_bytes,
+        'compression_ratio': round(decoder.raw_bytes / decoder.wire_bytes, 2) if decoder.wire_bytes else 0.0,
+        'first_page_s': round(first_page or 0.0, 3),
+        'seconds': round(elapsed, 3),
+        'pages_per_sec': round(pages / elapsed, 2) if elapsed else 0.0,
+    }
@@ -0,0 +1,272 @@
+import os
+import sys
+import json
+import time
+import heapq
+import random
+import argparse
+import threading
+
+# Adaptive revisit scheduler for known listings.
+#
+# Every tracked ad has a next-due time kept in a heap. After each visit the interval is
+# recomputed: ads whose price/title/shipping changed recently (EWMA change rate) and hot
+# deals (low market percentile, price_sketch.py) are revisited sooner, ads that stay the
+# same back off geometrically up to MAX_INTERVAL_H. Due ads are handed out in batches,
+# hot deals first, and a token bucket keeps fetches within FETCH_BUDGET_PER_HOUR.
+# State is a single JSON file written atomically (tmp + os.replace), like seller_cache.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REVISIT_FILE = os.getenv('REVISIT_FILE', os.path.join(SCRIPT_DIR, 'revisit_queue.json'))
+FETCH_BUDGET_PER_HOUR = float(os.getenv('REVISIT_BUDGET_PER_HOUR', '120'))
+BATCH_SIZE = 20
+BASE_INTERVAL_H = 24.0
+MIN_INTERVAL_H = 1.0
+MAX_INTERVAL_H = 14 * 24.0
+CHANGE_ALPHA = 0.3          # EWMA weight of the latest visit
+CHANGE_BOOST = 6.0          # change rate 1.0 -> interval / 7
+HOT_DEAL_PERCENTILE = 0.25
+HOT_DEAL_FACTOR = 0.25
+BACKOFF = 1.5               # per unchanged visit in a row
+MAX_BACKOFF_STEPS = 6
+FAILURE_BACKOFF_H = 2.0
+MAX_FAILURES = 5
+JITTER = 0.1
+
+WATCHED_FIELDS = ('price', 'price_type', 'title', 'shipping')
+
+
+def fingerprint(record):
+    # Fields whose change means "look again soon"; record is a ListingRecord or report dict
+    get = record.get if isinstance(record, dict) else lambda name: getattr(record, name, None)
+    return [get(name) for name in WATCHED_FIELDS]
+
+
+class RevisitScheduler:
+    def __init__(self, path=REVISIT_FILE, budget_per_hour=FETCH_BUDGET_PER_HOUR, batch_size=BATCH_SIZE):
+        self.path = path
+        self.budget_per_hour = budget_per_hour
+        self.batch_size = batch_size
+        self.ads = {}
+        self.tokens = budget_per_hour
+        self.refilled_at = time.time()
+        self.stats = {'dispatched': 0, 'visits': 0, 'changes': 0, 'failures': 0, 'dropped': 0, 'budget_deferred': 0,
+                      'extra_fetches': 0}
+        self._heap = []
+        self._lock = threading.Lock()
+        self._random = random.Random()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            self.ads = state['ads']
+            self.tokens = state.get('tokens', budget_per_hour)
+            self.refilled_at = state.get('refilled_at', self.refilled_at)
+        for url, ad in self.ads.items():
+            heapq.heappush(self._heap, (ad['due'], url))
+
+    def __len__(self):
+        return len(self.ads)
+
+    def _push(self, url, due):
+        # Old heap entries for the same url are skipped lazily (due no longer matches)
+        self.ads[url]['due'] = due
+        heapq.heappush(self._heap, (due, url))
+
+    def interval_hours(self, ad):
+        hours = BASE_INTERVAL_H / (1 + CHANGE_BOOST * ad['change_rate'])
+        if ad.get('deal') is not None and ad['deal'] <= HOT_DEAL_PERCENTILE:
+            hours *= HOT_DEAL_FACTOR
+        hours *= BACKOFF ** min(ad['unchanged'], MAX_BACKOFF_STEPS)
+        hours *= 1 + self._random.uniform(-JITTER, JITTER)  # keeps ads seen together from staying in lockstep
+        return min(MAX_INTERVAL_H, max(MIN_INTERVAL_H, hours))
+
+    def add(self, url, due=None):
+        with self._lock:
+            if url in self.ads:
+                return False
+            self.ads[url] = {'due': 0, 'interval_h': BASE_INTERVAL_H, 'change_rate': 0.0, 'unchanged': 0,
+                             'visits': 0, 'failures': 0, 'deal': None, 'fingerprint': None, 'last_visit': None}
+            self._push(url, time.time() if due is None else due)
+            return True
+
+    def _refill(self, now):
+        self.tokens = min(self.budget_per_hour, self.tokens + (now - self.refilled_at) * self.budget_per_hour / 3600)
+        self.refilled_at = now
+
+    def due_batch(self, now=None, limit=None):
+        # Up to one batch of due URLs within the fetch budget; hot deals and most overdue first
+        now = now or time.time()
+        limit = limit or self.batch_size
+        with self._lock:
+            self._refill(now)
+            allowed = min(limit, int(self.tokens))
+            due = []
+            while self._heap and self._heap[0][0] <= now:
+                entry_due, url = heapq.heappop(self._heap)
+                ad = self.ads.get(url)
+                if ad is not None and ad['due'] == entry_due:
+                    due.append(url)
+
+            def priority(url):
+                ad = self.ads[url]
+                is_hot = ad['deal'] is not None and ad['deal'] <= HOT_DEAL_PERCENTILE
+                return (not is_hot, -(now - ad['due']) / (ad['interval_h'] * 3600))
+            due.sort(key=priority)
+            batch, deferred = due[:allowed], due[allowed:]
+            for url in deferred:
+                heapq.heappush(self._heap, (self.ads[url]['due'], url))
+            for url in batch:
+                # In flight: re-queued after the interval even if no result ever comes back
+                self._push(url, now + self.ads[url]['interval_h'] * 3600)
+            self.tokens -= len(batch)
+            self.stats['dispatched'] += len(batch)
+            self.stats['budget_deferred'] += len(deferred)
+            return batch
+
+    def take_tokens(self, count, now=None):
+        # Fetches outside due_batch (seller profiles) come out of the same budget; returns how many may run
+        now = now or time.time()
+        with self._lock:
+            self._refill(now)
+            granted = max(0, min(count, int(self.tokens)))
+            self.tokens -= granted
+            self.stats['extra_fetches'] += granted
+            self.stats['budget_deferred'] += count - granted
+            return granted
+
+    def next_due(self):
+        with self._lock:
+            while self._heap and self.ads.get(self._heap[0][1], {}).get('due') != self._heap[0][0]:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def seconds_until_next(self, now=None):
+        # Wait for the next due ad or, when over budget, for the next token
+        now = now or time.time()
+        next_due = self.next_due()
+        if next_due is None:
+            return None
+        wait = max(0.0, next_due - now)
+        with self._lock:
+            self._refill(now)
+            if self.tokens < 1:
+                wait = max(wait, (1 - self.tokens) * 3600 / self.budget_per_hour)
+        return wait
+
+    def observe(self, url, record, deal=None, now=None):
+        # A successful visit: update change rate, deal percentile and the next due time
+        now = now or time.time()
+        with self._lock:
+            ad = self.ads.get(url)
+            if ad is None:
+                return None
+            current = fingerprint(record)
+            first = ad['fingerprint'] is None
+            changed = not first and current != ad['fingerprint']
+            ad['change_rate'] = (1 - CHANGE_ALPHA) * ad['change_rate'] + CHANGE_ALPHA * changed
+            ad['unchanged'] = 0 if changed or first else ad['unchanged'] + 1
+            ad['fingerprint'] = current
+            ad['visits'] += 1
+            ad['failures'] = 0
+            ad['last_visit'] = now
+            if deal is not None:
+                ad['deal'] = deal
+            ad['interval_h'] = self.interval_hours(ad)
+            self._push(url, now + ad['interval_h'] * 3600)
+            self.stats['visits'] += 1
+            self.stats['changes'] += changed
+            return changed
+
+    def failed(self, url, now=None):
+        # Fetch error: short retry with backoff; ads failing MAX_FAILURES times in a row are dropped
+        now = now or time.time()
+        with self._lock:
+            ad = self.ads.get(url)
+            if ad is None:
+                return
+            ad['failures'] += 1
+            self.stats['failures'] += 1
+            if ad['failures'] >= MAX_FAILURES:
+                del self.ads[url]
+                self.stats['dropped'] += 1
+                return
+            self._push(url, now + FAILURE_BACKOFF_H * 3600 * 2 ** (ad['failures'] - 1))
+
+    def drop(self, url):
+        # Sold / deleted ads leave the queue
+        with self._lock:
+            if self.ads.pop(url, None) is not None:
+                self.stats['dropped'] += 1
+
+    def run(self, fetch_many, analyze, rounds=None, sleep=time.sleep):
+        # fetch_many(urls) -> {url: html}; analyze(url, html) -> (record, deal percentile or None)
+        done = 0
+        while rounds is None or done < rounds:
+            batch = self.due_batch()
+            if batch:
+                pages = fetch_many(batch)
+                for url in batch:
+                    html = pages.get(url)
+                    if html:
+                        record, deal = analyze(url, html)
+                        self.observe(url, record, deal)
+                    else:
+                        self.failed(url)
+                self.save()
+                done += 1
+                continue
+            wait = self.seconds_until_next()
+            if wait is None:
+                break
+            sleep(min(wait, 3600))
+
+    def save(self):
+        with self._lock:
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'ads': self.ads, 'tokens': self.tokens, 'refilled_at': self.refilled_at}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    def summary(self, now=None):
+        now = now or time.time()
+        intervals = sorted(ad['interval_h'] for ad in self.ads.values())
+        return dict(self.stats,
+                    tracked=len(self.ads),
+                    due_now=sum(1 for ad in self.ads.values() if ad['due'] <= now),
+                    hot_deals=sum(1 for ad in self.ads.values() if ad['deal'] is not None and ad['deal'] <= HOT_DEAL_PERCENTILE),
+                    median_interval_h=round(intervals[len(intervals) // 2], 2) if intervals else None,
+                    tokens=round(self.tokens, 2),
+                    budget_per_hour=self.budget_per_hour)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Adaptive revisit queue for tracked listings')
+    parser.add_argument('--file', default=REVISIT_FILE)
+    parser.add_argument('--add', nargs='*', default=[], metavar='URL', help='Start tracking these listing URLs')
+    parser.add_argument('--urls-file', help='File with one listing URL per line to start tracking')
+    parser.add_argument('--drop', nargs='*', default=[], metavar='URL', help='Stop tracking these URLs')
+    parser.add_argument('--due', action='store_true', help='Print the URLs due now (does not dispatch)')
+    args = parser.parse_args()
+
+    scheduler = RevisitScheduler(args.file)
+    urls = list(args.add)
+    if args.urls_file:
+        with open(args.urls_file, 'r', encoding='utf-8') as f:
+            urls.extend(line.strip() for line in f if line.strip())
+    added = sum(scheduler.add(url) for url in urls)
+    for url in args.drop:
+        scheduler.drop(url)
+    if urls or args.drop:
+        scheduler.save()
+        print(f"Added {added}, dropped {len(args.drop)}", file=sys.stderr)
+    if args.due:
+        now = time.time()
+        for url, ad in sorted(scheduler.ads.items(), key=lambda item: item[1]['due']):
+            if ad['due'] <= now:
+                print(url)
+    else:
+        print(json.dumps(scheduler.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
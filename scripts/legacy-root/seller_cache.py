@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+
+# Seller-keyed trust cache for the hunter.
+#
+# Each ad page carries the seller block (#viewad-contact: "Aktiv seit", user badges,
+# a link with ?userId=). A dealer with dozens of bikes used to be re-scored from every
+# one of their ads; here the profile is stored once per seller ID with a fetch time,
+# trust lookups are a dict hit, and seller profile pages are fetched at most once per
+# TTL. The cache is a single JSON file written atomically (tmp + os.replace).
+
+from bs4 import BeautifulSoup
+
+from hunter_extractor import HTML_PARSER, SINCE_RE, seller_rating, trust_score
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'telegram-bot'))
+from structured_data import as_bytes, element_spans, fragment_text
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SELLER_CACHE_FILE = os.getenv('SELLER_CACHE_FILE', os.path.join(SCRIPT_DIR, 'seller_cache.json'))
+DEFAULT_TTL_HOURS = float(os.getenv('SELLER_CACHE_TTL_HOURS', '168'))
+PROFILE_URL = 'https://www.kleinanzeigen.de/s-bestandsliste.html?userId={seller_id}'
+
+
+def parse_profile_page(html):
+    # Seller profile page -> (since, rating, badges); same signals as the ad's contact block
+    raw = as_bytes(html)
+    page_text = fragment_text(raw)
+    badges = [fragment_text(raw[span[0]:span[1]], strip=True)
+              for _, span in element_spans(raw, 'class', 'userbadge-tag') if span]
+    if page_text is None or None in badges:
+        # Markup the byte scanner cannot read safely: same signals from the DOM
+        soup = BeautifulSoup(html, HTML_PARSER)
+        page_text = soup.get_text()
+        badges = [el.get_text(strip=True) for el in soup.find_all(class_='userbadge-tag')]
+    since_match = SINCE_RE.search(page_text)
+    badges = [badge for badge in badges if badge]
+    return (since_match.group(1) if since_match else "Unknown"), seller_rating(badges), badges
+
+
+class SellerCache:
+    def __init__(self, path=SELLER_CACHE_FILE, ttl_hours=DEFAULT_TTL_HOURS):
+        self.path = path
+        self.ttl = ttl_hours * 3600
+        self.profiles = {}
+        self.stats = {'hits': 0, 'misses': 0, 'stale': 0, 'stored': 0, 'profile_fetches': 0, 'profile_errors': 0}
+        self._lock = threading.Lock()
+        self._dirty = False
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.profiles = json.load(f)
+
+    def __len__(self):
+        return len(self.profiles)
+
+    def is_fresh(self, profile, now=None):
+        return (now or time.time()) - profile['fetched_at'] < self.ttl
+
+    def get(self, seller_id):
+        # O(1) trust lookup; None when unknown or older than the TTL
+        with self._lock:
+            profile = self.profiles.get(seller_id)
+            if profile is None:
+                self.stats['misses'] += 1
+                return None
+            if not self.is_fresh(profile):
+                self.stats['stale'] += 1
+                return None
+            self.stats['hits'] += 1
+            return profile
+
+    def put(self, seller_id, since, rating, badges=(), source='ad'):
+        profile = {
+            'seller_id': seller_id,
+            'since': since,
+            'rating': rating,
+            'badges': list(badges),
+            'score': trust_score(since, rating),
+            'source': source,  # 'ad' (contact block) or 'profile' (seller page)
+            'fetched_at': time.time(),
+        }
+        with self._lock:
+            self.profiles[seller_id] = profile
+            self.stats['stored'] += 1
+            self._dirty = True
+        return profile
+
+    def stale_ids(self, seller_ids, prefer_profile=True):
+        # Sellers needing a profile fetch: unknown, expired, or (optionally) only seen on an ad
+        now = time.time()
+        result = []
+        for seller_id in dict.fromkeys(seller_ids):
+            profile = self.profiles.get(seller_id)
+            if profile is None or not self.is_fresh(profile, now) or (prefer_profile and profile['source'] != 'profile'):
+                result.append(seller_id)
+        return result
+
+    def refresh(self, seller_ids, fetch_many, limit=None):
+        # fetch_many(urls) -> {url: html}; one request per stale seller, however many ads they have,
+        # at most limit requests (the rest stay stale for the next run)
+        stale = self.stale_ids(seller_ids)
+        if limit is not None:
+            stale = stale[:limit]
+        if not stale:
+            return []
+        urls = {PROFILE_URL.format(seller_id=seller_id): seller_id for seller_id in stale}
+        pages = fetch_many(list(urls))
+        refreshed = []
+        for url, seller_id in urls.items():
+            html = pages.get(url)
+            self.stats['profile_fetches'] += 1
+            if not html:
+                self.stats['profile_errors'] += 1
+                continue
+            since, rating, badges = parse_profile_page(html)
+            self.put(seller_id, since, rating, badges, source='profile')
+            refreshed.append(seller_id)
+        return refreshed
+
+    def score_listings(self, listings):
+        # Batch scoring: {listing key: seller_id} -> {seller_id: {'score', 'listings': [...]}}
+        by_seller = {}
+        for key, seller_id in listings.items():
+            if seller_id:
+                by_seller.setdefault(seller_id, []).append(key)
+        result = {}
+        for seller_id, keys in by_seller.items():
+            profile = self.profiles.get(seller_id)
+            result[seller_id] = {
+                'score': profile['score'] if profile else None,
+                'since': profile['since'] if profile else None,
+                'source': profile['source'] if profile else None,
+                'listings': keys,
+            }
+        return result
+
+    def prune(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, profile in self.profiles.items() if not self.is_fresh(profile, now)]
+            for key in expired:
+                del self.profiles[key]
+            self._dirty = self._dirty or bool(expired)
+        return len(expired)
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            tmp_path = f'{self.path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.profiles, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+
+    def summary(self):
+        lookups = self.stats['hits'] + self.stats['misses'] + self.stats['stale']
+        return dict(self.stats, sellers=len(self.profiles),
+                    hit_rate=round(self.stats['hits'] / lookups, 3) if lookups else 0.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seller trust cache')
+    parser.add_argument('--file', default=SELLER_CACHE_FILE)
+    parser.add_argument('--ttl-hours', type=float, default=DEFAULT_TTL_HOURS)
+    parser.add_argument('--prune', action='store_true', help='Drop profiles older than the TTL')
+    parser.add_argument('seller_ids', nargs='*', help='Seller IDs to show')
+    args = parser.parse_args()
+
+    cache = SellerCache(args.file, args.ttl_hours)
+    if args.prune:
+        print(f"Pruned {cache.prune()} expired profiles")
+        cache.save()
+    for seller_id in args.seller_ids:
+        print(json.dumps(cache.profiles.get(seller_id), ensure_ascii=False))
+    if not args.seller_ids:
+        print(json.dumps(cache.summary(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
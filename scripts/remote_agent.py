@@ -0,0 +1,230 @@
+import os
+import sys
+import json
+import time
+import shlex
+import hashlib
+import argparse
+
+from remote_agent_server import FRAME
+from ssh_session import HOST, USER, SshSession, read_password
+
+# Client for the resident maintenance agent (remote_agent_server.py).
+#
+# The agent file is uploaded over SFTP under a content-addressed name in a directory only
+# the login user can write (~/.cache/eubike, mode 0700). An existing copy is reused only if
+# its SHA-256 matches the local source. It is started once on a single exec channel and driven with
+# framed JSON requests: query (read-only), execute, check_tables, delete_batch, stats, checkpoint, vacuum and file
+# ops. The agent keeps its DB connection open between requests, so every step after the
+# first costs one round trip instead of a new process, interpreter start and DB open.
+
+AGENT_SOURCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'remote_agent_server.py')
+REMOTE_DIR = '.cache/eubike'    # relative to the SFTP home directory
+REMOTE_DB = '/root/eubike/backend/database/eubike.db'
+REMOTE_ROOT = '/root/eubike'
+REMOTE_PYTHON = 'python3'
+BUFFER_SIZE = 64 * 1024
+
+
+class AgentError(Exception):
+    pass
+
+
+class RemoteAgent:
+    def __init__(self, session, db=REMOTE_DB, roots=(REMOTE_ROOT,), remote_dir=REMOTE_DIR,
+                 telegram_dir='/root/eubike/telegram-bot'):
+        self.session = session
+        self.db = db
+        self.roots = list(roots)
+        self.remote_dir = remote_dir
+        self.telegram_dir = telegram_dir
+        self.channel = None
+        self.info = None
+        self._next_id = 1
+        self._buffer = b''
+        self.stats = {'calls': 0, 'round_trip_ms': 0.0, 'agent_ms': 0.0, 'uploaded': False, 'start_ms': 0.0}
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _private_dir(self, sftp):
+        # Create the upload directory (and parents) owned by us; the last level is forced to 0700
+        path = self.remote_dir if self.remote_dir.startswith('/') else f"{sftp.normalize('.')}/{self.remote_dir}"
+        current = ''
+        for part in path.strip('/').split('/'):
+            current += '/' + part
+            try:
+                sftp.stat(current)
+            except FileNotFoundError:
+                sftp.mkdir(current, 0o700)
+        sftp.chmod(current, 0o700)
+        return current
+
+    def upload(self):
+        # Content-addressed remote name; a present copy is reused only when its content hash matches
+        with open(AGENT_SOURCE, 'rb') as f:
+            source = f.read()
+        digest = hashlib.sha256(source).hexdigest()
+        sftp = self.session.open_sftp()
+        try:
+            remote_path = f"{self._private_dir(sftp)}/eubike-agent-{digest[:12]}.py"
+            try:
+                with sftp.open(remote_path, 'rb') as f:
+                    if hashlib.sha256(f.read()).hexdigest() == digest:
+                        return remote_path
+            except FileNotFoundError:
+                pass
+            tmp_path = f'{remote_path}.{os.getpid()}.part'
+            with sftp.open(tmp_path, 'wb') as f:
+                f.write(source)
+            sftp.chmod(tmp_path, 0o600)
+            sftp.posix_rename(tmp_path, remote_path)
+            self.stats['uploaded'] = True
+        finally:
+            sftp.close()
+        return remote_path
+
+    def start(self):
+        start = time.perf_counter()
+        remote_path = self.upload()
+        cmd = f"{REMOTE_PYTHON} {shlex.quote(remote_path)} --db {shlex.quote(self.db)} " \
+              f"--telegram-dir {shlex.quote(self.telegram_dir)}" + \
+              "".join(f" --root {shlex.quote(root)}" for root in self.roots)
+        self.channel = self.session.open_channel(cmd)
+        hello = self._read_frame()
+        if hello is None or not hello.get('ok'):
+            raise AgentError(f'agent did not start: {self._stderr() or hello}')
+        self.info = hello['result']
+        self.stats['start_ms'] = round((time.perf_counter() - start) * 1000, 1)
+        return self
+
+    def _stderr(self):
+        errors = b''
+        while self.channel is not None and self.channel.recv_stderr_ready():
+            errors += self.channel.recv_stderr(BUFFER_SIZE)
+        return errors.decode('utf-8', 'replace')[:500]
+
+    def _read_exact(self, size):
+        while len(self._buffer) < size:
+            data = self.channel.recv(BUFFER_SIZE)
+            if not data:
+                return None
+            self._buffer += data
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def _read_frame(self):
+        header = self._read_exact(FRAME.size)
+        if header is None:
+            return None
+        body = self._read_exact(FRAME.unpack(header)[0])
+        return None if body is None else json.loads(body.decode('utf-8'))
+
+    def call(self, op, **args):
+        request_id = self._next_id
+        self._next_id += 1
+        data = json.dumps({'id': request_id, 'op': op, 'args': args}).encode('utf-8')
+        start = time.perf_counter()
+        self.channel.sendall(FRAME.pack(len(data)) + data)
+        response = self._read_frame()
+        if response is None:
+            raise AgentError(f'agent exited: {self._stderr()}')
+        if response.get('id') != request_id:
+            raise AgentError(f"out-of-order response {response.get('id')} for request {request_id}")
+        self.stats['calls'] += 1
+        self.stats['round_trip_ms'] += (time.perf_counter() - start) * 1000
+        self.stats['agent_ms'] += response.get('ms', 0.0)
+        if not response['ok']:
+            raise AgentError(response['error'])
+        return response['result']
+
+    def query(self, sql, params=(), limit=1000):
+        return self.call('query', sql=sql, params=list(params), limit=limit)
+
+    def execute(self, sql, params=()):
+        return self.call('execute', sql=sql, params=list(params))
+
+    def check_tables(self, tables, older_than_days=None, where=None):
+        return self.call('check_tables', tables=list(tables), older_than_days=older_than_days, where=where)
+
+    def delete_batch(self, table, **options):
+        return self.call('delete_batch', table=table, **options)
+
+    def db_stats(self, tables=None):
+        return self.call('stats', tables=tables)
+
+    def listdir(self, path, limit=1000):
+        return self.call('listdir', path=path, limit=limit)
+
+    def remove(self, paths):
+        return self.call('remove', paths=list(paths))
+
+    def summary(self):
+        calls = self.stats['calls']
+        return dict(self.stats,
+                    round_trip_ms=round(self.stats['round_trip_ms'], 1),
+                    agent_ms=round(self.stats['agent_ms'], 1),
+                    avg_round_trip_ms=round(self.stats['round_trip_ms'] / calls, 2) if calls else 0.0)
+
+    def close(self):
+        if self.channel is None:
+            return
+        try:
+            data = json.dumps({'op': 'exit'}).encode('utf-8')
+            self.channel.sendall(FRAME.pack(len(data)) + data)
+            self.channel.shutdown_write()
+            self.channel.recv_exit_status()
+        except Exception:
+            pass
+        finally:
+            self.channel.close()
+            self.channel = None
+
+
+def run_benchmark(session, agent, rounds=20):
+    # Same read-only query: one process + DB open per call vs one agent round trip per call
+    sql = "SELECT COUNT(*) FROM sqlite_master"
+    cmd = f"{REMOTE_PYTHON} -c {shlex.quote(f'import sqlite3;print(sqlite3.connect({agent.db!r}).execute({sql!r}).fetchone()[0])')}"
+    start = time.perf_counter()
+    for _ in range(rounds):
+        session.run(cmd)
+    per_process = (time.perf_counter() - start) / rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        agent.query(sql)
+    per_call = (time.perf_counter() - start) / rounds
+    return {'rounds': rounds, 'exec_per_call_ms': round(per_process * 1000, 2),
+            'agent_per_call_ms': round(per_call * 1000, 2),
+            'speedup': round(per_process / per_call, 1) if per_call else 0.0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run maintenance steps through the resident remote agent')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--db', default=REMOTE_DB)
+    parser.add_argument('--query', action='append', default=[], help='Read-only SQL to run (repeatable)')
+    parser.add_argument('--stats', action='store_true', help='Table counts, page and file sizes')
+    parser.add_argument('--bench', type=int, metavar='N', help='Compare N agent round trips with N exec calls')
+    args = parser.parse_args()
+
+    pwd = read_password()
+    try:
+        with SshSession(args.host, USER, pwd) as session, RemoteAgent(session, args.db) as agent:
+            output = {'agent': agent.info}
+            if args.stats:
+                output['stats'] = agent.db_stats()
+            output['queries'] = [dict(sql=sql, **agent.query(sql)) for sql in args.query]
+            if args.bench:
+                output['bench'] = run_benchmark(session, agent, args.bench)
+            output['session'] = agent.summary()
+        print(json.dumps(output, indent=2, ensure_ascii=False))
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+import os
+import sys
+import json
+import time
+import base64
+import shutil
+import struct
+import sqlite3
+import argparse
+
+# Server side of remote_agent.py: uploaded once over SFTP and started on one exec channel.
+#
+# Keeps a single connection to the catalog DB open for the whole session and answers
+# length-prefixed JSON frames on stdin/stdout (>I length + UTF-8 JSON), one response per
+# request, so a multi-step maintenance run costs one round trip per step instead of one
+# process start + DB open per step. Batched deletes, checkpoint and vacuum reuse
+# telegram-bot/db_prune.py from the deployed tree. File operations are confined to --root.
+# Stdlib only: nothing has to be installed on the server.
+
+FRAME = struct.Struct('>I')
+MAX_ROWS = 1000
+
+
+def read_frame(stream):
+    header = stream.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return None
+    length, = FRAME.unpack(header)
+    return json.loads(stream.read(length).decode('utf-8'))
+
+
+def write_frame(stream, payload):
+    data = json.dumps(payload, default=_encode).encode('utf-8')
+    stream.write(FRAME.pack(len(data)) + data)
+    stream.flush()
+
+
+def _encode(value):
+    if isinstance(value, (bytes, memoryview)):
+        return {'$b64': base64.b64encode(bytes(value)).decode()}
+    raise TypeError(f'not serializable: {type(value).__name__}')
+
+
+class Agent:
+    def __init__(self, db_path, roots, telegram_dir):
+        self.db_path = db_path
+        self.roots = [os.path.realpath(root) for root in roots]
+        sys.path.insert(0, telegram_dir)
+        self.conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        self.conn.execute('PRAGMA busy_timeout = 30000')
+        # `query` runs on its own read-only connection: only `execute` and the prune ops write
+        self.reader = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True, timeout=30, isolation_level=None)
+        self.reader.execute('PRAGMA query_only = ON')
+
+    def _path(self, path):
+        real = os.path.realpath(path)
+        if not any(real == root or real.startswith(root + os.sep) for root in self.roots):
+            raise PermissionError(f'{path} is outside the allowed roots')
+        return real
+
+    def op_ping(self):
+        return {'pid': os.getpid(), 'db': self.db_path, 'sqlite': sqlite3.sqlite_version}
+
+    def op_query(self, sql, params=(), limit=MAX_ROWS):
+        cursor = self.reader.execute(sql, params)
+        columns = [column[0] for column in cursor.description or ()]
+        rows = cursor.fetchmany(limit + 1)
+        cursor.close()
+        return {'columns': columns, 'rows': rows[:limit], 'truncated': len(rows) > limit}
+
+    def op_execute(self, sql, params=(), many=False):
+        self.conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = self.conn.executemany(sql, params) if many else self.conn.execute(sql, params)
+            self.conn.execute('COMMIT')
+        except BaseException:
+            self.conn.execute('ROLLBACK')
+            raise
+        return {'rowcount': cursor.rowcount}
+
+    def op_check_tables(self, tables, older_than_days=None, where=None):
+        import db_prune
+        valid, skipped = db_prune.check_tables(self.conn, tables, older_than_days, where)
+        return {'valid': valid, 'skipped': skipped}
+
+    def op_delete_batch(self, table, older_than_days=None, where=None, batch_size=None, max_lock_ms=None,
+                        limit=None, dry_run=False):
+        import db_prune
+        return db_prune.prune_table(self.conn, table, older_than_days, where,
+                                    batch_size or db_prune.BATCH_SIZE, max_lock_ms or db_prune.MAX_LOCK_MS,
+                                    limit=limit, dry_run=dry_run)
+
+    def op_checkpoint(self):
+        import db_prune
+        return db_prune.checkpoint(self.conn)
+
+    def op_vacuum(self):
+        import db_prune
+        return db_prune.vacuum(self.conn)
+
+    def op_stats(self, tables=None):
+        existing = [row[0] for row in self.conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        counts = {table: self.conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+                  for table in (tables or existing) if table in existing}
+        pragma = {name: self.conn.execute(f'PRAGMA {name}').fetchone()[0]
+                  for name in ('page_size', 'page_count', 'freelist_count', 'journal_mode')}
+        files = {suffix or 'db': os.path.getsize(self.db_path + suffix)
+                 for suffix in ('', '-wal') if os.path.exists(self.db_path + suffix)}
+        return {'tables': counts, 'pragma': pragma, 'bytes': files}
+
+    def op_listdir(self, path, limit=MAX_ROWS):
+        entries = []
+        with os.scandir(self._path(path)) as it:
+            for entry in it:
+                info = entry.stat(follow_symlinks=False)
+                entries.append({'name': entry.name, 'dir': entry.is_dir(follow_symlinks=False),
+                                'bytes': info.st_size, 'mtime': info.st_mtime})
+                if len(entries) >= limit:
+                    break
+        return {'entries': entries, 'truncated': len(entries) >= limit}
+
+    def op_stat(self, path):
+        try:
+            info = os.stat(self._path(path))
+        except FileNotFoundError:
+            return {'exists': False}
+        return {'exists': True, 'bytes': info.st_size, 'mtime': info.st_mtime}
+
+    def op_remove(self, paths):
+        removed, missing, freed = 0, 0, 0
+        for path in paths:
+            real = self._path(path)
+            try:
+                size = os.path.getsize(real)
+                os.remove(real)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            removed += 1
+            freed += size
+        return {'removed': removed, 'missing': missing, 'bytes': freed}
+
+    def op_disk_usage(self, path):
+        usage = shutil.disk_usage(self._path(path))
+        return {'total': usage.total, 'used': usage.used, 'free': usage.free}
+
+    def serve(self, stdin, stdout):
+        write_frame(stdout, {'id': 0, 'ok': True, 'result': self.op_ping()})
+        while True:
+            request = read_frame(stdin)
+            if request is None or request.get('op') == 'exit':
+                break
+            start = time.perf_counter()
+            handler = getattr(self, f"op_{request.get('op')}", None)
+            try:
+                if handler is None:
+                    raise ValueError(f"unknown op {request.get('op')!r}")
+                response = {'ok': True, 'result': handler(**request.get('args', {}))}
+            except Exception as e:
+                response = {'ok': False, 'error': f'{type(e).__name__}: {e}'}
+            response['id'] = request.get('id')
+            response['ms'] = round((time.perf_counter() - start) * 1000, 2)
+            write_frame(stdout, response)
+        self.reader.close()
+        self.conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Resident maintenance agent (framed JSON over stdin/stdout)')
+    parser.add_argument('--db', required=True)
+    parser.add_argument('--root', action='append', default=[], help='Directory file ops may touch (repeatable)')
+    parser.add_argument('--telegram-dir', default='/root/eubike/telegram-bot', help='Deployed tree with db_prune.py')
+    args = parser.parse_args()
+    Agent(args.db, args.root, args.telegram_dir).serve(sys.stdin.buffer, sys.stdout.buffer)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,86 +1,111 @@
-import paramiko
 import sys
-import time
+import json
+import argparse
 
-# Configuration
-HOST = '45.9.41.232'
-USER = 'root'
-PASS_FILE = 'deploy_password.txt'
-
-def read_password():
-    try:
-        with open(PASS_FILE, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        print(f"Error: {PASS_FILE} not found.")
-        sys.exit(1)
-
-def run_remote_command(client, command, verbose=True):
-    if verbose:
-        print(f"REMOTE EXEC: {command}")
-    stdin, stdout, stderr = client.exec_command(command)
-    
-    # Stream output
-    exit_status = stdout.channel.recv_exit_status()
-    out = stdout.read().decode('utf-8')
-    err = stderr.read().decode('utf-8')
-    
-    if verbose:
-        if out: print(out)
-        if err: print(f"STDERR: {err}")
-    
-    return exit_status
+from remote_agent import AgentError, RemoteAgent
+from ssh_session import HOST, USER, SshSession, read_password
 
 def main():
+    parser = argparse.ArgumentParser(description='Remote DB and image cleanup')
+    parser.add_argument('--older-than-days', type=float, help='Only delete rows older than N days (default: everything)')
+    parser.add_argument('--batch-size', type=int, default=2000, help='Initial rows per delete transaction')
+    parser.add_argument('--max-lock-ms', type=float, default=50, help='Target write-lock time per batch')
+    parser.add_argument('--vacuum', action='store_true', help='VACUUM after pruning to return space to the OS')
+    parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted')
+    args = parser.parse_args()
+
     print("=== REMOTE SYSTEM CLEANUP ===")
     pwd = read_password()
     
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(HOST, username=USER, password=pwd)
+        session = SshSession(HOST, USER, pwd).connect()
         print("✅ SSH Connected")
         
-        # 1. Clean DB using sqlite3
-        # Assuming sqlite3 is installed. If not, we might need a node script.
-        # Let's try to find where the DB is. Assuming standard deploy path /root/eubike/backend/database/eubike.db
+        # 1. Prune DB in bounded transactions (telegram-bot/db_prune.py) instead of one unbounded DELETE
         db_path = "/root/eubike/backend/database/eubike.db"
         
         print("🧹 Cleaning Remote Database...")
         # Check if file exists
         check_cmd = f"[ -f {db_path} ] && echo 'exists'"
-        stdin, stdout, stderr = client.exec_command(check_cmd)
-        if 'exists' in stdout.read().decode('utf-8'):
-            sql_cmds = "DELETE FROM bikes; DELETE FROM market_history; DELETE FROM search_stats;"
-            # Try to run via sqlite3 command line
-            cmd = f"sqlite3 {db_path} \"{sql_cmds}\""
-            status = run_remote_command(client, cmd)
-            if status != 0:
-                print("⚠️ sqlite3 command failed. Trying Node.js fallback...")
-                # Fallback: create a temporary node script on remote
-            # We run it from telegram-bot directory where sqlite3 is likely installed
-            node_cmd = """cd /root/eubike/telegram-bot && node -e "const sqlite3 = require('sqlite3'); const db = new sqlite3.Database('../backend/database/eubike.db'); db.serialize(() => { db.run('DELETE FROM bikes'); db.run('DELETE FROM market_history'); db.run('DELETE FROM search_stats', (err) => { if(err) console.error(err); else console.log('DB Cleaned'); }); });" """
-            
-            print(f"   Trying Node.js fallback from telegram-bot dir...")
-            status_node = run_remote_command(client, node_cmd)
-            
-            if status_node != 0:
-                 print("⚠️ Node fallback failed too. Trying backend dir...")
-                 node_cmd_back = """cd /root/eubike/backend && node -e "const sqlite3 = require('sqlite3'); const db = new sqlite3.Database('./database/eubike.db'); db.serialize(() => { db.run('DELETE FROM bikes'); db.run('DELETE FROM market_history'); db.run('DELETE FROM search_stats', (err) => { if(err) console.error(err); else console.log('DB Cleaned'); }); });" """
-                 run_remote_command(client, node_cmd_back)
+        if 'exists' in session.run(check_cmd).stdout:
+            age = args.older_than_days if args.older_than_days is not None else 0
+            # market_history is rolled into the columnar archive (telegram-bot/market_archive.py)
+            # instead of being wiped; archived rows are removed from the hot table by the tool itself.
+            # It is never pruned here: if the archive step fails the rows stay where they are
+            tables = ['bikes', 'search_stats']
+            archive_cmd = f"cd /root/eubike/telegram-bot && python3 market_archive.py --db {db_path} compact --older-than-days {age}"
+            if args.dry_run:
+                archive_cmd += " --dry-run"
+            print("📦 Archiving market_history...")
+            result = session.run(archive_cmd)
+            if result.exit_status == 0:
+                report = json.loads(result.stdout)
+                if args.dry_run:
+                    print(f"   market_history: {report['matching']} rows would be archived (before {report['cutoff']})")
+                else:
+                    print(f"   market_history: {report['rows']} rows archived, {report['deleted']} removed from the table, "
+                          f"{report['hot_rows_left']} left")
+            else:
+                print(f"❌ Archive failed (status {result.exit_status}), market_history left untouched: "
+                      f"{result.stderr or result.error}")
+            # The rest of the DB work goes through one resident agent (scripts/remote_agent.py):
+            # one channel and one open connection instead of a process + DB open per step
+            try:
+                with RemoteAgent(session, db_path) as agent:
+                    # Validate every table and its age predicate before deleting from any of them
+                    checked = agent.check_tables(tables, older_than_days=args.older_than_days)
+                    for table, reason in checked['skipped'].items():
+                        print(f"   {table}: skipped ({reason})")
+                    tables = checked['valid']
+                    before = agent.db_stats(tables)
+                    deleted = 0
+                    for table in tables:
+                        report = agent.delete_batch(table, older_than_days=args.older_than_days,
+                                                    batch_size=args.batch_size, max_lock_ms=args.max_lock_ms,
+                                                    dry_run=args.dry_run)
+                        if args.dry_run:
+                            print(f"   {table}: {report['matching']} rows would be deleted")
+                            continue
+                        deleted += report['deleted']
+                        print(f"   {table}: {report['deleted']} rows in {report['batches']} batches, "
+                              f"{report['rows_per_sec']} rows/s, lock max {report['lock_ms_max']} ms, "
+                              f"total {report['lock_ms_total']} ms")
+                    if not args.dry_run:
+                        agent.call('checkpoint')
+                        if args.vacuum:
+                            agent.call('vacuum')
+                            agent.call('checkpoint')
+                        after = agent.db_stats(tables)
+                        print(f"✅ DB pruned: {deleted} rows, {sum(before['bytes'].values())} -> "
+                              f"{sum(after['bytes'].values())} bytes")
+                    session_stats = agent.summary()
+                print(f"   Agent: {session_stats['calls']} calls, {session_stats['avg_round_trip_ms']} ms avg round trip "
+                      f"(started in {session_stats['start_ms']} ms{', uploaded' if session_stats['uploaded'] else ''})")
+            except AgentError as e:
+                # No blind fallback: a failed prune leaves the DB as it is
+                print(f"❌ DB prune failed: {e}")
 
         else:
             print("⚠️ DB file not found remotely. Skipping DB clean.")
 
-        # 2. Clean Images
+        # 2. Clean Images: mark-and-sweep (telegram-bot/image_gc.py) keeps files still referenced by bikes
         img_path = "/root/eubike/backend/public/images/bikes"
         print(f"🧹 Cleaning Remote Images in {img_path}...")
-        # rm -rf * inside the dir
-        cmd = f"rm -rf {img_path}/*"
-        run_remote_command(client, cmd)
+        gc_cmd = f"cd /root/eubike/telegram-bot && python3 image_gc.py --db {db_path} --images-dir {img_path}"
+        if args.dry_run:
+            gc_cmd += " --dry-run"
+        result = session.run(gc_cmd)
+        if result.exit_status == 0:
+            report = json.loads(result.stdout)
+            action = "would be deleted" if args.dry_run else "deleted"
+            print(f"   {report['files']} files scanned ({report['files_per_sec']}/s), {report['live_files']} referenced, "
+                  f"{report['orphans']} orphans {action} ({report['mb_reclaimable']} MB), "
+                  f"{report['too_recent']} too recent to touch")
+        else:
+            print(f"❌ Image GC failed (status {result.exit_status}): {result.stderr or result.error}")
         
         print("✅ Remote Cleanup Complete.")
-        client.close()
+        session.close()
 
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -0,0 +1,279 @@
+import os
+import sys
+import json
+import time
+import zlib
+import base64
+import shlex
+import struct
+import hashlib
+import argparse
+
+from ssh_session import HOST, USER, SshSession, read_password
+
+# Incremental pull of the production SQLite DB for local analysis.
+#
+# The server takes a consistent copy with SQLite's online backup API (the app keeps
+# writing; backup steps yield between page batches) and compares it block by block with
+# the copy we already have, rsync style: we upload a weak (adler32) + strong (blake2b)
+# checksum per local block, the server looks every block of the fresh copy up in that
+# table and sends back only "copy local blocks i..j" runs and literal data, as one zlib
+# stream over a single channel of the shared session. SQLite changes whole pages in place,
+# so between pulls of a live DB the unchanged pages sit at block-aligned offsets and lookups
+# there (any block index, not just the same position) find them without a byte-wise rolling
+# search. VACUUM rebuilds every page (new page numbers and pointers), so the first pull after
+# it reuses almost nothing and costs about a full transfer.
+# The rebuilt file is checked against the server's SHA-256 before it replaces the old one.
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+REMOTE_DB = '/root/eubike/backend/database/eubike.db'
+DEFAULT_OUTPUT = os.path.join(SCRIPT_DIR, '..', 'backend', 'database', 'eubike-prod.db')
+BLOCK_SIZE = 8192           # two default SQLite pages: small literals, ~2.5 MB of checksums per GB
+BUFFER_SIZE = 256 * 1024
+REMOTE_PYTHON = 'python3'
+CHECKSUM = struct.Struct('>I16s')
+COPY = struct.Struct('>II')
+LITERAL = struct.Struct('>I')
+END = struct.Struct('>Qd32s')
+
+SNAPSHOT_SCRIPT = r'''
+import os, sys, zlib, struct, sqlite3, hashlib, tempfile, time
+db, block = sys.argv[1], int(sys.argv[2])
+raw = sys.stdin.buffer.read()
+table = {}
+for i in range(len(raw) // 20):
+    weak, strong = struct.unpack_from('>I16s', raw, i * 20)
+    table.setdefault(weak, {}).setdefault(strong, i)
+fd, tmp = tempfile.mkstemp(suffix='.db')
+os.close(fd)
+try:
+    start = time.time()
+    src = sqlite3.connect('file:%s?mode=ro' % db, uri=True)
+    dst = sqlite3.connect(tmp)
+    src.backup(dst, pages=2048, sleep=0.005)
+    dst.close()
+    src.close()
+    backup_s = time.time() - start
+    out = sys.stdout.buffer
+    z = zlib.compressobj(6)
+    sha = hashlib.sha256()
+    size = 0
+    run = None
+    literal = bytearray()
+    def flush_literal():
+        if literal:
+            out.write(z.compress(b'L' + struct.pack('>I', len(literal)) + bytes(literal)))
+            literal.clear()
+    def flush_run():
+        global run
+        if run:
+            out.write(z.compress(b'C' + struct.pack('>II', run[0], run[1])))
+            run = None
+    with open(tmp, 'rb') as f:
+        while True:
+            data = f.read(block)
+            if not data:
+                break
+            sha.update(data)
+            size += len(data)
+            candidates = table.get(zlib.adler32(data))
+            index = candidates.get(hashlib.blake2b(data, digest_size=16).digest()) if candidates else None
+            if index is None:
+                flush_run()
+                literal += data
+                if len(literal) >= 1 << 20:
+                    flush_literal()
+            else:
+                flush_literal()
+                if run and run[0] + run[1] == index:
+                    run[1] += 1
+                else:
+                    flush_run()
+                    run = [index, 1]
+    flush_literal()
+    flush_run()
+    out.write(z.compress(b'E' + struct.pack('>Qd32s', size, backup_s, sha.digest())))
+    out.write(z.flush())
+    out.flush()
+finally:
+    os.remove(tmp)
+'''
+
+
+def block_checksums(path, block_size=BLOCK_SIZE):
+    # Weak + strong checksum of every block of the local copy (empty without one)
+    if not path or not os.path.exists(path):
+        return b''
+    sums = bytearray()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(block_size)
+            if not data:
+                break
+            sums += CHECKSUM.pack(zlib.adler32(data), hashlib.blake2b(data, digest_size=16).digest())
+    return bytes(sums)
+
+
+class DeltaDecoder:
+    # Applies the server's op stream: C (copy local blocks), L (literal), E (size, backup time, sha256)
+    def __init__(self, base_path, out, block_size):
+        self.base = open(base_path, 'rb') if base_path and os.path.exists(base_path) else None
+        self.out = out
+        self.block_size = block_size
+        self.sha = hashlib.sha256()
+        self.inflate = zlib.decompressobj()
+        self.buffer = bytearray()
+        self.end = None
+        self.stats = {'wire_bytes': 0, 'copied_bytes': 0, 'literal_bytes': 0, 'copy_runs': 0, 'literal_ops': 0}
+
+    def _write(self, data):
+        self.out.write(data)
+        self.sha.update(data)
+
+    def feed(self, data):
+        self.stats['wire_bytes'] += len(data)
+        self.buffer += self.inflate.decompress(data)
+        while self.buffer:
+            op = self.buffer[0:1]
+            if op == b'C':
+                if len(self.buffer) < 1 + COPY.size:
+                    return
+                start, count = COPY.unpack_from(self.buffer, 1)
+                del self.buffer[:1 + COPY.size]
+                self.base.seek(start * self.block_size)
+                remaining = count * self.block_size
+                while remaining:
+                    chunk = self.base.read(min(remaining, BUFFER_SIZE))
+                    if not chunk:
+                        break  # last local block was partial
+                    self._write(chunk)
+                    self.stats['copied_bytes'] += len(chunk)
+                    remaining -= len(chunk)
+                self.stats['copy_runs'] += 1
+            elif op == b'L':
+                if len(self.buffer) < 1 + LITERAL.size:
+                    return
+                length, = LITERAL.unpack_from(self.buffer, 1)
+                end = 1 + LITERAL.size + length
+                if len(self.buffer) < end:
+                    return
+                self._write(bytes(self.buffer[1 + LITERAL.size:end]))
+                del self.buffer[:end]
+                self.stats['literal_bytes'] += length
+                self.stats['literal_ops'] += 1
+            elif op == b'E':
+                if len(self.buffer) < 1 + END.size:
+                    return
+                self.end = END.unpack_from(self.buffer, 1)
+                del self.buffer[:1 + END.size]
+            else:
+                raise ValueError(f'unexpected op {op!r} in snapshot stream')
+
+    def close(self):
+        if self.base:
+            self.base.close()
+
+
+def pull_snapshot(session, remote_db=REMOTE_DB, output=DEFAULT_OUTPUT, block_size=BLOCK_SIZE, full=False):
+    start = time.perf_counter()
+    base = None if full else output
+    sums = block_checksums(base, block_size)
+    checksum_seconds = time.perf_counter() - start
+
+    script = base64.b64encode(SNAPSHOT_SCRIPT.encode()).decode()
+    cmd = (f"{REMOTE_PYTHON} -c \"import base64;exec(base64.b64decode('{script}'))\" "
+           f"{shlex.quote(remote_db)} {int(block_size)}")
+    tmp_path = f'{output}.{os.getpid()}.part'
+    channel = session.open_channel(cmd)
+    try:
+        channel.sendall(sums)
+        channel.shutdown_write()
+        transfer_start = time.perf_counter()
+        first_byte = None
+        with open(tmp_path, 'wb') as out:
+            decoder = DeltaDecoder(base, out, block_size)
+            try:
+                while True:
+                    data = channel.recv(BUFFER_SIZE)
+                    if not data:
+                        break
+                    first_byte = first_byte or time.perf_counter() - transfer_start
+                    decoder.feed(data)
+            finally:
+                decoder.close()
+        exit_status = channel.recv_exit_status()
+        errors = b''
+        while channel.recv_stderr_ready():
+            errors += channel.recv_stderr(BUFFER_SIZE)
+    except BaseException:
+        # A broken stream (bad op, short read, interrupted pull) leaves no partial file behind
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    finally:
+        channel.close()
+
+    if exit_status != 0 or decoder.end is None:
+        os.remove(tmp_path)
+        raise RuntimeError(f"snapshot failed (status {exit_status}): {errors.decode('utf-8', 'replace')[:500]}")
+    size, backup_seconds, digest = decoder.end
+    if os.path.getsize(tmp_path) != size or decoder.sha.digest() != digest:
+        os.remove(tmp_path)
+        raise RuntimeError('rebuilt snapshot does not match the server copy (checksum mismatch)')
+    os.replace(tmp_path, output)
+
+    elapsed = time.perf_counter() - start
+    stats = decoder.stats
+    return {
+        'output': os.path.abspath(output),
+        'db_bytes': size,
+        'incremental': bool(sums),
+        'block_size': block_size,
+        'checksum_upload_bytes': len(sums),
+        'wire_bytes': stats['wire_bytes'],
+        'literal_bytes': stats['literal_bytes'],
+        'copied_bytes': stats['copied_bytes'],
+        'reused_ratio': round(stats['copied_bytes'] / size, 3) if size else 0.0,
+        'transfer_ratio': round((stats['wire_bytes'] + len(sums)) / size, 4) if size else 0.0,
+        'copy_runs': stats['copy_runs'],
+        'remote_backup_s': round(backup_seconds, 3),
+        'checksum_s': round(checksum_seconds, 3),
+        'first_byte_s': round(first_byte or 0.0, 3),
+        'seconds': round(elapsed, 3),
+        'mb_per_sec_effective': round(size / elapsed / 1024 / 1024, 2) if elapsed else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pull a consistent snapshot of the production DB, transferring only changed blocks')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--remote-db', default=REMOTE_DB)
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='Local snapshot (updated in place on later pulls)')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE)
+    parser.add_argument('--full', action='store_true', help='Ignore the local copy and transfer everything')
+    parser.add_argument('--check', action='store_true', help='Run PRAGMA quick_check on the pulled snapshot')
+    args = parser.parse_args()
+
+    print("=== REMOTE DB SNAPSHOT ===")
+    pwd = read_password()
+    try:
+        with SshSession(args.host, USER, pwd) as session:
+            print("✅ SSH Connected")
+            mode = "full" if args.full or not os.path.exists(args.output) else "incremental"
+            print(f"📥 Pulling {args.remote_db} ({mode})...")
+            stats = pull_snapshot(session, args.remote_db, args.output, args.block_size, args.full)
+        if args.check:
+            import sqlite3
+            conn = sqlite3.connect(f'file:{args.output}?mode=ro', uri=True)
+            stats['quick_check'] = conn.execute('PRAGMA quick_check').fetchone()[0]
+            conn.close()
+        print(json.dumps(stats, indent=2))
+        print(f"✅ Snapshot saved: {stats['db_bytes']} bytes, {stats['wire_bytes'] + stats['checksum_upload_bytes']} "
+              f"transferred ({stats['transfer_ratio'] * 100:.2f}%) in {stats['seconds']}s")
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,48 +1,197 @@
-import paramiko
 import sys
+import json
+import math
 import time
+import shlex
+import select
+import argparse
 
-# Configuration
-HOST = '45.9.41.232'
-USER = 'root'
-PASS_FILE = 'deploy_password.txt'
+from ssh_session import HOST, USER, SessionPool, SshSession, read_password
 
-def read_password():
-    try:
-        with open(PASS_FILE, 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    except FileNotFoundError:
-        print(f"Error: {PASS_FILE} not found.")
-        sys.exit(1)
+BACKEND_DIR = '/root/eubike/backend'
+HUNT_SCRIPT = 'scripts/manual_hunt_verbose.js'
+DEFAULT_BANDS = '0-800,800-1500,1500-3000,3000-10000'
+PER_HOST = 3                # concurrent shards per host (they share the server's DB and egress IP)
+
+def hunt_command(steps=()):
+    return f"cd {BACKEND_DIR} && node {HUNT_SCRIPT}" + "".join(f" --step {shlex.quote(step)}" for step in steps)
+
+def load_plan(session):
+    # The default plan lives in manual_hunt_verbose.js; --plan prints it without starting the hunter
+    result = session.run(hunt_command() + " --plan")
+    if result.exit_status != 0:
+        raise RuntimeError(f"could not read hunt plan: {result.stderr or result.error}")
+    return [command for _, command in json.loads(result.stdout.strip().splitlines()[-1])]
+
+def step_bikes(command):
+    count = command.split()[0]
+    return int(count) if count.isdigit() else 0
+
+def shards_by_category(plan, max_shards=None):
+    # "20 mtb enduro" -> shard "mtb"; with max_shards, largest groups are spread first (LPT)
+    groups = {}
+    for command in plan:
+        groups.setdefault(command.split()[1], []).append(command)
+    if not max_shards or max_shards >= len(groups):
+        return [(name, steps) for name, steps in groups.items()]
+    bins = [[[], [], 0] for _ in range(max_shards)]
+    for name, steps in sorted(groups.items(), key=lambda item: -sum(map(step_bikes, item[1]))):
+        target = min(bins, key=lambda b: b[2])
+        target[0].append(name)
+        target[1].extend(steps)
+        target[2] += sum(map(step_bikes, steps))
+    return [('+'.join(names), steps) for names, steps, _ in bins if steps]
+
+def shards_by_price(plan, bands):
+    # Every shard runs the whole plan within one price band; bike counts are split across bands
+    shards = []
+    for band in bands:
+        steps = []
+        for command in plan:
+            count, rest = command.split(maxsplit=1)
+            steps.append(f"{max(1, math.ceil(int(count) / len(bands)))} {rest} {band}")
+        shards.append((f"price {band}", steps))
+    return shards
+
+def shards_by_page(url_template, pages):
+    # Search-URL mode of the hunter, one result page per shard
+    first, _, last = pages.partition('-')
+    return [(f"page {page}", [url_template.format(page=page)]) for page in range(int(first), int(last or first) + 1)]
+
+def run_shards(pool, shards, per_host=PER_HOST):
+    # Launch shards on free host slots and multiplex every channel into one tagged stream
+    pending = list(shards)
+    slots = {host: per_host for host in pool.sessions}
+    running = {}
+    finished = []
+    width = max(len(label) for label, _ in shards)
+    start = time.perf_counter()
+
+    def launch():
+        for host in pool.sessions:
+            while slots[host] and pending:
+                label, steps = pending.pop(0)
+                try:
+                    channel = pool.session(host).open_channel(hunt_command(steps))
+                except Exception as e:
+                    finished.append({'shard': label, 'host': host, 'exit_status': None, 'error': str(e),
+                                     'seconds': 0.0, 'lines': 0})
+                    print(f"[{label:<{width}}] ❌ could not start on {host}: {e}")
+                    continue
+                slots[host] -= 1
+                running[channel] = {'shard': label, 'host': host, 'started': time.perf_counter(),
+                                    'buffer': b'', 'lines': 0}
+                print(f"[{label:<{width}}] 🚀 started on {host} ({len(steps)} sub-hunts)")
+
+    def emit(state, data, final=False):
+        state['buffer'] += data
+        *lines, state['buffer'] = state['buffer'].split(b'\n')
+        if final and state['buffer']:
+            lines.append(state['buffer'])
+            state['buffer'] = b''
+        for line in lines:
+            state['lines'] += 1
+            text = line.rstrip(b'\r').decode('utf-8', errors='replace')
+            print(f"[{state['shard']:<{width}}] {text}")
+
+    launch()
+    while running:
+        readable, _, _ = select.select(list(running), [], [], 0.5)
+        for channel in readable or list(running):
+            state = running[channel]
+            while channel.recv_ready():
+                emit(state, channel.recv(65536))
+            while channel.recv_stderr_ready():
+                emit(state, channel.recv_stderr(65536))
+            if channel.exit_status_ready() and not channel.recv_ready() and not channel.recv_stderr_ready():
+                emit(state, b'', final=True)
+                status = channel.recv_exit_status()
+                seconds = round(time.perf_counter() - state['started'], 1)
+                channel.close()
+                del running[channel]
+                slots[state['host']] += 1
+                finished.append({'shard': state['shard'], 'host': state['host'], 'exit_status': status,
+                                 'seconds': seconds, 'lines': state['lines']})
+                print(f"[{state['shard']:<{width}}] {'✅' if status == 0 else '❌'} finished in {seconds}s (status {status})")
+        launch()
+
+    total = round(time.perf_counter() - start, 1)
+    shard_seconds = sum(result['seconds'] for result in finished)
+    return {
+        'shards': finished,
+        'total_seconds': total,
+        'shard_seconds': round(shard_seconds, 1),
+        'speedup': round(shard_seconds / total, 2) if total else 0.0,
+        'failed': [result['shard'] for result in finished if result['exit_status'] != 0],
+    }
+
+def run_single(pwd):
+    session = SshSession(HOST, USER, pwd).connect()
+    print("✅ SSH Connected")
+
+    print("🚀 Executing Manual Hunt on Remote...")
+    # Lines are streamed as the channel receives them, not after the hunt finishes
+    lines = session.stream(hunt_command(), get_pty=True)
+    while True:
+        try:
+            print(next(lines).strip())
+        except StopIteration as done:
+            exit_status = done.value
+            break
+
+    if exit_status == 0:
+        print("✅ Remote Hunt Complete Success.")
+    else:
+        print(f"❌ Remote Hunt Failed with status {exit_status}")
+
+    session.close()
+    return exit_status
 
 def main():
+    parser = argparse.ArgumentParser(description='Trigger the manual hunt on the server, optionally sharded')
+    parser.add_argument('--shard-by', choices=['category', 'price', 'page'],
+                        help='Split the hunt into shards that run concurrently (default: one serial hunt)')
+    parser.add_argument('--hosts', default=HOST, help='Comma-separated hosts to spread the shards over')
+    parser.add_argument('--per-host', type=int, default=PER_HOST, help='Concurrent shards per host')
+    parser.add_argument('--shards', type=int, help='With --shard-by category: merge categories into at most N shards')
+    parser.add_argument('--bands', default=DEFAULT_BANDS, help='With --shard-by price: comma-separated EUR bands')
+    parser.add_argument('--search-url', help="With --shard-by page: search URL with a {page} placeholder")
+    parser.add_argument('--pages', default='1-5', help='With --shard-by page: page range, e.g. 1-5')
+    args = parser.parse_args()
+
     print("=== REMOTE HUNTER TRIGGER (10 BIKES) ===")
     pwd = read_password()
-    
+
     try:
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(HOST, username=USER, password=pwd)
-        print("✅ SSH Connected")
-        
-        print("🚀 Executing Manual Hunt on Remote...")
-        # We use unbuffered output to see logs in real-time if possible, 
-        # but paramiko exec_command blocks until channel closes usually for full output.
-        # We can read from stdout in loop.
-        
-        cmd = "cd /root/eubike/backend && node scripts/manual_hunt_verbose.js"
-        stdin, stdout, stderr = client.exec_command(cmd, get_pty=True)
-        
-        for line in stdout:
-            print(line.strip())
-            
-        exit_status = stdout.channel.recv_exit_status()
-        if exit_status == 0:
-            print("✅ Remote Hunt Complete Success.")
-        else:
-            print(f"❌ Remote Hunt Failed with status {exit_status}")
-            
-        client.close()
+        if not args.shard_by:
+            sys.exit(0 if run_single(pwd) == 0 else 1)
+
+        hosts = [host.strip() for host in args.hosts.split(',') if host.strip()]
+        with SessionPool(hosts, USER, pwd) as pool:
+            print(f"✅ SSH Connected to {len(hosts)} host(s)")
+            if args.shard_by == 'page':
+                if not args.search_url or '{page}' not in args.search_url:
+                    parser.error('--shard-by page needs --search-url with a {page} placeholder')
+                shards = shards_by_page(args.search_url, args.pages)
+            else:
+                plan = load_plan(pool.session(hosts[0]))
+                if args.shard_by == 'category':
+                    shards = shards_by_category(plan, args.shards)
+                else:
+                    shards = shards_by_price(plan, [band.strip() for band in args.bands.split(',') if band.strip()])
+            print(f"🚀 Executing {len(shards)} hunt shards ({args.shard_by}) on {len(hosts)} host(s)...")
+            report = run_shards(pool, shards, args.per_host)
+
+        print("\n=== SHARD SUMMARY ===")
+        for result in report['shards']:
+            print(f"   {result['shard']}: {result['host']} status {result['exit_status']}, "
+                  f"{result['seconds']}s, {result['lines']} lines")
+        print(f"   Total: {report['total_seconds']}s wall, {report['shard_seconds']}s of shard time "
+              f"(x{report['speedup']} vs serial)")
+        if report['failed']:
+            print(f"❌ Remote Hunt finished with failed shards: {', '.join(report['failed'])}")
+            sys.exit(1)
+        print("✅ Remote Hunt Complete Success.")
 
     except Exception as e:
         print(f"❌ Error: {e}")
@@ -0,0 +1,267 @@
+import os
+import sys
+import json
+import time
+import select
+import argparse
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import paramiko
+
+# Shared SSH session for the remote_* scripts and the hunter probe.
+#
+# One authenticated transport per host, kept alive with SSH keepalives and re-established
+# transparently when it drops. Every command gets its own channel on that transport, so
+# independent commands run concurrently without new TCP/SSH handshakes (sshd's default
+# MaxSessions is 10, hence MAX_CHANNELS). SessionPool fans the same command out to several
+# hosts at once and aggregates the results. SshSession also exposes exec_command /
+# get_transport / open_sftp, so code written against paramiko.SSHClient (remote_fetch,
+# fetch_html_remote) takes a session unchanged.
+
+HOST = '45.9.41.232'
+USER = 'root'
+PASS_FILE = 'deploy_password.txt'
+KEEPALIVE_SECONDS = 30
+CONNECT_TIMEOUT = 10
+CONNECT_ATTEMPTS = 3
+MAX_CHANNELS = 8
+BUFFER_SIZE = 64 * 1024
+
+CommandResult = namedtuple('CommandResult', 'host command exit_status stdout stderr seconds error')
+
+
+def read_password(path=PASS_FILE):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        print(f"Error: {path} not found.")
+        sys.exit(1)
+
+
+def collect_output(channel, timeout=None):
+    # Drain stdout and stderr together (reading one to EOF first can deadlock on a full
+    # stderr window); returns (exit_status, stdout bytes, stderr bytes).
+    # The exit status is checked before draining: output that arrived ahead of it is then
+    # guaranteed to be read in the same pass, not dropped by a break in between
+    out, err = [], []
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        exited = channel.exit_status_ready()
+        received = False
+        while channel.recv_ready():
+            out.append(channel.recv(BUFFER_SIZE))
+            received = True
+        while channel.recv_stderr_ready():
+            err.append(channel.recv_stderr(BUFFER_SIZE))
+            received = True
+        if exited:
+            break
+        if not received:
+            if deadline and time.monotonic() > deadline:
+                channel.close()
+                raise TimeoutError(f'command still running after {timeout}s')
+            select.select([channel], [], [], 0.2)
+    return channel.recv_exit_status(), b''.join(out), b''.join(err)
+
+
+class SshSession:
+    def __init__(self, host=HOST, user=USER, password=None, port=22, keepalive=KEEPALIVE_SECONDS,
+                 connect_timeout=CONNECT_TIMEOUT):
+        self.host = host
+        self.user = user
+        self.password = password
+        self.port = port
+        self.keepalive = keepalive
+        self.connect_timeout = connect_timeout
+        self.client = None
+        self.stats = {'connects': 0, 'reconnects': 0, 'channels': 0, 'commands': 0}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self.connect()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _alive(self):
+        transport = self.client.get_transport() if self.client else None
+        return transport is not None and transport.is_active()
+
+    def connect(self, force=False):
+        with self._lock:
+            if self._alive() and not force:
+                return self
+            if self.client is not None:
+                self.client.close()
+                self.stats['reconnects'] += 1
+            for attempt in range(CONNECT_ATTEMPTS):
+                try:
+                    client = paramiko.SSHClient()
+                    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+                    client.connect(self.host, port=self.port, username=self.user, password=self.password,
+                                   timeout=self.connect_timeout)
+                    break
+                except (paramiko.SSHException, OSError):
+                    if attempt == CONNECT_ATTEMPTS - 1:
+                        raise
+                    time.sleep(2 ** attempt)
+            client.get_transport().set_keepalive(self.keepalive)
+            self.client = client
+            self.stats['connects'] += 1
+            return self
+
+    def get_transport(self):
+        self.connect()
+        return self.client.get_transport()
+
+    def open_channel(self, command, get_pty=False):
+        # A started exec channel; a dead transport is reconnected once before giving up
+        for attempt in range(2):
+            try:
+                channel = self.get_transport().open_session()
+                break
+            except (paramiko.SSHException, EOFError, OSError):
+                if attempt:
+                    raise
+                self.connect(force=True)
+        if get_pty:
+            channel.get_pty()
+        channel.exec_command(command)
+        with self._lock:
+            self.stats['channels'] += 1
+        return channel
+
+    def exec_command(self, command, get_pty=False):
+        # Same contract as paramiko.SSHClient.exec_command
+        channel = self.open_channel(command, get_pty)
+        return channel.makefile_stdin('wb'), channel.makefile('r'), channel.makefile_stderr('r')
+
+    def open_sftp(self):
+        return self.get_transport().open_sftp_client()
+
+    def run(self, command, timeout=None, input=None, get_pty=False):
+        start = time.perf_counter()
+        try:
+            channel = self.open_channel(command, get_pty)
+            try:
+                if input is not None:
+                    channel.sendall(input.encode('utf-8') if isinstance(input, str) else input)
+                    channel.shutdown_write()
+                status, out, err = collect_output(channel, timeout)
+            finally:
+                channel.close()
+            error = None
+        except Exception as e:
+            status, out, err, error = None, b'', b'', str(e)
+        with self._lock:
+            self.stats['commands'] += 1
+        return CommandResult(self.host, command, status, out.decode('utf-8', errors='replace'),
+                             err.decode('utf-8', errors='replace'), round(time.perf_counter() - start, 3), error)
+
+    def run_many(self, commands, workers=MAX_CHANNELS, timeout=None):
+        # Concurrent channels on the one transport; results in the order of commands
+        self.connect()
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(commands) or 1))) as executor:
+            return list(executor.map(lambda command: self.run(command, timeout), commands))
+
+    def stream(self, command, get_pty=False):
+        # Yields stdout lines as they arrive; the generator's return value is the exit status
+        channel = self.open_channel(command, get_pty)
+        pending = b''
+        try:
+            while True:
+                # Same order as collect_output: exit status first, then drain both streams
+                exited = channel.exit_status_ready()
+                received = False
+                while channel.recv_ready():
+                    pending += channel.recv(BUFFER_SIZE)
+                    *lines, pending = pending.split(b'\n')
+                    for line in lines:
+                        yield line.rstrip(b'\r').decode('utf-8', errors='replace')
+                    received = True
+                while channel.recv_stderr_ready():
+                    for line in channel.recv_stderr(BUFFER_SIZE).splitlines():
+                        yield line.decode('utf-8', errors='replace')
+                    received = True
+                if exited:
+                    break
+                if not received:
+                    select.select([channel], [], [], 0.2)
+            if pending:
+                yield pending.rstrip(b'\r').decode('utf-8', errors='replace')
+            return channel.recv_exit_status()
+        finally:
+            channel.close()
+
+    def close(self):
+        with self._lock:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
+
+
+class SessionPool:
+    def __init__(self, hosts, user=USER, password=None, **session_options):
+        self.sessions = {host: SshSession(host, user, password, **session_options) for host in hosts}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def session(self, host):
+        return self.sessions[host]
+
+    def run_all(self, command, timeout=None):
+        # Same command on every host concurrently; a host that cannot connect is a failed result
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, len(self.sessions))) as executor:
+            results = list(executor.map(lambda session: session.run(command, timeout), self.sessions.values()))
+        ok = [result.host for result in results if result.exit_status == 0]
+        summary = {
+            'hosts': len(results),
+            'ok': ok,
+            'failed': [result.host for result in results if result.exit_status != 0],
+            'slowest': max(results, key=lambda result: result.seconds).host if results else None,
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+        return {'results': results, 'summary': summary}
+
+    def close(self):
+        for session in self.sessions.values():
+            session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run commands over one shared SSH session per host')
+    parser.add_argument('commands', nargs='+', help='Remote commands (several run concurrently on one transport)')
+    parser.add_argument('--hosts', default=HOST, help='Comma-separated hosts; the commands are fanned out to all of them')
+    parser.add_argument('--user', default=USER)
+    parser.add_argument('--password-file', default=PASS_FILE)
+    parser.add_argument('--timeout', type=float, help='Per-command timeout in seconds')
+    args = parser.parse_args()
+
+    password = read_password(args.password_file) if os.path.exists(args.password_file) else None
+    hosts = [host.strip() for host in args.hosts.split(',') if host.strip()]
+    with SessionPool(hosts, args.user, password) as pool:
+        output = []
+        for command in args.commands if len(hosts) > 1 else []:
+            fanned = pool.run_all(command, args.timeout)
+            output.append({'command': command, 'summary': fanned['summary'],
+                           'results': [result._asdict() for result in fanned['results']]})
+        if len(hosts) == 1:
+            session = pool.session(hosts[0])
+            output = [result._asdict() for result in session.run_many(args.commands, timeout=args.timeout)]
+            output.append({'session': session.stats})
+    print(json.dumps(output, indent=2, ensure_ascii=False))
+    failed = any(item.get('exit_status', 0) != 0 or item.get('summary', {}).get('failed') for item in output)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
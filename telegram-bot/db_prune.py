@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Batched, transactional pruning of the catalog database
+Пакетная очистка таблиц рабочей базы без долгих блокировок
+
+Вместо одного DELETE на всю таблицу строки удаляются пачками: каждая пачка -
+отдельная транзакция BEGIN IMMEDIATE, курсор идет по rowid, поэтому таблица
+просматривается один раз. Размер пачки подстраивается так, чтобы блокировка
+записи держалась не дольше max_lock_ms, между пачками приложение успевает
+записать свое. Можно удалять не все, а по возрасту (--older-than-days) и/или
+условию (--where). После удаления - checkpoint WAL, по желанию VACUUM.
+Отчет: строки в секунду, суммарное и максимальное время блокировки.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(SCRIPT_DIR, '..', 'backend', 'database', 'eubike.db')
+BATCH_SIZE = 2000
+MIN_BATCH = 100
+MAX_BATCH = 50000
+MAX_LOCK_MS = 50.0
+PAUSE_SECONDS = 0.01            # минимальное окно для писателей приложения между пачками
+# Пауза после пачки не короче ее блокировки, умноженной на YIELD_RATIO: обработчик занятости
+# SQLite у писателя спит с нарастающими интервалами (до 100 мс) и иначе не успевает в короткое окно
+YIELD_RATIO = 1.0
+CHECKPOINT_EVERY = 20           # пачек между PASSIVE checkpoint, чтобы WAL не разрастался
+BUSY_TIMEOUT_MS = 30000
+
+# Колонка возраста строки по таблицам; для остальных - первая найденная из DATE_COLUMNS
+AGE_COLUMNS = {'market_history': 'COALESCE(scraped_at, created_at)'}
+DATE_COLUMNS = ('created_at', 'updated_at', 'last_checked', 'last_scanned_at')
+
+
+def age_expression(conn: sqlite3.Connection, table: str) -> str:
+    if table in AGE_COLUMNS:
+        return AGE_COLUMNS[table]
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for column in DATE_COLUMNS:
+        if column in columns:
+            return column
+    raise ValueError(f'В таблице {table} нет колонки с датой ({", ".join(DATE_COLUMNS)})')
+
+
+def build_predicate(conn: sqlite3.Connection, table: str, older_than_days: Optional[float] = None,
+                    where: Optional[str] = None) -> Tuple[str, List[Any]]:
+    clauses, params = [], []
+    if older_than_days is not None:
+        clauses.append(f"CAST(strftime('%s', {age_expression(conn, table)}) AS INTEGER) < ?")
+        params.append(int(time.time() - older_than_days * 86400))
+    if where:
+        clauses.append(f'({where})')
+    return ' AND '.join(clauses) or '1', params
+
+
+def check_tables(conn: sqlite3.Connection, tables: Sequence[str], older_than_days: Optional[float] = None,
+                 where: Optional[str] = None) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Проверка условия для всех таблиц до первого удаления: (годные таблицы, {таблица: причина пропуска}).
+    Иначе ошибка в третьей таблице обрывает очистку, когда первые две уже удалены и закоммичены.
+    """
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    valid: List[str] = []
+    skipped: Dict[str, str] = {}
+    for table in tables:
+        if table not in existing:
+            skipped[table] = 'no such table'
+            continue
+        try:
+            predicate, params = build_predicate(conn, table, older_than_days, where)
+            conn.execute(f'EXPLAIN SELECT rowid FROM {table} WHERE {predicate}', params)
+        except (ValueError, sqlite3.Error) as e:
+            skipped[table] = str(e)
+            continue
+        valid.append(table)
+    return valid, skipped
+
+
+def prune_table(conn: sqlite3.Connection, table: str, older_than_days: Optional[float] = None,
+                where: Optional[str] = None, batch_size: int = BATCH_SIZE, max_lock_ms: float = MAX_LOCK_MS,
+                pause: float = PAUSE_SECONDS, limit: Optional[int] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Удалить строки table, подходящие под условие, пачками по транзакции.
+
+    Соединение должно быть в режиме autocommit (isolation_level=None):
+    транзакциями управляет сама функция.
+    """
+    predicate, params = build_predicate(conn, table, older_than_days, where)
+    stats: Dict[str, Any] = {'table': table, 'predicate': predicate, 'deleted': 0, 'batches': 0,
+                             'lock_ms_total': 0.0, 'lock_ms_max': 0.0, 'lock_wait_ms': 0.0}
+    if dry_run:
+        stats['matching'] = conn.execute(f'SELECT COUNT(*) FROM {table} WHERE {predicate}', params).fetchone()[0]
+        return stats
+
+    start = time.perf_counter()
+    last_rowid = -1 << 63
+    while limit is None or stats['deleted'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - stats['deleted'])
+        requested = time.perf_counter()
+        conn.execute('BEGIN IMMEDIATE')
+        locked = time.perf_counter()
+        try:
+            rowids = conn.execute(f'SELECT rowid FROM {table} WHERE rowid > ? AND {predicate} ORDER BY rowid LIMIT ?',
+                                  [last_rowid] + params + [size]).fetchall()
+            deleted = 0
+            if rowids:
+                # Под блокировкой записи набор строк в диапазоне не меняется - удаляем его одним запросом
+                deleted = conn.execute(f'DELETE FROM {table} WHERE rowid > ? AND rowid <= ? AND {predicate}',
+                                       [last_rowid, rowids[-1][0]] + params).rowcount
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        lock_ms = (time.perf_counter() - locked) * 1000
+        stats['lock_wait_ms'] += (locked - requested) * 1000
+        stats['lock_ms_total'] += lock_ms
+        stats['lock_ms_max'] = max(stats['lock_ms_max'], lock_ms)
+        if not rowids:
+            break
+        last_rowid = rowids[-1][0]
+        stats['deleted'] += deleted
+        stats['batches'] += 1
+
+        # Пачка держит блокировку дольше цели - уменьшаем, заметно быстрее - увеличиваем
+        if lock_ms > max_lock_ms:
+            batch_size = max(MIN_BATCH, int(batch_size / 2))
+        elif lock_ms < max_lock_ms / 2:
+            batch_size = min(MAX_BATCH, int(batch_size * 1.5))
+        if stats['batches'] % CHECKPOINT_EVERY == 0:
+            conn.execute('PRAGMA wal_checkpoint(PASSIVE)')
+        if len(rowids) < size:
+            break
+        time.sleep(max(pause, lock_ms / 1000 * YIELD_RATIO))
+
+    seconds = time.perf_counter() - start
+    stats.update(
+        seconds=round(seconds, 3),
+        rows_per_sec=round(stats['deleted'] / seconds) if seconds else 0,
+        final_batch_size=batch_size,
+        lock_ms_total=round(stats['lock_ms_total'], 1),
+        lock_ms_max=round(stats['lock_ms_max'], 1),
+        lock_wait_ms=round(stats['lock_wait_ms'], 1),
+    )
+    return stats
+
+
+def checkpoint(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """TRUNCATE checkpoint: перенести WAL в базу и обрезать файл (в режиме rollback journal - ничего)"""
+    if conn.execute('PRAGMA journal_mode').fetchone()[0].lower() != 'wal':
+        return {'journal_mode': 'not wal'}
+    start = time.perf_counter()
+    busy, log_pages, checkpointed = conn.execute('PRAGMA wal_checkpoint(TRUNCATE)').fetchone()
+    return {'busy': bool(busy), 'wal_pages': log_pages, 'checkpointed': checkpointed,
+            'seconds': round(time.perf_counter() - start, 3)}
+
+
+def vacuum(conn: sqlite3.Connection) -> Dict[str, Any]:
+    """incremental_vacuum при auto_vacuum=INCREMENTAL (короткая блокировка), иначе полный VACUUM"""
+    start = time.perf_counter()
+    free_before = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+        conn.execute('PRAGMA incremental_vacuum').fetchall()
+        mode = 'incremental'
+    else:
+        conn.execute('VACUUM')
+        mode = 'full'
+    return {'mode': mode, 'free_pages_before': free_before,
+            'free_pages_after': conn.execute('PRAGMA freelist_count').fetchone()[0],
+            'seconds': round(time.perf_counter() - start, 3)}
+
+
+def _file_size(db_path: str) -> int:
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+
+def prune(db_path: str, tables: Sequence[str], older_than_days: Optional[float] = None, where: Optional[str] = None,
+          batch_size: int = BATCH_SIZE, max_lock_ms: float = MAX_LOCK_MS, pause: float = PAUSE_SECONDS,
+          run_vacuum: bool = False, foreign_keys: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    """Очистить несколько таблиц, затем checkpoint WAL и (по желанию) VACUUM"""
+    conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT_MS / 1000, isolation_level=None)
+    conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    # Каскадные удаления (bike_images, bike_specs, ...) утяжеляют пачку; по умолчанию как sqlite3 CLI - выключены
+    conn.execute(f"PRAGMA foreign_keys = {'ON' if foreign_keys else 'OFF'}")
+    report: Dict[str, Any] = {'db_bytes_before': _file_size(db_path), 'tables': []}
+    start = time.perf_counter()
+    try:
+        _, skipped = check_tables(conn, tables, older_than_days, where)
+        for table in tables:
+            if table in skipped:
+                report['tables'].append({'table': table, 'skipped': skipped[table]})
+                continue
+            report['tables'].append(prune_table(conn, table, older_than_days, where, batch_size,
+                                                max_lock_ms, pause, dry_run=dry_run))
+        if not dry_run:
+            report['checkpoint'] = checkpoint(conn)
+            if run_vacuum:
+                report['vacuum'] = vacuum(conn)
+                report['checkpoint_after_vacuum'] = checkpoint(conn)
+    finally:
+        conn.close()
+    report['db_bytes_after'] = _file_size(db_path)
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    deleted = sum(table.get('deleted', 0) for table in report['tables'])
+    report['deleted'] = deleted
+    report['rows_per_sec'] = round(deleted / report['seconds']) if report['seconds'] else 0
+    report['lock_ms_max'] = max([table.get('lock_ms_max', 0.0) for table in report['tables']] + [0.0])
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Batched, transactional pruning of catalog tables')
+    parser.add_argument('tables', nargs='+', help='Таблицы для очистки')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite база каталога')
+    parser.add_argument('--older-than-days', type=float, help='Удалять только строки старше N дней')
+    parser.add_argument('--where', help="Дополнительное SQL-условие, например \"is_active = 0\"")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Начальный размер пачки')
+    parser.add_argument('--max-lock-ms', type=float, default=MAX_LOCK_MS, help='Целевое время блокировки на пачку')
+    parser.add_argument('--pause', type=float, default=PAUSE_SECONDS, help='Пауза между пачками, сек')
+    parser.add_argument('--vacuum', action='store_true', help='После удаления вернуть место (VACUUM)')
+    parser.add_argument('--foreign-keys', action='store_true', help='Включить внешние ключи (каскадные удаления)')
+    parser.add_argument('--dry-run', action='store_true', help='Только посчитать подходящие строки')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База не найдена: {args.db}", file=sys.stderr)
+        sys.exit(1)
+    report = prune(args.db, args.tables, args.older_than_days, args.where, args.batch_size, args.max_lock_ms,
+                   args.pause, args.vacuum, args.foreign_keys, args.dry_run)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+Table-driven normalization of listing fields
+Нормализация полей объявлений: цена, год, размер рамы, даты
+
+Одни и те же правила для hunter (scripts/legacy-root) и groq-parser.py.
+Скалярные функции повторяют прежнюю логику hunter один в один. Колоночные
+функции принимают список/массив сырых строк и возвращают массивы NumPy:
+
+- цена разбирается без регулярных выражений. Строки превращаются в матрицу
+  кодовых точек, по таблице классов символов (цифра / точка / запятая / прочее)
+  векторно определяются разделители и собирается мантисса;
+- даты dd.mm.yyyy разбираются по позициям символов, остальные форматы идут
+  через таблицу шаблонов с кэшем по уникальным значениям;
+- год и размер ищутся скомпилированными шаблонами, результат кэшируется
+  по уникальным строкам (в колонке много повторов).
+"""
+
+import re
+import sys
+import json
+import time
+import argparse
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PRICE_STRIP_RE = re.compile(r'[^0-9.,]')
+PRICE_THOUSANDS_RE = re.compile(r'.*\.\d{3}$')
+NEGOTIABLE_RE = re.compile(r'VB|Verhandlungsbasis')
+YEAR_RE = re.compile(r'(?:Neukauf|Rechnung|Baujahr|Year)\s*[:\s]*(\d{2}[./]\d{2}|\d{4})', re.IGNORECASE)
+SIZE_RE = re.compile(r'(?:Rahmengröße|Größe|Size)\s*[:\s-]*([LMS]|XL|XXL|\d{2}\s*cm|\d{2}\s*Zoll)', re.IGNORECASE)
+SIZE_TITLE_RE = re.compile(r'\b(L|XL|M|S)\b')
+
+# Размер рамы: буквенные обозначения и синонимы -> каноническая форма
+SIZE_ALIASES = {
+    'xxs': 'XXS', 'xs': 'XS', 's': 'S', 'm': 'M', 'l': 'L', 'xl': 'XL', 'xxl': 'XXL',
+    'small': 'S', 'medium': 'M', 'mittel': 'M', 'large': 'L', 'groß': 'L', 'gross': 'L',
+    'extra small': 'XS', 'extra large': 'XL',
+}
+SIZE_PREFIX_RE = re.compile(r'^(?:rahmen)?größe\s*[:\-]?\s*')
+SIZE_NUMBER_RE = re.compile(r'^(\d{2}(?:[.,]5)?)\s*(cm|zoll|inch|in|"|”|\'\')?$', re.IGNORECASE)
+FRAME_CM_RANGE = (40, 66)       # шоссе/горные рамы в см
+FRAME_INCH_RANGE = (12, 24)     # рамы в дюймах; 26/27.5/29 - это колеса
+INCH_UNITS = {'zoll', 'inch', 'in', '"', '”', "''"}
+
+# Даты: относительные слова Kleinanzeigen и форматы (шаблон, порядок групп)
+RELATIVE_DAYS = {'heute': 0, 'gestern': 1, 'vorgestern': 2}
+DATE_FORMATS = [
+    (re.compile(r'^(\d{1,2})\.(\d{1,2})\.(\d{4})'), ('d', 'm', 'y')),
+    (re.compile(r'^(\d{4})-(\d{2})-(\d{2})'), ('y', 'm', 'd')),
+    (re.compile(r'^(\d{1,2})\.(\d{1,2})\.(\d{2})$'), ('d', 'm', 'yy')),
+    (re.compile(r'^(\d{1,2})[./](\d{4})$'), ('m', 'y')),
+    (re.compile(r'^(\d{1,2})/(\d{2})$'), ('m', 'yy')),
+]
+
+# Классы символов для векторного разбора цены
+PRICE_WIDTH = 32
+DOT, COMMA, OTHER = 10, 11, 12
+CHAR_CLASS = np.full(256, OTHER, dtype=np.uint8)
+CHAR_CLASS[[ord(c) for c in '0123456789']] = np.arange(10)
+CHAR_CLASS[ord('.')] = DOT
+CHAR_CLASS[ord(',')] = COMMA
+MAX_EXACT_DIGITS = 15           # мантисса < 2**53 - деление на 10**k дает тот же float, что float(str)
+POW10 = 10 ** np.arange(MAX_EXACT_DIGITS + 1, dtype=np.int64)
+
+
+# --- Скалярные функции (логика hunter) ---
+
+def parse_price(text: str) -> float:
+    """'1.200 € VB' -> 1200.0; немецкий формат, 0 если цены нет"""
+    clean = PRICE_STRIP_RE.sub('', text or '').strip()
+    if not clean:
+        return 0
+    # 1.200,00 -> 1200.00
+    if ',' in clean and '.' in clean:
+        clean = clean.replace('.', '').replace(',', '.')
+    elif ',' in clean:
+        clean = clean.replace(',', '.')
+    elif '.' in clean and PRICE_THOUSANDS_RE.match(clean):
+        # 1.200 - разделитель тысяч, 12.50 - десятичная точка
+        clean = clean.replace('.', '')
+    try:
+        return float(clean)
+    except ValueError:
+        return 0
+
+
+def is_negotiable(text: str) -> bool:
+    return bool(text) and NEGOTIABLE_RE.search(text) is not None
+
+
+def normalize_year(value: str) -> str:
+    """'06/24' и '06.24' -> '2024'; год из YEAR_RE для find_year и year_value"""
+    if len(value) == 5 and value[2] in './' and value[3:].isdigit():
+        return '20' + value[3:]
+    return value
+
+
+def find_year(text: str) -> Tuple[Optional[str], Optional[str]]:
+    """(найденный фрагмент, год строкой) по ключевым словам Neukauf/Rechnung/Baujahr/Year"""
+    match = YEAR_RE.search(text or '')
+    if not match:
+        return None, None
+    return match.group(0), normalize_year(match.group(1))
+
+
+def find_size(text: str, title: str = '') -> Tuple[Optional[str], Optional[str]]:
+    """(найденный фрагмент, размер) из описания, иначе буква размера из заголовка"""
+    match = SIZE_RE.search(text or '') or SIZE_TITLE_RE.search(title or '')
+    if not match:
+        return None, None
+    return match.group(0), match.group(1)
+
+
+def year_value(text: str) -> int:
+    """Год числом: '06/24' и '06.24' -> 2024, 0 если не найден"""
+    match = YEAR_RE.search(text or '')
+    if not match:
+        return 0
+    return int(normalize_year(match.group(1)))
+
+
+def frame_size(value: Any) -> Optional[str]:
+    """Размер рамы в канонической форме: 'M', '54cm', '19"'; None - не размер рамы"""
+    if value is None:
+        return None
+    text = SIZE_PREFIX_RE.sub('', str(value).strip().lower()).strip(' :-')
+    if text in SIZE_ALIASES:
+        return SIZE_ALIASES[text]
+    match = SIZE_NUMBER_RE.match(text)
+    if not match:
+        return None
+    number = float(match.group(1).replace(',', '.'))
+    unit = (match.group(2) or '').lower()
+    if unit in INCH_UNITS:
+        if FRAME_INCH_RANGE[0] <= number <= FRAME_INCH_RANGE[1]:
+            return f'{match.group(1).replace(",", ".")}"'
+        return None
+    if FRAME_CM_RANGE[0] <= number <= FRAME_CM_RANGE[1]:
+        return f'{int(number)}cm'
+    return None
+
+
+def parse_date(text: Any, today: Optional[datetime.date] = None) -> Optional[datetime.date]:
+    """'17.03.2014', '2024-03-17', '06/24', 'Heute, 12:30' -> date"""
+    if not text:
+        return None
+    text = str(text).strip()
+    word = text.split(',')[0].strip().lower()
+    if word in RELATIVE_DAYS:
+        return (today or datetime.date.today()) - datetime.timedelta(days=RELATIVE_DAYS[word])
+    for pattern, order in DATE_FORMATS:
+        match = pattern.match(text)
+        if not match:
+            continue
+        parts = dict(zip(order, (int(g) for g in match.groups())))
+        year = parts['y'] if 'y' in parts else 2000 + parts['yy']
+        try:
+            return datetime.date(year, parts['m'], parts.get('d', 1))
+        except ValueError:
+            return None
+    return None
+
+
+# --- Колоночные функции ---
+
+def _as_strings(values: Sequence[Any]) -> List[str]:
+    return ['' if v is None else v if isinstance(v, str) else str(v) for v in values]
+
+
+def _cached_map(values: Sequence[str], func: Callable[[str], Any]) -> List[Any]:
+    """func по уникальным значениям колонки"""
+    table: Dict[str, Any] = {}
+    out = []
+    for value in values:
+        result = table.get(value, table)
+        if result is table:
+            result = table[value] = func(value)
+        out.append(result)
+    return out
+
+
+def prices(values: Sequence[Any]) -> np.ndarray:
+    """Колонка цен -> float64 (0 - цены нет), те же правила, что parse_price"""
+    arr = np.asarray(values, dtype=str)    # None -> 'None', 1200.0 -> '1200.0': для цены это то же самое
+    n = len(arr)
+    if not n:
+        return np.zeros(0, dtype=np.float64)
+    long_rows = np.nonzero(np.char.str_len(arr) > PRICE_WIDTH)[0] if arr.itemsize > 4 * PRICE_WIDTH else []
+    if arr.itemsize > 4 * PRICE_WIDTH:
+        arr = arr.astype(f'U{PRICE_WIDTH}')
+    width = arr.itemsize // 4
+    # (width, n): цикл идет по позициям символа, каждая итерация - векторная операция по всей колонке
+    cls = CHAR_CLASS[np.minimum(arr.view(np.uint32).reshape(n, width), 255)].T.copy()
+
+    mantissa = np.zeros(n, dtype=np.int64)
+    n_digit = np.zeros(n, dtype=np.int16)
+    n_dot = np.zeros(n, dtype=np.int16)
+    n_comma = np.zeros(n, dtype=np.int16)
+    length = np.zeros(n, dtype=np.int16)         # длина строки после PRICE_STRIP_RE
+    last_dot_rank = np.zeros(n, dtype=np.int16)
+    digits_before_dot = np.zeros(n, dtype=np.int16)
+    digits_before_comma = np.zeros(n, dtype=np.int16)
+    for column in cls:
+        digit = column < 10
+        dot = column == DOT
+        comma = column == COMMA
+        mantissa = np.where(digit, mantissa * 10 + column, mantissa)
+        n_digit += digit
+        length += column != OTHER
+        np.copyto(last_dot_rank, length, where=dot)
+        np.copyto(digits_before_dot, n_digit, where=dot)
+        np.copyto(digits_before_comma, n_digit, where=comma)
+        n_dot += dot
+        n_comma += comma
+
+    dot_only = (n_dot > 0) & (n_comma == 0)
+    comma_decimal = n_comma > 0
+    # '.*\.\d{3}$' в очищенной строке: последняя точка - четвертый символ с конца
+    thousands = dot_only & (last_dot_rank == length - 3)
+    valid = (n_digit > 0) & np.where(comma_decimal, n_comma == 1, np.where(dot_only, thousands | (n_dot == 1), True))
+    fraction = np.where(comma_decimal, n_digit - digits_before_comma,
+                        np.where(dot_only & ~thousands, n_digit - digits_before_dot, 0))
+
+    exact = valid & (n_digit <= MAX_EXACT_DIGITS)
+    out = np.where(exact, mantissa / 10.0 ** fraction, 0.0)
+
+    # Длинные строки и мантиссы больше 15 цифр - скалярно
+    for i in np.concatenate([np.asarray(long_rows, dtype=np.int64), np.nonzero(valid & ~exact)[0]]):
+        out[i] = parse_price(str(values[i]))
+    return out
+
+
+def negotiable(values: Sequence[Any]) -> np.ndarray:
+    values = _as_strings(values)
+    return np.fromiter(_cached_map(values, is_negotiable), dtype=bool, count=len(values))
+
+
+def years(values: Sequence[Any]) -> np.ndarray:
+    """Колонка описаний -> год int16 (0 - не найден)"""
+    values = _as_strings(values)
+    return np.fromiter(_cached_map(values, year_value), dtype=np.int16, count=len(values))
+
+
+def frame_sizes(values: Sequence[Any]) -> np.ndarray:
+    """Колонка размеров -> object-массив канонических размеров (None - не размер рамы)"""
+    out = np.empty(len(values), dtype=object)
+    out[:] = _cached_map(_as_strings(values), frame_size)
+    return out
+
+
+def dates(values: Sequence[Any], today: Optional[datetime.date] = None) -> np.ndarray:
+    """Колонка дат -> datetime64[D] (NaT - не распознано)"""
+    values = [v.strip() for v in _as_strings(values)]
+    n = len(values)
+    out = np.full(n, np.datetime64('NaT'), dtype='datetime64[D]')
+    if not n:
+        return out
+
+    # Основной формат dd.mm.yyyy - по позициям символов
+    arr = np.array(values, dtype='U10')
+    codes = arr.view(np.uint32).reshape(n, 10) - ord('0')
+    digit = codes < 10
+    fixed = (np.fromiter(map(len, values), dtype=np.int64, count=n) == 10) \
+        & digit[:, [0, 1, 3, 4, 6, 7, 8, 9]].all(axis=1) \
+        & (arr.view(np.uint32).reshape(n, 10)[:, [2, 5]] == ord('.')).all(axis=1)
+    c = codes.astype(np.int64)
+    day = c[:, 0] * 10 + c[:, 1]
+    month = c[:, 3] * 10 + c[:, 4]
+    year = c[:, 6] * 1000 + c[:, 7] * 100 + c[:, 8] * 10 + c[:, 9]
+    fixed &= (month >= 1) & (month <= 12) & (day >= 1)
+    month_start = ((year - 1970) * 12 + month - 1).astype('datetime64[M]')
+    parsed = month_start.astype('datetime64[D]') + (day - 1)
+    fixed &= parsed.astype('datetime64[M]') == month_start   # 31.02. -> не дата
+    out[fixed] = parsed[fixed]
+
+    rest = np.nonzero(~fixed)[0]
+    if len(rest):
+        parsed_rest = _cached_map([values[i] for i in rest], lambda v: parse_date(v, today))
+        out[rest] = np.array([np.datetime64(d) if d else np.datetime64('NaT') for d in parsed_rest], dtype='datetime64[D]')
+    return out
+
+
+def normalize_results(results: List[Dict[str, Any]]) -> None:
+    """Результаты groq-parser: добавляет 'normalized' (price, year, frameSize, memberSince) колонками"""
+    ok = [r for r in results if r.get('success')]
+    if not ok:
+        return
+    price_col = prices([r.get('price') for r in ok])
+    year_col = years([f"{r.get('description') or ''} {r.get('title') or ''}" for r in ok])
+    size_col = frame_sizes([r.get('frameSize') for r in ok])
+    since_col = dates([(r.get('seller') or {}).get('memberSince') for r in ok])
+    for i, result in enumerate(ok):
+        result['normalized'] = {
+            'price': float(price_col[i]) or None,
+            'year': int(year_col[i]) or None,
+            'frameSize': size_col[i],
+            'memberSince': None if np.isnat(since_col[i]) else str(since_col[i]),
+        }
+
+
+def _sample_column(kind: str, size: int, rng) -> List[str]:
+    if kind == 'price':
+        amounts = rng.integers(1, 9_000_00, size=size)
+        templates = ['{e}.{c:03d} € VB', '{v} €', '{v},{cents:02d} €', '{e}.{c:03d},{cents:02d}', 'VB', '{v}.{cents:02d}', '']
+        picks = rng.integers(0, len(templates), size=size)
+        return [templates[p].format(v=a // 100, e=max(a // 100_000, 1), c=(a // 100) % 1000, cents=a % 100)
+                for p, a in zip(picks.tolist(), amounts.tolist())]
+    if kind == 'year':
+        pool = [f'Baujahr {y}, Rechnung vorhanden' for y in range(2005, 2026)] + \
+               [f'Neukauf {m:02d}/{y:02d}' for m in range(1, 13) for y in range(15, 26)] + \
+               [f'Rechnung {m:02d}.{y:02d}' for m in range(1, 13) for y in range(15, 26)] + ['Top Zustand, kaum gefahren']
+    elif kind == 'size':
+        pool = ['M', 'L', 'XL', 's', 'Large', '54cm', '56 cm', '19"', '21 Zoll', '29"', 'Größe M', 'Rahmengröße M',
+                'Rahmengröße: 54 cm', None, '']
+    else:
+        pool = [f'{d:02d}.{m:02d}.{y}' for d in (1, 9, 17, 28, 31) for m in range(1, 13) for y in range(2008, 2026)] + \
+               ['Heute, 12:30', 'Gestern, 08:10', '2024-03-17', '06/24']
+    return [pool[i] for i in rng.integers(0, len(pool), size=size).tolist()]
+
+
+def run_benchmark(size: int, seed: int = 7) -> Dict[str, Any]:
+    """Скалярный цикл против колоночных функций, с проверкой совпадения результатов"""
+    rng = np.random.default_rng(seed)
+    today = datetime.date(2026, 1, 1)
+    cases = {
+        'price': (parse_price, prices, lambda a, b: np.array_equal(a, b)),
+        # Скалярная сторона идет через find_year (hunter_extractor), колоночная - через year_value
+        'year': (lambda v: int(find_year(v)[1] or 0), years, lambda a, b: np.array_equal(a, b)),
+        'size': (frame_size, frame_sizes, lambda a, b: list(a) == list(b)),
+        'date': (lambda v: parse_date(v, today), lambda col: dates(col, today),
+                 lambda a, b: np.array_equal(a.astype(np.int64), b.astype(np.int64))),
+    }
+    report = {'values': size}
+    for kind, (scalar, column, same) in cases.items():
+        col = _sample_column(kind, size, rng)
+        start = time.perf_counter()
+        scalar_out = [scalar(v) for v in col]
+        scalar_s = time.perf_counter() - start
+        start = time.perf_counter()
+        column_out = column(col)
+        column_s = time.perf_counter() - start
+        if kind == 'price':
+            scalar_out = np.array(scalar_out, dtype=np.float64)
+        elif kind == 'year':
+            scalar_out = np.array(scalar_out, dtype=np.int16)
+        elif kind == 'date':
+            scalar_out = np.array([np.datetime64(d) if d else np.datetime64('NaT') for d in scalar_out], dtype='datetime64[D]')
+        report[kind] = {
+            'scalar_s': round(scalar_s, 3),
+            'column_s': round(column_s, 3),
+            'speedup': round(scalar_s / column_s, 2) if column_s else 0.0,
+            'values_per_sec': round(size / column_s) if column_s else 0,
+            'identical': bool(same(column_out, scalar_out)),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Listing field normalizer')
+    parser.add_argument('--bench', type=int, metavar='N', help='Микробенчмарк на N значений каждого поля (например 1000000)')
+    parser.add_argument('--field', choices=['price', 'year', 'size', 'date'], help='Нормализовать строки из stdin')
+    args = parser.parse_args()
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.bench), indent=2))
+        return
+    if not args.field:
+        parser.error('нужен --bench N или --field')
+    lines = [line.rstrip('\n') for line in sys.stdin]
+    column = {'price': prices, 'year': years, 'size': frame_sizes, 'date': dates}[args.field](lines)
+    for line, value in zip(lines, column.tolist()):
+        print(f'{line}\t{value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,57 +4,84 @@ Groq-powered Kleinanzeigen Parser
 Парсер объявлений Kleinanzeigen с использованием Groq API
 """
 
+# Node-сторона запускает этот скрипт на каждый запрос, поэтому на уровне модуля
+# импортируется только стандартная библиотека. requests, bs4 и groq грузятся
+# лениво - там, где они действительно нужны (см. import-budget.py).
 import os
 import sys
 import json
-import requests
-from bs4 import BeautifulSoup
-from groq import Groq
+import time
 import argparse
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
-# Настройка кодировки для Windows
-if sys.platform.startswith('win'):
-    import codecs
-    sys.stdout = codecs.getwriter('utf-8')(sys.stdout.detach())
-    sys.stderr = codecs.getwriter('utf-8')(sys.stderr.detach())
+def configure_stdio():
+    """Настройка кодировки для Windows"""
+    if sys.platform.startswith('win'):
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
 
 class GroqKleinanzeigenParser:
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, image_store=None, photo_index=None, deal_scorer=None, html_archive=None):
         """Инициализация парсера с API ключом Groq"""
-        self.client = Groq(api_key=api_key)
+        from groq_usage import UsageTracker
+        
+        self.api_key = api_key
+        self.image_store = image_store  # ImageStore, если фото нужно скачивать
+        self.photo_index = photo_index  # PhashIndex для поиска чужих фото
+        self.deal_scorer = deal_scorer  # DealScorer: процентиль цены по скетчам рынка
+        self.html_archive = html_archive  # HtmlArchive: сохранять загруженные страницы в pack-архив
+        self._client = None
+        self.model = "llama-3.1-8b-instant"  # Используем актуальную быструю модель Groq
+        self.usage = UsageTracker(self.model)
         self.headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
     
+    @property
+    def client(self):
+        """Клиент Groq создается при первом обращении к API"""
+        if self._client is None:
+            from groq import Groq
+            self._client = Groq(api_key=self.api_key)
+        return self._client
+    
     def fetch_page_content(self, url: str) -> Optional[str]:
         """Получение HTML содержимого страницы"""
+        import requests
         try:
             response = requests.get(url, headers=self.headers, timeout=10)
             response.raise_for_status()
+            self.archive_page(url, response)
             return response.text
         except requests.RequestException as e:
             print(f"Ошибка при загрузке страницы: {e}", file=sys.stderr)
             return None
     
+    def fetch_page_bytes(self, url: str) -> Optional[bytes]:
+        """Получение сырых байт страницы (для процессного пула)"""
+        import requests
+        try:
+            response = requests.get(url, headers=self.headers, timeout=10)
+            response.raise_for_status()
+            self.archive_page(url, response)
+            return response.content
+        except requests.RequestException as e:
+            print(f"Ошибка при загрузке страницы {url}: {e}", file=sys.stderr)
+            return None
+    
+    def archive_page(self, url: str, response) -> None:
+        """Дописать загруженную страницу в архив; сбой архива не мешает разбору"""
+        if self.html_archive is None:
+            return
+        try:
+            self.html_archive.append(url, response.content, response.status_code)
+        except OSError as e:
+            print(f"Не удалось сохранить страницу в архив: {e}", file=sys.stderr)
+    
     def clean_html_for_ai(self, html: str) -> str:
         """Очистка HTML для отправки в AI"""
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Удаляем ненужные элементы
-        for element in soup(['script', 'style', 'nav', 'footer', 'header', 'aside']):
-            element.decompose()
-        
-        # Находим основной контент объявления
-        main_content = soup.find('article') or soup.find('main') or soup.find('div', class_='ad-details')
-        
-        if main_content:
-            return main_content.get_text(separator=' ', strip=True)
-        else:
-            # Если не нашли основной контент, берем весь текст
-            return soup.get_text(separator=' ', strip=True)[:5000]  # Ограничиваем размер
-        
-        return content
+        from html_pool import clean_html
+        return clean_html(html)
     
     def clean_json_response(self, json_text: str) -> str:
         """Очистка JSON ответа от распространенных ошибок форматирования"""
@@ -319,6 +346,11 @@ URL: {url}
 Ответь ТОЛЬКО JSON без дополнительных комментариев.
 """
 
+        usage = None
+        latency = None
+        repaired = False
+        repair_attempted = False
+        started = time.perf_counter()
         try:
             chat_completion = self.client.chat.completions.create(
                 messages=[
@@ -327,10 +359,12 @@ URL: {url}
                         "content": prompt
                     }
                 ],
-                model="llama-3.1-8b-instant",  # Используем актуальную быструю модель Groq
+                model=self.model,
                 temperature=0.1,
                 max_tokens=1000
             )
+            latency = time.perf_counter() - started
+            usage = getattr(chat_completion, 'usage', None)
             
             response_text = chat_completion.choices[0].message.content.strip()
             
@@ -371,10 +405,12 @@ URL: {url}
                 print(f"Пытаюсь исправить JSON...", file=sys.stderr)
                 
                 # Попытка извлечь хотя бы основные поля
+                repair_attempted = True
                 fixed_json = self.attempt_json_repair(response_text)
                 if fixed_json:
                     try:
                         parsed_data = json.loads(fixed_json)
+                        repaired = True
                         print(f"JSON успешно исправлен!", file=sys.stderr)
                     except json.JSONDecodeError:
                         print(f"Не удалось исправить JSON", file=sys.stderr)
@@ -386,14 +422,22 @@ URL: {url}
             parsed_data['url'] = url
             parsed_data['success'] = True
             
+            self.usage.record(url, latency, usage, repaired=repaired,
+                              repair_attempted=repair_attempted, success=True)
             return parsed_data
             
         except json.JSONDecodeError as e:
             print(f"Ошибка парсинга JSON: {e}", file=sys.stderr)
             print(f"Ответ AI: {response_text}", file=sys.stderr)
+            self.usage.record(url, latency, usage, repaired=repaired,
+                              repair_attempted=repair_attempted, error='json')
             return self.create_error_response(url, f"JSON parsing error: {str(e)}")
         except Exception as e:
             print(f"Ошибка при обращении к Groq API: {e}", file=sys.stderr)
+            if latency is None:
+                latency = time.perf_counter() - started
+            self.usage.record(url, latency, usage, repaired=repaired,
+                              repair_attempted=repair_attempted, error='api')
             return self.create_error_response(url, f"Groq API error: {str(e)}")
     
     def create_error_response(self, url: str, error: str) -> Dict[str, Any]:
@@ -433,34 +477,210 @@ URL: {url}
         if not html_content:
             return self.create_error_response(url, "Failed to fetch page content")
         
-        # Очищаем HTML
-        clean_content = self.clean_html_for_ai(html_content)
+        # Очищаем HTML и собираем галерею за один разбор
+        from html_pool import clean_html_record
+        record = clean_html_record(html_content)
+        clean_content = record['content']
         if not clean_content.strip():
             return self.create_error_response(url, "No content found on page")
         
         # Парсим с помощью Groq
         result = self.parse_with_groq(clean_content, url)
+        self.apply_structured(result, record['structured'])
+        from field_normalize import normalize_results
+        normalize_results([result])
+        self.score_deal(result)
+        self.attach_images(result, record['images'])
         
         print(f"Парсинг завершен: {'успешно' if result.get('success') else 'с ошибкой'}", file=sys.stderr)
         return result
+    
+    def apply_structured(self, result: Dict[str, Any], structured: Dict[str, Any]) -> None:
+        """Встроенные данные страницы (JSON-LD / meta / трекинг) заполняют поля, которые AI оставил пустыми"""
+        result['structured'] = structured
+        if not result.get('success'):
+            return
+        for field in ('title', 'price', 'location'):
+            if result.get(field) in (None, '') and structured.get(field) not in (None, ''):
+                result[field] = structured[field]
+    
+    def score_deal(self, result: Dict[str, Any]) -> None:
+        """Процентиль цены среди похожих объявлений; цена сразу попадает в скетчи"""
+        if self.deal_scorer is None or not result.get('success'):
+            return
+        price = (result.get('normalized') or {}).get('price')
+        if price is None:
+            price = result.get('price')
+        result['deal'] = self.deal_scorer.score_and_observe(
+            result.get('brand'), result.get('model'), result.get('category'), price)
+    
+    def attach_images(self, result: Dict[str, Any], images: List[str]) -> None:
+        """Добавление галереи к результату и загрузка фото в хранилище"""
+        result['images'] = images
+        if not self.image_store or not images:
+            return
+        downloaded = self.image_store.download_listings({result['url']: images})
+        result['imageFiles'] = downloaded['files'].get(result['url'], [])
+        print(f"Фото: {json.dumps(downloaded['stats'], ensure_ascii=False)}", file=sys.stderr)
+        self.check_photo_duplicates(result)
+    
+    def check_photo_duplicates(self, result: Dict[str, Any]) -> None:
+        """Сверка фото объявления с индексом перцептивных хэшей всех фото"""
+        if self.photo_index is None or not result.get('imageFiles'):
+            return
+        from image_phash import hash_files
+        
+        paths = [os.path.join(self.image_store.root, path) for path in result['imageFiles']]
+        try:
+            hashes = hash_files(paths)
+        except OSError as e:
+            print(f"Ошибка при расчете хэшей фото: {e}", file=sys.stderr)
+            return
+        result['photoMatches'] = self.photo_index.check_listing(result['url'], hashes)
+        if result['url'] not in self.photo_index.listings:
+            self.photo_index.add(result['url'], hashes, result['imageFiles'])
+    
+    def parse_urls(self, urls: List[str], fetch_workers: int = 8, clean_workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Пакетный парсинг: загрузка в потоках (I/O), очистка HTML в пуле
+        процессов (CPU), затем запросы к Groq по очереди.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        from html_pool import HtmlPool, clean_html_record
+        from structured_data import FastPathStats
+        
+        timings = {}
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, fetch_workers)) as executor:
+            pages = list(executor.map(self.fetch_page_bytes, urls))
+        timings['fetch_s'] = round(time.perf_counter() - start, 3)
+        
+        fetched = [(url, raw) for url, raw in zip(urls, pages) if raw]
+        start = time.perf_counter()
+        with HtmlPool(clean_workers) as pool:
+            records = pool.map(clean_html_record, [raw for _, raw in fetched])
+            clean_workers = pool.workers
+        timings['clean_s'] = round(time.perf_counter() - start, 3)
+        cleaned = {url: record['content'] for (url, _), record in zip(fetched, records)}
+        galleries = {url: record['images'] for (url, _), record in zip(fetched, records)}
+        structured = {url: record['structured'] for (url, _), record in zip(fetched, records)}
+        fast_path = FastPathStats()
+        for record in records:
+            fast_path.record([] if record['fast_path'] else ['main_content'])
+        
+        results = []
+        start = time.perf_counter()
+        for url in urls:
+            if url not in cleaned:
+                results.append(self.create_error_response(url, "Failed to fetch page content"))
+            elif not cleaned[url].strip():
+                results.append(self.create_error_response(url, "No content found on page"))
+            else:
+                result = self.parse_with_groq(cleaned[url], url)
+                self.apply_structured(result, structured[url])
+                result['images'] = galleries[url]
+                results.append(result)
+        timings['llm_s'] = round(time.perf_counter() - start, 3)
+        
+        # Цена, год, размер рамы и дата регистрации - колонками по всем результатам
+        from field_normalize import normalize_results
+        normalize_results(results)
+        for result in results:
+            self.score_deal(result)
+        
+        image_stats = None
+        if self.image_store:
+            downloaded = self.image_store.download_listings({r['url']: r['images'] for r in results if r.get('images')})
+            for result in results:
+                if result.get('images'):
+                    result['imageFiles'] = downloaded['files'].get(result['url'], [])
+                    self.check_photo_duplicates(result)
+            image_stats = downloaded['stats']
+            timings['images_s'] = image_stats['seconds']
+        
+        summary = {
+            'total': len(urls),
+            'fetched': len(fetched),
+            'success': sum(1 for r in results if r.get('success')),
+            'clean_workers': clean_workers,
+            'timings': timings,
+            'fast_path': fast_path.summary(),
+            'usage': self.usage.summary(),
+        }
+        if image_stats:
+            summary['images'] = image_stats
+        return {'results': results, 'summary': summary}
 
 def main():
     """Главная функция"""
     parser = argparse.ArgumentParser(description='Groq Kleinanzeigen Parser')
-    parser.add_argument('url', help='URL объявления Kleinanzeigen')
+    parser.add_argument('url', nargs='*', help='URL объявления Kleinanzeigen')
     parser.add_argument('--api-key', help='Groq API ключ (или используйте переменную GROQ_API_KEY)')
+    parser.add_argument('--urls-file', help='Файл со списком URL (по одному на строку) для пакетного режима')
+    parser.add_argument('--fetch-workers', type=int, default=8, help='Потоков для загрузки страниц')
+    parser.add_argument('--clean-workers', type=int, help='Процессов для очистки HTML (по умолчанию HTML_POOL_WORKERS или число ядер)')
+    parser.add_argument('--download-images', action='store_true', help='Скачать фото галереи в контентно-адресуемое хранилище')
+    parser.add_argument('--images-dir', help='Папка хранилища фото (по умолчанию backend/public/images/bikes)')
+    parser.add_argument('--image-workers', type=int, default=8, help='Потоков для загрузки фото')
+    parser.add_argument('--check-photo-duplicates', action='store_true',
+                        help='Сверить скачанные фото с индексом перцептивных хэшей (нужен --download-images)')
+    parser.add_argument('--deal-score', action='store_true',
+                        help='Оценить цену по скетчам рынка (price_sketch.py) и дополнить их новыми ценами')
+    parser.add_argument('--sketch-file', help='Файл скетчей цен (по умолчанию PRICE_SKETCH_FILE или price-sketches.json)')
+    parser.add_argument('--archive-html', metavar='DIR', default=os.getenv('HTML_ARCHIVE_DIR'),
+                        help='Сохранять загруженные страницы в pack-архив (html_archive.py)')
     
     args = parser.parse_args()
     
-    # Получаем API ключ
+    # Получаем API ключ (до любых тяжелых импортов и сетевых запросов)
     api_key = args.api_key or os.getenv('GROQ_API_KEY')
     if not api_key:
         print("Ошибка: Не указан GROQ_API_KEY", file=sys.stderr)
         sys.exit(1)
     
+    urls = list(args.url)
+    if args.urls_file:
+        with open(args.urls_file, 'r', encoding='utf-8') as f:
+            urls.extend(line.strip() for line in f if line.strip())
+    if not urls:
+        parser.error('нужен хотя бы один URL или --urls-file')
+    
+    configure_stdio()
+    
     # Создаем парсер и обрабатываем URL
-    groq_parser = GroqKleinanzeigenParser(api_key)
-    result = groq_parser.parse_url(args.url)
+    image_store = None
+    if args.download_images:
+        from image_store import DEFAULT_IMAGES_DIR, ImageStore
+        image_store = ImageStore(args.images_dir or DEFAULT_IMAGES_DIR, args.image_workers)
+    
+    photo_index = None
+    photo_index_path = None
+    if args.check_photo_duplicates and image_store:
+        from image_phash import PhashIndex
+        photo_index_path = os.path.join(image_store.root, 'phash-index.npz')
+        photo_index = PhashIndex.load(photo_index_path)
+    
+    deal_scorer = None
+    if args.deal_score:
+        from price_sketch import SKETCH_FILE, DealScorer
+        deal_scorer = DealScorer(args.sketch_file or SKETCH_FILE)
+    
+    html_archive = None
+    if args.archive_html:
+        from html_archive import HtmlArchive
+        html_archive = HtmlArchive(args.archive_html)
+    
+    groq_parser = GroqKleinanzeigenParser(api_key, image_store, photo_index, deal_scorer, html_archive)
+    if len(urls) == 1 and not args.urls_file:
+        result = groq_parser.parse_url(urls[0])
+    else:
+        result = groq_parser.parse_urls(urls, args.fetch_workers, args.clean_workers)
+    groq_parser.usage.flush()
+    if photo_index is not None:
+        photo_index.save(photo_index_path)
+    if deal_scorer is not None:
+        deal_scorer.save()
     
     # Выводим результат в JSON формате с правильной кодировкой для Windows
     try:
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Token and latency accounting for Groq calls
+Учет токенов и задержек для вызовов Groq
+
+Каждый вызов chat.completions фиксируется (токены prompt/completion, время,
+был ли нужен ремонт JSON). Вызовы агрегируются за запуск (сводка пакета) и
+дописываются в скользящий файл статистики, общий для всех запусков парсера:
+Node-сторона запускает groq-parser.py на каждый запрос, поэтому только файл
+показывает картину по времени.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from typing import Any, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: без межпроцессной блокировки
+    fcntl = None
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+STATS_FILE = os.getenv('GROQ_USAGE_STATS_FILE', os.path.join(SCRIPT_DIR, 'groq-usage-stats.jsonl'))
+# Сколько последних вызовов хранит скользящий файл
+STATS_WINDOW = int(os.getenv('GROQ_USAGE_STATS_WINDOW', '2000'))
+
+# USD за 1M токенов (input, output) по прайсу Groq
+PRICING = {
+    'llama-3.1-8b-instant': (0.05, 0.08),
+    'llama-3.3-70b-versatile': (0.59, 0.79),
+}
+LATENCY_BUCKETS_MS = [250, 500, 1000, 2000, 5000, 10000]
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    input_price, output_price = PRICING.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(calls: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Агрегаты по списку вызовов: токены на объявление, стоимость, гистограмма задержек"""
+    count = len(calls)
+    prompt_tokens = sum(c.get('prompt_tokens', 0) for c in calls)
+    completion_tokens = sum(c.get('completion_tokens', 0) for c in calls)
+    cost = sum(c.get('cost_usd', 0.0) for c in calls)
+    latencies = sorted(c.get('latency_ms', 0.0) for c in calls)
+
+    histogram = {}
+    for bound in LATENCY_BUCKETS_MS:
+        histogram[f'<={bound}ms'] = 0
+    histogram[f'>{LATENCY_BUCKETS_MS[-1]}ms'] = 0
+    for latency in latencies:
+        for bound in LATENCY_BUCKETS_MS:
+            if latency <= bound:
+                histogram[f'<={bound}ms'] += 1
+                break
+        else:
+            histogram[f'>{LATENCY_BUCKETS_MS[-1]}ms'] += 1
+
+    # Старые записи без repair_attempted: ремонт был, если он удался
+    repair_attempts = sum(1 for c in calls if c.get('repair_attempted', c.get('repaired')))
+    repairs = sum(1 for c in calls if c.get('repaired'))
+
+    def per_call(value):
+        return round(value / count, 1) if count else 0.0
+
+    return {
+        'calls': count,
+        'success': sum(1 for c in calls if c.get('success')),
+        'errors': sum(1 for c in calls if c.get('error')),
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'tokens_per_listing': per_call(prompt_tokens + completion_tokens),
+        'prompt_tokens_per_listing': per_call(prompt_tokens),
+        'completion_tokens_per_listing': per_call(completion_tokens),
+        'cost_usd': round(cost, 6),
+        'cost_per_1k_listings_usd': round(cost / count * 1000, 4) if count else 0.0,
+        # Доля вызовов, где понадобился ремонт JSON (удачный или нет), и доля удачных ремонтов среди них
+        'repair_rate': round(repair_attempts / count, 3) if count else 0.0,
+        'repair_success_rate': round(repairs / repair_attempts, 3) if repair_attempts else 0.0,
+        'latency_ms': {
+            'avg': per_call(sum(latencies)),
+            'p50': round(percentile(latencies, 0.50), 1),
+            'p95': round(percentile(latencies, 0.95), 1),
+            'max': round(latencies[-1], 1) if latencies else 0.0,
+            'histogram': histogram,
+        },
+    }
+
+
+class UsageTracker:
+    """Сбор статистики вызовов Groq за один запуск парсера"""
+
+    def __init__(self, model: str, stats_file: Optional[str] = STATS_FILE):
+        self.model = model
+        self.stats_file = stats_file
+        self.calls: List[Dict[str, Any]] = []
+        self._flushed = 0
+
+    def record(self, url: str, latency_s: float, usage: Any = None, repaired: bool = False,
+               success: bool = False, error: Optional[str] = None,
+               repair_attempted: bool = False) -> Dict[str, Any]:
+        """
+        Фиксация одного вызова; usage - объект completion.usage из ответа Groq.
+        repair_attempted - ответ пошел в ремонт JSON, repaired - ремонт удался
+        """
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+        call = {
+            'ts': round(time.time(), 3),
+            'url': url,
+            'model': self.model,
+            'prompt_tokens': prompt_tokens,
+            'completion_tokens': completion_tokens,
+            'latency_ms': round(latency_s * 1000, 1),
+            'cost_usd': estimate_cost(self.model, prompt_tokens, completion_tokens),
+            'repair_attempted': repair_attempted or repaired,
+            'repaired': repaired,
+            'success': success,
+        }
+        if error:
+            call['error'] = error
+        self.calls.append(call)
+        return call
+
+    def summary(self) -> Dict[str, Any]:
+        return summarize(self.calls)
+
+    def flush(self) -> None:
+        """Дописывание вызовов в скользящий файл статистики"""
+        pending = self.calls[self._flushed:]
+        if not self.stats_file or not pending:
+            return
+        try:
+            # Дописывание и обрезка под одной блокировкой: обрезка подменяет файл через
+            # os.replace, и строки другого процесса, дописанные между чтением и заменой, пропали бы
+            with open(f'{self.stats_file}.lock', 'a') as lock:
+                if fcntl:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                with open(self.stats_file, 'a', encoding='utf-8') as f:
+                    for call in pending:
+                        f.write(json.dumps(call, ensure_ascii=False) + '\n')
+                self._flushed = len(self.calls)
+                trim_stats_file(self.stats_file, STATS_WINDOW)
+        except OSError as e:
+            print(f"Не удалось записать статистику Groq: {e}", file=sys.stderr)
+
+
+def load_stats(stats_file: str = STATS_FILE, window: int = STATS_WINDOW) -> List[Dict[str, Any]]:
+    if not os.path.exists(stats_file):
+        return []
+    calls = []
+    with open(stats_file, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                calls.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+    return calls[-window:]
+
+
+def trim_stats_file(stats_file: str, window: int) -> None:
+    """
+    Файл обрезается до последних window записей, когда вырастает вдвое.
+    Вызывать под блокировкой {stats_file}.lock (см. UsageTracker.flush)
+    """
+    with open(stats_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    if len(lines) <= window * 2:
+        return
+    tmp_path = f'{stats_file}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines[-window:])
+    os.replace(tmp_path, stats_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Groq usage rolling stats')
+    parser.add_argument('--file', default=STATS_FILE, help='Файл статистики (jsonl)')
+    parser.add_argument('--window', type=int, default=STATS_WINDOW, help='Сколько последних вызовов учитывать')
+    parser.add_argument('--since-hours', type=float, help='Только вызовы за последние N часов')
+    args = parser.parse_args()
+
+    calls = load_stats(args.file, args.window)
+    if args.since_hours:
+        cutoff = time.time() - args.since_hours * 3600
+        calls = [c for c in calls if c.get('ts', 0) >= cutoff]
+    print(json.dumps(summarize(calls), ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
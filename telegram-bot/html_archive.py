@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+Append-only pack archive for fetched listing HTML
+Архив загруженных страниц: один pack-файл, индекс смещений, общий словарь сжатия
+
+Вместо файла на каждую загрузку страницы дописываются в pages.pack записями
+(заголовок + URL + сжатое тело). Каждая запись сжимается отдельно zlib с
+предустановленным словарем (zdict), обученным на самих страницах: шаблонная
+разметка Kleinanzeigen повторяется от страницы к странице, поэтому даже
+одиночная запись сжимается как часть большого потока, а читать любую запись
+можно независимо. pages.idx - записи фиксированного размера (смещение, длина,
+хэш URL, время), по нему работает произвольный доступ; последовательное
+чтение pack-файла индекс не требует, и по нему же индекс восстанавливается.
+Недописанная после сбоя запись не останавливает чтение: сканер ищет следующий
+RECORD_MAGIC, а следующая запись в архив сначала обрезает такой хвост.
+"""
+
+import os
+import sys
+import json
+import time
+import zlib
+import struct
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: межпроцессной блокировки нет, остается блокировка потоков
+    fcntl = None
+
+PACK_NAME = 'pages.pack'
+INDEX_NAME = 'pages.idx'
+DICT_PATTERN = 'dict-{:04d}.zdict'
+RECORD_MAGIC = b'HPK1'
+# magic, dict_id, сжатая длина, исходная длина, время загрузки, HTTP статус, длина URL
+RECORD_HEADER = struct.Struct('>4sIIIdHH')
+# смещение записи, полная длина записи, первые 8 байт sha1(URL), время загрузки
+INDEX_ENTRY = struct.Struct('>QIQd')
+ZDICT_SIZE = 32 * 1024          # больше zlib не использует
+COMPRESS_LEVEL = 6
+AUTO_TRAIN_AFTER = 64           # столько записей без словаря - и словарь обучается сам
+TRAIN_SAMPLES = 64
+MIN_LINE_LENGTH = 8
+SCAN_CHUNK = 1024 * 1024
+
+
+class Snapshot(NamedTuple):
+    url: str
+    fetched_at: float
+    status: int
+    body: bytes
+    offset: int
+    dict_id: int
+
+
+def url_key(url: str) -> int:
+    return int.from_bytes(hashlib.sha1(url.encode('utf-8')).digest()[:8], 'big')
+
+
+def train_dictionary(samples: List[bytes], size: int = ZDICT_SIZE, min_share: float = 0.3) -> bytes:
+    """
+    Словарь из строк, которые повторяются в заметной доле страниц.
+
+    zlib лучше всего находит совпадения в конце словаря, поэтому самые частые
+    фрагменты ставятся последними.
+    """
+    frequency: Counter = Counter()
+    for sample in samples:
+        frequency.update({line.strip() for line in sample.splitlines() if len(line.strip()) >= MIN_LINE_LENGTH})
+    threshold = max(2, int(len(samples) * min_share))
+    common = [line for line, count in frequency.most_common() if count >= threshold]
+    chosen: List[bytes] = []
+    total = 0
+    for line in common:
+        if total + len(line) + 1 > size:
+            continue
+        chosen.append(line)
+        total += len(line) + 1
+    return b'\n'.join(reversed(chosen))
+
+
+class HtmlArchive:
+    """Папка с pages.pack, pages.idx и словарями dict-NNNN.zdict"""
+
+    def __init__(self, root: str, level: int = COMPRESS_LEVEL, auto_train_after: Optional[int] = AUTO_TRAIN_AFTER):
+        self.root = root
+        self.level = level
+        self.auto_train_after = auto_train_after
+        os.makedirs(root, exist_ok=True)
+        self.pack_path = os.path.join(root, PACK_NAME)
+        self.index_path = os.path.join(root, INDEX_NAME)
+        self.dictionaries: Dict[int, bytes] = {}
+        self._load_dictionaries()
+        self._lock = threading.Lock()
+        self._index: Optional[Dict[int, List[int]]] = None
+        self._index_size = 0
+        self.stats = {'appended': 0, 'raw_bytes': 0, 'packed_bytes': 0}
+
+    @property
+    def dict_id(self) -> int:
+        return max(self.dictionaries, default=0)
+
+    def _load_dictionaries(self) -> None:
+        """Подхватить словари с диска, в том числе обученные другими процессами"""
+        for name in sorted(os.listdir(self.root)):
+            if name.startswith('dict-') and name.endswith('.zdict') and int(name[5:9]) not in self.dictionaries:
+                with open(os.path.join(self.root, name), 'rb') as f:
+                    self.dictionaries[int(name[5:9])] = f.read()
+
+    def _dictionary(self, dict_id: int) -> bytes:
+        if dict_id not in self.dictionaries:
+            self._load_dictionaries()
+        if dict_id not in self.dictionaries:
+            raise ValueError(f'{DICT_PATTERN.format(dict_id)} not found in {self.root}')
+        return self.dictionaries[dict_id]
+
+    def _compressor(self, dict_id: int):
+        if dict_id:
+            return zlib.compressobj(self.level, zdict=self._dictionary(dict_id))
+        return zlib.compressobj(self.level)
+
+    def _decompress(self, dict_id: int, data: bytes) -> bytes:
+        inflate = zlib.decompressobj(zdict=self._dictionary(dict_id)) if dict_id else zlib.decompressobj()
+        try:
+            return inflate.decompress(data) + inflate.flush()
+        except zlib.error as e:
+            raise ValueError(f'Битое сжатое тело: {e}') from e
+
+    def append(self, url: str, body: bytes, status: int = 200, fetched_at: Optional[float] = None) -> int:
+        """Дописать страницу; возвращает смещение записи в pages.pack"""
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        fetched_at = fetched_at or time.time()
+        dict_id = self.dict_id
+        compressor = self._compressor(dict_id)
+        packed = compressor.compress(body) + compressor.flush()
+        url_bytes = url.encode('utf-8')[:0xFFFF]
+        record = RECORD_HEADER.pack(RECORD_MAGIC, dict_id, len(packed), len(body), fetched_at,
+                                    status, len(url_bytes)) + url_bytes + packed
+        with self._lock, open(self.pack_path, 'ab') as pack, open(self.index_path, 'ab') as index:
+            if fcntl:
+                fcntl.flock(pack, fcntl.LOCK_EX)  # другие процессы пишут в тот же pack
+            try:
+                offset = pack.seek(0, os.SEEK_END)
+                if fcntl:
+                    offset = self._repair_tail(pack, index, offset)
+                pack.write(record)
+                pack.flush()
+                index.write(INDEX_ENTRY.pack(offset, len(record), url_key(url), fetched_at))
+                index.flush()
+            finally:
+                if fcntl:
+                    fcntl.flock(pack, fcntl.LOCK_UN)
+            self.stats['appended'] += 1
+            self.stats['raw_bytes'] += len(body)
+            self.stats['packed_bytes'] += len(record)
+        if not dict_id and self.auto_train_after and self.stats['appended'] >= self.auto_train_after \
+                and self.count() >= self.auto_train_after:
+            self.train()
+        return offset
+
+    def _repair_tail(self, pack, index, pack_end: int) -> int:
+        """
+        Под блокировкой pack-файла: проиндексировать целые записи после последней
+        проиндексированной и обрезать недописанный хвост (сбой посреди append).
+        Возвращает новый конец pack-файла.
+        """
+        size = os.fstat(index.fileno()).st_size
+        usable = size - size % INDEX_ENTRY.size
+        if usable != size:
+            os.ftruncate(index.fileno(), usable)
+        indexed_end = 0
+        if usable:
+            with open(self.index_path, 'rb') as f:
+                f.seek(usable - INDEX_ENTRY.size)
+                last_offset, last_length, _, _ = INDEX_ENTRY.unpack(f.read(INDEX_ENTRY.size))
+            indexed_end = last_offset + last_length
+        if indexed_end >= pack_end:
+            return pack_end
+        end = indexed_end
+        with open(self.pack_path, 'rb') as reader:
+            for snapshot, end in self._scan(reader, indexed_end):
+                index.write(INDEX_ENTRY.pack(snapshot.offset, end - snapshot.offset,
+                                             url_key(snapshot.url), snapshot.fetched_at))
+        index.flush()
+        if end < pack_end:
+            os.ftruncate(pack.fileno(), end)
+        return end
+
+    def train(self, samples: int = TRAIN_SAMPLES) -> int:
+        """Обучить новый словарь на последних записях; новые записи сжимаются им"""
+        entries = self._read_index_entries()[-samples:]
+        pages = [self.read_at(offset).body for offset, _, _, _ in entries]
+        zdict = train_dictionary(pages)
+        if not zdict:
+            return self.dict_id
+        # Номер словаря выдается под той же блокировкой pack-файла, что и запись страниц, а файл
+        # создается без перезаписи (os.link): словарь, которым уже сжаты записи, не подменить
+        with self._lock, open(self.pack_path, 'ab') as pack:
+            if fcntl:
+                fcntl.flock(pack, fcntl.LOCK_EX)
+            tmp_path = os.path.join(self.root, f'dict.{os.getpid()}.{threading.get_ident()}.tmp')
+            try:
+                with open(tmp_path, 'wb') as f:
+                    f.write(zdict)
+                while True:
+                    self._load_dictionaries()
+                    dict_id = self.dict_id + 1
+                    try:
+                        os.link(tmp_path, os.path.join(self.root, DICT_PATTERN.format(dict_id)))
+                        break
+                    except FileExistsError:
+                        continue  # другой процесс без flock (Windows) занял этот номер
+                self.dictionaries[dict_id] = zdict
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                if fcntl:
+                    fcntl.flock(pack, fcntl.LOCK_UN)
+        return dict_id
+
+    def _read_index_entries(self) -> List[Tuple[int, int, int, float]]:
+        if not os.path.exists(self.index_path):
+            return []
+        with open(self.index_path, 'rb') as f:
+            data = f.read()
+        usable = len(data) - len(data) % INDEX_ENTRY.size  # хвост недописанной записи игнорируется
+        return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+    def _url_index(self) -> Dict[int, List[int]]:
+        # Индекс перечитывается, если его дописал другой процесс
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        if self._index is None or size != self._index_size:
+            self._index = {}
+            for offset, _, key, _ in self._read_index_entries():
+                self._index.setdefault(key, []).append(offset)
+            self._index_size = size
+        return self._index
+
+    def count(self) -> int:
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        return size // INDEX_ENTRY.size
+
+    def read_at(self, offset: int) -> Snapshot:
+        with open(self.pack_path, 'rb') as pack:
+            pack.seek(offset)
+            return self._read_record(pack, offset)
+
+    def _read_record(self, pack, offset: int) -> Snapshot:
+        header = pack.read(RECORD_HEADER.size)
+        if len(header) < RECORD_HEADER.size:
+            raise EOFError(offset)
+        magic, dict_id, packed_len, raw_len, fetched_at, status, url_len = RECORD_HEADER.unpack(header)
+        if magic != RECORD_MAGIC:
+            raise ValueError(f'Битая запись по смещению {offset}')
+        url = pack.read(url_len).decode('utf-8', errors='replace')
+        packed = pack.read(packed_len)
+        if len(packed) < packed_len:
+            raise EOFError(offset)
+        body = self._decompress(dict_id, packed)
+        if len(body) != raw_len:
+            raise ValueError(f'Битая запись по смещению {offset}: длина {len(body)} вместо {raw_len}')
+        return Snapshot(url, fetched_at, status, body, offset, dict_id)
+
+    @staticmethod
+    def _find_magic(pack, start: int) -> Optional[int]:
+        """Смещение следующего RECORD_MAGIC начиная со start (None - до конца файла нет)"""
+        pack.seek(start)
+        carry = b''
+        position = start
+        while True:
+            chunk = pack.read(SCAN_CHUNK)
+            if not chunk:
+                return None
+            data = carry + chunk
+            found = data.find(RECORD_MAGIC)
+            if found >= 0:
+                return position - len(carry) + found
+            carry = data[-(len(RECORD_MAGIC) - 1):]
+            position += len(chunk)
+
+    def _scan(self, pack, offset: int = 0) -> Iterator[Tuple[Snapshot, int]]:
+        """
+        Записи подряд начиная с offset: (запись, конец записи). Битая или
+        недописанная запись пропускается до следующего RECORD_MAGIC.
+        """
+        pack.seek(offset)
+        while True:
+            try:
+                snapshot = self._read_record(pack, offset)
+            except (EOFError, ValueError):
+                offset = self._find_magic(pack, offset + 1)
+                if offset is None:
+                    return
+                pack.seek(offset)
+                continue
+            end = pack.tell()
+            yield snapshot, end
+            offset = end
+
+    def get(self, url: str, all_versions: bool = False):
+        """Последняя (или все) сохраненные версии страницы URL"""
+        found = []
+        for offset in self._url_index().get(url_key(url), []):
+            snapshot = self.read_at(offset)
+            if snapshot.url == url:  # защита от коллизии 64-битного ключа
+                found.append(snapshot)
+        if all_versions:
+            return found
+        return found[-1] if found else None
+
+    def __iter__(self) -> Iterator[Snapshot]:
+        return self.iter_records()
+
+    def iter_records(self, since: Optional[float] = None) -> Iterator[Snapshot]:
+        """Последовательное чтение pack-файла (без индекса), битые и недописанные записи пропускаются"""
+        if not os.path.exists(self.pack_path):
+            return
+        with open(self.pack_path, 'rb', buffering=1024 * 1024) as pack:
+            for snapshot, _ in self._scan(pack):
+                if since is None or snapshot.fetched_at >= since:
+                    yield snapshot
+
+    def reindex(self) -> int:
+        """Пересобрать pages.idx по pack-файлу (после сбоя между записью страницы и индекса)"""
+        entries = []
+        with open(self.pack_path, 'rb', buffering=1024 * 1024) as pack:
+            for snapshot, end in self._scan(pack):
+                entries.append(INDEX_ENTRY.pack(snapshot.offset, end - snapshot.offset,
+                                                url_key(snapshot.url), snapshot.fetched_at))
+        tmp_path = f'{self.index_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(entries))
+        os.replace(tmp_path, self.index_path)
+        self._index = None
+        return len(entries)
+
+    def info(self) -> Dict[str, Any]:
+        raw = 0
+        per_dict: Counter = Counter()
+        for snapshot in self.iter_records():
+            raw += len(snapshot.body)
+            per_dict[snapshot.dict_id] += 1
+        packed = os.path.getsize(self.pack_path) if os.path.exists(self.pack_path) else 0
+        return {
+            'records': self.count(),
+            'raw_bytes': raw,
+            'pack_bytes': packed,
+            'ratio': round(raw / packed, 2) if packed else 0.0,
+            'dictionaries': {str(k): len(v) for k, v in self.dictionaries.items()},
+            'records_per_dict': {str(k): v for k, v in sorted(per_dict.items())},
+        }
+
+
+
+def run_benchmark(directory: str) -> Dict[str, Any]:
+    """Размер на диске и скорость чтения: файлы как есть, zlib на запись, zlib со словарем"""
+    import tempfile
+
+    names = sorted(n for n in os.listdir(directory) if n.endswith(('.html', '.htm')))
+    pages = []
+    for name in names:
+        with open(os.path.join(directory, name), 'rb') as f:
+            pages.append((name, f.read()))
+    raw = sum(len(body) for _, body in pages)
+    result: Dict[str, Any] = {'pages': len(pages), 'raw_bytes': raw}
+    for label, train in (('zlib', False), ('zlib_dict', True)):
+        with tempfile.TemporaryDirectory() as root:
+            archive = HtmlArchive(root, auto_train_after=None)
+            if train:
+                for name, body in pages[:TRAIN_SAMPLES]:
+                    archive.append(name, body)
+                archive.train()
+                os.remove(archive.pack_path)
+                os.remove(archive.index_path)
+            start = time.perf_counter()
+            for name, body in pages:
+                archive.append(name, body)
+            write_s = time.perf_counter() - start
+            start = time.perf_counter()
+            for name, _ in pages:
+                archive.get(name)
+            get_s = time.perf_counter() - start
+            start = time.perf_counter()
+            streamed = sum(1 for _ in archive.iter_records())
+            stream_s = time.perf_counter() - start
+            size = os.path.getsize(archive.pack_path) + os.path.getsize(archive.index_path)
+            result[label] = {
+                'bytes': size,
+                'ratio': round(raw / size, 2),
+                'write_pages_per_sec': round(len(pages) / write_s, 1),
+                'random_get_pages_per_sec': round(len(pages) / get_s, 1),
+                'stream_pages_per_sec': round(streamed / stream_s, 1),
+            }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Append-only HTML snapshot archive')
+    parser.add_argument('archive', nargs='?', help='Папка архива')
+    parser.add_argument('--add', nargs='+', metavar='FILE', help='Добавить сохраненные .html (URL = имя файла)')
+    parser.add_argument('--get', metavar='URL', help='Вывести последнюю версию страницы')
+    parser.add_argument('--list', action='store_true', help='Список записей (поток по pack-файлу)')
+    parser.add_argument('--export', metavar='DIR', help='Выгрузить все записи в .html файлы (для бенчмарков)')
+    parser.add_argument('--train', action='store_true', help='Обучить новый словарь на последних записях')
+    parser.add_argument('--reindex', action='store_true', help='Пересобрать индекс по pack-файлу')
+    parser.add_argument('--bench', metavar='DIR', help='Сравнить сжатие и скорость на папке .html')
+    args = parser.parse_args()
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.bench), indent=2))
+        return
+    if not args.archive:
+        parser.error('нужна папка архива')
+
+    archive = HtmlArchive(args.archive)
+    if args.add:
+        for path in args.add:
+            with open(path, 'rb') as f:
+                archive.append(os.path.basename(path), f.read())
+    if args.train:
+        print(f"Словарь {archive.train()}", file=sys.stderr)
+    if args.reindex:
+        print(f"В индексе {archive.reindex()} записей", file=sys.stderr)
+    if args.get:
+        snapshot = archive.get(args.get)
+        if snapshot is None:
+            sys.exit(1)
+        sys.stdout.buffer.write(snapshot.body)
+    elif args.list:
+        for snapshot in archive.iter_records():
+            print(f"{snapshot.offset}\t{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot.fetched_at))}\t"
+                  f"{snapshot.status}\t{len(snapshot.body)}\t{snapshot.url}")
+    elif args.export:
+        os.makedirs(args.export, exist_ok=True)
+        for i, snapshot in enumerate(archive.iter_records()):
+            with open(os.path.join(args.export, f'{i:06d}.html'), 'wb') as f:
+                f.write(snapshot.body)
+    elif not (args.add or args.train or args.reindex):
+        print(json.dumps(archive.info(), indent=2))
+
+
+if __name__ == '__main__':
+    main()
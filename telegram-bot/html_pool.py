@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+Process pool for the CPU stage of HTML parsing
+Процессный пул для CPU-стадии разбора HTML
+
+BeautifulSoup работает на чистом Python и держит GIL, поэтому потоки ускоряют
+только загрузку страниц. Очистка и извлечение выносятся в отдельные процессы:
+на вход подаются сырые байты страницы, на выход возвращаются компактные
+dict-записи (их дешево пиклить обратно в родительский процесс).
+"""
+
+import os
+import sys
+import time
+import argparse
+import importlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+
+from bs4 import BeautifulSoup
+
+from image_store import GALLERY_ANCHORS, IMAGE_ATTRS, gallery_urls_from_soup
+from structured_data import as_bytes, element_span, element_spans, scan_structured, strip_elements, fragment_text, tag_attrs
+
+# Число процессов по умолчанию: HTML_POOL_WORKERS или количество ядер
+DEFAULT_WORKERS = int(os.getenv('HTML_POOL_WORKERS', '0')) or (os.cpu_count() or 1)
+STRIP_TAGS = ['script', 'style', 'nav', 'footer', 'header', 'aside']
+FALLBACK_TEXT_LIMIT = 5000
+# Тот же порядок поиска основного контента, что и в clean_soup
+MAIN_CONTENT_ANCHORS = [('tag', 'article'), ('tag', 'main'), ('class', 'ad-details')]
+# Разметка, на которой байтовый путь ошибался: он должен либо совпасть с DOM, либо вернуть None
+REGRESSION_PAGES = [
+    ('lt_in_text', b'<html><body><article><p>a < b and c > d</p></article></body></html>'),
+    ('gt_in_attribute', b'<html><body><article><p title="a>b">x</p><img alt="1 > 0" src="y.jpg"></article></body></html>'),
+    ('anchor_in_header', b'<html><body><header><article>Menu</article></header>'
+                         b'<main><h1>Rad</h1><p>Text</p></main></body></html>'),
+    ('gt_in_text', b'<html><body><article><h1>Rad</h1><p>Preis > 500 &amp; VB</p><nav>n</nav></article></body></html>'),
+    ('class_in_attribute', b'<html><body><div data-x=\'class="ad-details"\'>Werbung</div>'
+                           b'<div class="ad-details"><p>Inhalt</p></div></body></html>'),
+]
+
+
+def decode_html(raw: bytes) -> str:
+    """Декодирование сырых байт страницы (Kleinanzeigen отдает UTF-8)"""
+    if isinstance(raw, str):
+        return raw
+    return raw.decode('utf-8', errors='replace')
+
+
+def clean_html(html: str) -> str:
+    """Очистка HTML для отправки в AI"""
+    return clean_soup(BeautifulSoup(html, 'html.parser'))
+
+
+def clean_soup(soup: BeautifulSoup) -> str:
+    """Текст объявления из разобранного документа (документ изменяется)"""
+    # Удаляем ненужные элементы
+    for element in soup(STRIP_TAGS):
+        element.decompose()
+
+    # Находим основной контент объявления
+    main_content = soup.find('article') or soup.find('main') or soup.find('div', class_='ad-details')
+
+    if main_content:
+        return main_content.get_text(separator=' ', strip=True)
+    # Если не нашли основной контент, берем весь текст
+    return soup.get_text(separator=' ', strip=True)[:FALLBACK_TEXT_LIMIT]
+
+
+def clean_fast(raw: bytes) -> Optional[Dict[str, Any]]:
+    """
+    Быстрый путь без DOM: текст основного блока и галерея по якорям в байтах.
+    None - если основной блок не найден или разметка неоднозначна.
+    """
+    for kind, value in MAIN_CONTENT_ANCHORS:
+        span = element_span(raw, kind, value)
+        if span is not None:
+            break
+    else:
+        return None
+    # clean_soup сначала удаляет STRIP_TAGS: блок внутри <header> и т.п. DOM-путь не увидит
+    for name in STRIP_TAGS:
+        for _, outer in element_spans(raw, 'tag', name, 0, span[0]):
+            if outer is None or outer[1] > span[0]:
+                return None
+    fragment = strip_elements(raw[span[0]:span[1]], STRIP_TAGS)
+    if fragment is None:
+        return None
+    content = fragment_text(fragment, strip=True, separator=' ')
+    if content is None:
+        return None
+
+    images = []
+    seen_paths = set()
+    for (kind, value), nested in GALLERY_ANCHORS:
+        for opening, span in element_spans(raw, kind, value):
+            if nested and span is None:
+                return None
+            tags = element_spans(raw, 'tag', 'img', *span) if nested else [(opening, None)]
+            for tag, _ in tags:
+                attrs = tag_attrs(tag)
+                url = next((attrs[attr] for attr in IMAGE_ATTRS if attrs.get(attr)), None)
+                if not url or not url.startswith(('http://', 'https://', '//')):
+                    continue
+                url = 'https:' + url if url.startswith('//') else url
+                path = urlsplit(url).path
+                if path not in seen_paths:
+                    seen_paths.add(path)
+                    images.append(url)
+    return {'content': content, 'images': images}
+
+
+def clean_html_record(raw: bytes) -> Dict[str, Any]:
+    """
+    Воркер пула: сырые байты -> очищенный текст, URL галереи и структурированные
+    данные страницы. BeautifulSoup запускается только если быстрый путь не справился.
+    """
+    raw = as_bytes(raw)
+    structured = scan_structured(raw)
+    record = clean_fast(raw)
+    fast_path = record is not None
+    if not fast_path:
+        soup = BeautifulSoup(decode_html(raw), 'html.parser')
+        images = gallery_urls_from_soup(soup)
+        record = {'content': clean_soup(soup), 'images': images}
+    # Нет галереи - берем фото из JSON-LD / og:image
+    record['images'] = record['images'] or structured.get('images', [])
+    record.update(structured=structured, fast_path=fast_path,
+                  bytes_in=len(raw), chars_out=len(record['content']))
+    return record
+
+
+def check_fast_path(pages: Sequence) -> List[Dict[str, Any]]:
+    """Страницы, где clean_fast вернул текст, отличный от clean_soup (пустой список - все совпало)"""
+    mismatches = []
+    for name, raw in pages:
+        fast = clean_fast(as_bytes(raw))
+        dom = clean_html(decode_html(raw))
+        if fast is not None and fast['content'] != dom:
+            mismatches.append({'page': name, 'fast': fast['content'], 'dom': dom})
+    return mismatches
+
+
+class HtmlPool:
+    """
+    Пул процессов для CPU-стадии.
+
+    Функция-воркер должна быть объявлена на уровне модуля (иначе ее нельзя
+    передать в дочерний процесс). При workers=1 работа выполняется в текущем
+    процессе без накладных расходов на пиклинг.
+    """
+
+    def __init__(self, workers: Optional[int] = None, chunksize: int = 4):
+        self.workers = max(1, workers or DEFAULT_WORKERS)
+        self.chunksize = max(1, chunksize)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def __enter__(self) -> 'HtmlPool':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    def map(self, func: Callable[[bytes], Dict[str, Any]], payloads: Sequence[bytes]) -> List[Dict[str, Any]]:
+        """Применение func к каждой странице с сохранением порядка"""
+        if self.workers == 1 or len(payloads) <= 1:
+            return [func(raw) for raw in payloads]
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return list(self._executor.map(func, payloads, chunksize=self.chunksize))
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def resolve_worker(spec: str) -> Callable[[bytes], Dict[str, Any]]:
+    """Загрузка воркера по строке вида 'module:function'"""
+    module_name, _, func_name = spec.partition(':')
+    module = importlib.import_module(module_name)
+    return getattr(module, func_name or 'clean_html_record')
+
+
+def load_pages(directory: str) -> List[bytes]:
+    pages = []
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(('.html', '.htm')):
+            with open(os.path.join(directory, name), 'rb') as f:
+                pages.append(f.read())
+    return pages
+
+
+def run_benchmark(pages: List[bytes], func: Callable, max_workers: int, repeat: int, chunksize: int) -> List[Dict[str, Any]]:
+    """Масштабирование стадии по числу процессов: 1..max_workers"""
+    rows = []
+    baseline = None
+    for workers in range(1, max_workers + 1):
+        with HtmlPool(workers, chunksize) as pool:
+            pool.map(func, pages[:workers])  # прогрев: запуск процессов не входит в замер
+            start = time.perf_counter()
+            for _ in range(repeat):
+                pool.map(func, pages)
+            elapsed = time.perf_counter() - start
+        pages_per_sec = len(pages) * repeat / elapsed if elapsed else 0.0
+        baseline = baseline or pages_per_sec
+        rows.append({
+            'workers': workers,
+            'seconds': round(elapsed, 3),
+            'pages_per_sec': round(pages_per_sec, 1),
+            'speedup': round(pages_per_sec / baseline, 2) if baseline else 0.0,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description='HTML process pool benchmark')
+    parser.add_argument('--bench', help='Папка с сохраненными .html страницами')
+    parser.add_argument('--check', action='store_true',
+                        help='Сверить быстрый путь с BeautifulSoup на REGRESSION_PAGES (и страницах из --bench)')
+    parser.add_argument('--func', default='html_pool:clean_html_record', help='Воркер в формате module:function')
+    parser.add_argument('--path', action='append', default=[], help='Дополнительный путь для импорта воркера')
+    parser.add_argument('--max-workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--chunksize', type=int, default=4)
+    args = parser.parse_args()
+
+    if args.check:
+        named = list(REGRESSION_PAGES)
+        if args.bench:
+            named += [(name, raw) for name, raw in zip(sorted(n for n in os.listdir(args.bench)
+                                                              if n.endswith(('.html', '.htm'))), load_pages(args.bench))]
+        mismatches = check_fast_path(named)
+        for row in mismatches:
+            print(f"MISMATCH {row['page']}: fast={row['fast'][:80]!r} dom={row['dom'][:80]!r}")
+        print(f"{len(named)} pages checked, {len(mismatches)} mismatches")
+        sys.exit(1 if mismatches else 0)
+    if not args.bench:
+        parser.error('нужен --bench или --check')
+
+    sys.path[:0] = args.path
+    pages = load_pages(args.bench)
+    if not pages:
+        print(f"Нет .html файлов в {args.bench}", file=sys.stderr)
+        sys.exit(1)
+
+    func = resolve_worker(args.func)
+    print(f"{len(pages)} pages, worker={args.func}, repeat={args.repeat}")
+    print(f"{'workers':>7} {'seconds':>9} {'pages/s':>9} {'speedup':>8}")
+    for row in run_benchmark(pages, func, args.max_workers, args.repeat, args.chunksize):
+        print(f"{row['workers']:>7} {row['seconds']:>9} {row['pages_per_sec']:>9} {row['speedup']:>8}")
+
+
+if __name__ == '__main__':
+    main()
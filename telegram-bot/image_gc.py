@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+Reference-aware garbage collection for the bike image directory
+Сборка мусора в папке фото: удаляются только файлы, на которые не ссылается база
+
+Mark: ссылки на фото потоком читаются из базы (bikes.main_image / gallery /
+media_json, bike_images.local_path, ...) - пути вида /images/bikes/id12/x.webp
+и контентно-адресуемые ab/<sha256>.jpg из image_store.py. Sweep: папка
+обходится генератором на os.scandir (без списка всех файлов в памяти и без
+раскрытия '*' в shell), неупомянутые файлы старше grace-периода удаляются
+пачками. Служебные файлы хранилища (index.json, phash-index.npz) не
+удаляются, а очищаются от записей об удаленных файлах.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from typing import Any, Dict, Iterator, Set, Tuple
+from urllib.parse import unquote
+
+from image_store import DEFAULT_IMAGES_DIR, INDEX_FILE
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(SCRIPT_DIR, '..', 'backend', 'database', 'eubike.db')
+PHASH_INDEX_FILE = 'phash-index.npz'
+PROTECTED_FILES = {INDEX_FILE, PHASH_INDEX_FILE}
+TEMP_SUFFIXES = ('.part', '.tmp', '.tmp.npz')
+GRACE_HOURS = 6.0               # свежие файлы могут быть скачаны, но еще не записаны в базу
+DELETE_BATCH = 500
+FETCH_ROWS = 2000
+
+# Колонки со ссылками на фото; отсутствующие в схеме пропускаются
+IMAGE_COLUMNS = {
+    'bikes': ('main_image', 'gallery', 'images', 'media_json', 'unified_data'),
+    'bike_images': ('local_path', 'image_url'),
+}
+SITE_PATH_RE = re.compile(r'/images/bikes/([^"\'\s?#\\]+)')
+CONTENT_PATH_RE = re.compile(r'(?<![0-9a-f])([0-9a-f]{2}/[0-9a-f]{64}\.[a-z0-9]{2,5})')
+
+
+def extract_references(text: str) -> Iterator[str]:
+    """Пути относительно папки фото, упомянутые в значении колонки"""
+    for match in SITE_PATH_RE.finditer(text):
+        yield unquote(match.group(1))
+    for match in CONTENT_PATH_RE.finditer(text):
+        yield match.group(1)
+
+
+def referenced_paths(db_path: str, active_only: bool = False) -> Tuple[Set[str], Dict[str, int]]:
+    """Mark: множество упомянутых путей (поток по строкам, без загрузки таблиц целиком)"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    referenced: Set[str] = set()
+    rows_scanned: Dict[str, int] = {}
+    try:
+        bikes_active = 'is_active' in {row[1] for row in conn.execute('PRAGMA table_info(bikes)')}
+        for table, candidates in IMAGE_COLUMNS.items():
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            selected = [column for column in candidates if column in columns]
+            if not selected:
+                continue
+            query = f'SELECT {", ".join(selected)} FROM {table}'
+            if active_only and table == 'bikes' and bikes_active:
+                query += ' WHERE is_active = 1'
+            elif active_only and table == 'bike_images' and bikes_active and 'bike_id' in columns:
+                query += ' WHERE bike_id IN (SELECT id FROM bikes WHERE is_active = 1)'
+            cursor = conn.execute(query)
+            count = 0
+            while True:
+                rows = cursor.fetchmany(FETCH_ROWS)
+                if not rows:
+                    break
+                count += len(rows)
+                for row in rows:
+                    for value in row:
+                        if value:
+                            referenced.update(extract_references(str(value)))
+            rows_scanned[table] = count
+    finally:
+        conn.close()
+    return referenced, rows_scanned
+
+
+def walk_files(root: str, relative: str = '') -> Iterator[Tuple[str, os.DirEntry]]:
+    """(путь относительно root, DirEntry) всех файлов; stat берется из DirEntry без лишних вызовов"""
+    try:
+        with os.scandir(os.path.join(root, relative)) as entries:
+            for entry in entries:
+                path = f'{relative}/{entry.name}' if relative else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    yield from walk_files(root, path)
+                elif entry.is_file(follow_symlinks=False):
+                    yield path, entry
+    except FileNotFoundError:
+        return
+
+
+def _is_service_file(path: str) -> bool:
+    name = os.path.basename(path)
+    return path in PROTECTED_FILES or name.endswith(TEMP_SUFFIXES)
+
+
+def prune_store_indexes(root: str, removed: Set[str]) -> Dict[str, int]:
+    """Убрать удаленные файлы из index.json и phash-index.npz"""
+    result = {'index_entries_removed': 0, 'phash_entries_removed': 0}
+    index_path = os.path.join(root, INDEX_FILE)
+    if removed and os.path.exists(index_path):
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        kept = {url: entry for url, entry in index.items() if entry.get('path') not in removed}
+        result['index_entries_removed'] = len(index) - len(kept)
+        if result['index_entries_removed']:
+            tmp_path = f'{index_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(kept, f, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+
+    phash_path = os.path.join(root, PHASH_INDEX_FILE)
+    if removed and os.path.exists(phash_path):
+        import numpy as np
+        from image_phash import PhashIndex
+
+        index = PhashIndex.load(phash_path)
+        keep = np.array([path not in removed for path in index.paths], dtype=bool)
+        result['phash_entries_removed'] = int((~keep).sum())
+        if result['phash_entries_removed']:
+            pruned = PhashIndex()
+            pruned.hashes = index.hashes[keep]
+            pruned.owners = [owner for owner, flag in zip(index.owners, keep) if flag]
+            pruned.paths = [path for path, flag in zip(index.paths, keep) if flag]
+            pruned.listings = set(pruned.owners)
+            pruned.save(phash_path)
+    return result
+
+
+def remove_empty_dirs(root: str) -> int:
+    removed = 0
+    for directory, subdirs, files in os.walk(root, topdown=False):
+        if directory != root and not subdirs and not files:
+            try:
+                os.rmdir(directory)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def collect_garbage(root: str = DEFAULT_IMAGES_DIR, db_path: str = DEFAULT_DB, dry_run: bool = False,
+                    grace_hours: float = GRACE_HOURS, batch_size: int = DELETE_BATCH,
+                    active_only: bool = False, list_limit: int = 20) -> Dict[str, Any]:
+    """Mark-and-sweep; при dry_run только отчет о том, что было бы удалено"""
+    root = os.path.abspath(root)
+    start = time.perf_counter()
+    referenced, rows_scanned = referenced_paths(db_path, active_only)
+    mark_seconds = time.perf_counter() - start
+
+    cutoff = time.time() - grace_hours * 3600
+    stats: Dict[str, Any] = {
+        'dry_run': dry_run, 'referenced': len(referenced), 'rows_scanned': rows_scanned,
+        'files': 0, 'bytes': 0, 'live_files': 0, 'orphans': 0, 'orphan_bytes': 0,
+        'too_recent': 0, 'deleted': 0, 'bytes_reclaimed': 0, 'delete_errors': 0, 'sample_orphans': [],
+    }
+    removed: Set[str] = set()
+    seen_referenced = 0
+    batch = []
+
+    def flush():
+        for path, size in batch:
+            try:
+                os.remove(os.path.join(root, path))
+            except FileNotFoundError:
+                continue
+            except OSError:
+                stats['delete_errors'] += 1
+                continue
+            removed.add(path)
+            stats['deleted'] += 1
+            stats['bytes_reclaimed'] += size
+        batch.clear()
+
+    sweep_start = time.perf_counter()
+    for path, entry in walk_files(root):
+        info = entry.stat(follow_symlinks=False)
+        stats['files'] += 1
+        stats['bytes'] += info.st_size
+        if _is_service_file(path):
+            continue
+        if path in referenced:
+            stats['live_files'] += 1
+            seen_referenced += 1
+            continue
+        if info.st_mtime > cutoff:
+            stats['too_recent'] += 1
+            continue
+        stats['orphans'] += 1
+        stats['orphan_bytes'] += info.st_size
+        if len(stats['sample_orphans']) < list_limit:
+            stats['sample_orphans'].append(path)
+        if not dry_run:
+            batch.append((path, info.st_size))
+            if len(batch) >= batch_size:
+                flush()
+    if not dry_run:
+        flush()
+        stats.update(prune_store_indexes(root, removed))
+        stats['empty_dirs_removed'] = remove_empty_dirs(root)
+    sweep_seconds = time.perf_counter() - sweep_start
+
+    # Ссылки без файла: сломанные фото в каталоге (внешние URL сюда не попадают)
+    stats['referenced_missing'] = len(referenced) - seen_referenced
+    stats['mark_seconds'] = round(mark_seconds, 3)
+    stats['sweep_seconds'] = round(sweep_seconds, 3)
+    stats['files_per_sec'] = round(stats['files'] / sweep_seconds) if sweep_seconds else 0
+    stats['mb_reclaimable'] = round(stats['orphan_bytes'] / 1024 / 1024, 2)
+    if not dry_run:
+        stats['deleted_per_sec'] = round(stats['deleted'] / sweep_seconds) if sweep_seconds else 0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mark-and-sweep GC for bike images')
+    parser.add_argument('--images-dir', default=DEFAULT_IMAGES_DIR)
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite база каталога')
+    parser.add_argument('--dry-run', action='store_true', help='Только отчет: что и сколько байт было бы удалено')
+    parser.add_argument('--grace-hours', type=float, default=GRACE_HOURS, help='Не трогать файлы моложе N часов')
+    parser.add_argument('--batch-size', type=int, default=DELETE_BATCH)
+    parser.add_argument('--active-only', action='store_true',
+                        help='Живыми считать только фото активных байков (снятые с публикации - мусор)')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.db):
+        print(f"База не найдена: {args.db}", file=sys.stderr)
+        sys.exit(1)
+    stats = collect_garbage(args.images_dir, args.db, args.dry_run, args.grace_hours, args.batch_size, args.active_only)
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
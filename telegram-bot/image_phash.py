@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Perceptual-hash index over listing photos
+Индекс перцептивных хэшей фото объявлений (поиск повторно использованных фото)
+
+Хэши (aHash / dHash / pHash, 64 бита) считаются векторно в NumPy для пачки
+изображений сразу. Поиск соседей в радиусе Хэмминга - multi-index hashing:
+64-битный хэш делится на 4 куска по 16 бит; по принципу Дирихле у любого
+соседа в радиусе r хотя бы один кусок отличается не более чем на r // 4 бит.
+Для каждого куска хранится отсортированный массив значений, кандидаты
+находятся через searchsorted и проверяются векторным popcount.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_INDEX_FILE = os.path.join(SCRIPT_DIR, '..', 'backend', 'public', 'images', 'bikes', 'phash-index.npz')
+DEFAULT_RADIUS = int(os.getenv('PHASH_RADIUS', '6'))
+
+HASH_SIZE = 8           # 8x8 = 64 бита
+DCT_SIZE = 32           # pHash: DCT по картинке 32x32
+CHUNKS = 4
+CHUNK_BITS = 64 // CHUNKS
+CHUNK_MASK = np.uint64((1 << CHUNK_BITS) - 1)
+MAX_CHUNK_FLIPS = 2     # больше - дешевле полный векторный проход
+
+POPCOUNT8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+
+def popcount64(values: np.ndarray) -> np.ndarray:
+    """Число единичных бит для массива uint64"""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return POPCOUNT8[values.view(np.uint8)].reshape(-1, 8).sum(axis=1, dtype=np.int32)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    matrix[0] /= np.sqrt(2.0)
+    return matrix.astype(np.float32)
+
+
+DCT = _dct_matrix(DCT_SIZE)
+
+
+def _pack(bits: np.ndarray) -> np.ndarray:
+    """(N, 64) bool -> (N,) uint64"""
+    packed = np.packbits(bits.reshape(len(bits), -1), axis=1)
+    return packed.view('>u8').ravel().astype(np.uint64)
+
+
+def ahash_batch(gray8: np.ndarray) -> np.ndarray:
+    """aHash для пачки (N, 8, 8)"""
+    return _pack(gray8 > gray8.mean(axis=(1, 2), keepdims=True))
+
+
+def dhash_batch(gray9x8: np.ndarray) -> np.ndarray:
+    """dHash для пачки (N, 8, 9): сравнение соседних пикселей по строке"""
+    return _pack(gray9x8[:, :, 1:] > gray9x8[:, :, :-1])
+
+
+def phash_batch(gray32: np.ndarray) -> np.ndarray:
+    """pHash для пачки (N, 32, 32): 2D DCT матричным умножением, низкие частоты против медианы"""
+    coeffs = np.einsum('ij,njk,lk->nil', DCT, gray32, DCT, optimize=True)
+    low = coeffs[:, :HASH_SIZE, :HASH_SIZE].reshape(len(gray32), -1)
+    # DC-коэффициент не участвует в медиане
+    median = np.median(low[:, 1:], axis=1, keepdims=True)
+    return _pack(low > median)
+
+
+HASHERS = {
+    'ahash': ((HASH_SIZE, HASH_SIZE), ahash_batch),
+    'dhash': ((HASH_SIZE + 1, HASH_SIZE), dhash_batch),
+    'phash': ((DCT_SIZE, DCT_SIZE), phash_batch),
+}
+
+
+def load_gray(paths: Sequence[str], size) -> np.ndarray:
+    """Загрузка и уменьшение изображений в оттенки серого: (N, h, w) float32"""
+    from PIL import Image
+
+    batch = np.empty((len(paths), size[1], size[0]), dtype=np.float32)
+    for i, path in enumerate(paths):
+        with Image.open(path) as image:
+            batch[i] = np.asarray(image.convert('L').resize(size, Image.LANCZOS), dtype=np.float32)
+    return batch
+
+
+def hash_files(paths: Sequence[str], kind: str = 'phash') -> np.ndarray:
+    if not paths:
+        return np.empty(0, dtype=np.uint64)
+    size, hasher = HASHERS[kind]
+    return hasher(load_gray(paths, size))
+
+
+def _flip_masks(bits: int, max_flips: int) -> np.ndarray:
+    masks = [0]
+    for flips in range(1, max_flips + 1):
+        for positions in combinations(range(bits), flips):
+            masks.append(sum(1 << p for p in positions))
+    return np.array(masks, dtype=np.uint64)
+
+
+FLIP_MASKS = {flips: _flip_masks(CHUNK_BITS, flips) for flips in range(MAX_CHUNK_FLIPS + 1)}
+
+
+class PhashIndex:
+    """
+    Индекс хэшей всех фото: какое объявление, какой файл.
+
+    Новые хэши попадают в хвост, который проверяется полным проходом; когда хвост
+    разрастается, отсортированные таблицы кусков перестраиваются.
+    """
+
+    def __init__(self):
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.owners: List[str] = []
+        self.paths: List[str] = []
+        self.listings = set()
+        self._tables = []       # [(sorted chunk values, positions)] для self.hashes[:self._indexed]
+        self._indexed = 0
+
+    def __len__(self) -> int:
+        return len(self.hashes)
+
+    def add(self, listing: str, hashes: np.ndarray, paths: Optional[Sequence[str]] = None) -> None:
+        self.hashes = np.concatenate([self.hashes, np.asarray(hashes, dtype=np.uint64)])
+        self.owners.extend([listing] * len(hashes))
+        self.listings.add(listing)
+        self.paths.extend(list(paths) if paths is not None else [''] * len(hashes))
+        pending = len(self.hashes) - self._indexed
+        if pending > max(1024, self._indexed // 20):
+            self.rebuild()
+
+    def rebuild(self) -> None:
+        self._tables = []
+        for chunk in range(CHUNKS):
+            values = (self.hashes >> np.uint64(chunk * CHUNK_BITS)) & CHUNK_MASK
+            order = np.argsort(values, kind='stable')
+            self._tables.append((values[order], order))
+        self._indexed = len(self.hashes)
+
+    def _candidates(self, value: np.uint64, radius: int) -> np.ndarray:
+        flips = radius // CHUNKS
+        if flips > MAX_CHUNK_FLIPS or not self._indexed:
+            return np.arange(len(self.hashes))
+        found = []
+        masks = FLIP_MASKS[flips]
+        for chunk, (values, order) in enumerate(self._tables):
+            probe = ((value >> np.uint64(chunk * CHUNK_BITS)) & CHUNK_MASK) ^ masks
+            left = np.searchsorted(values, probe, side='left')
+            right = np.searchsorted(values, probe, side='right')
+            found.extend(order[l:r] for l, r in zip(left, right) if r > l)
+        found.append(np.arange(self._indexed, len(self.hashes)))
+        return np.unique(np.concatenate(found)) if found else np.empty(0, dtype=np.int64)
+
+    def query(self, value, radius: int = DEFAULT_RADIUS):
+        """Позиции и расстояния всех хэшей в радиусе Хэмминга radius"""
+        value = np.uint64(value)
+        candidates = self._candidates(value, radius)
+        distances = popcount64(self.hashes[candidates] ^ value)
+        keep = distances <= radius
+        return candidates[keep], distances[keep]
+
+    def check_listing(self, listing: str, hashes: np.ndarray, radius: int = DEFAULT_RADIUS) -> List[Dict[str, Any]]:
+        """Совпадения фото объявления с фото других объявлений"""
+        matches = []
+        for image_index, value in enumerate(np.asarray(hashes, dtype=np.uint64)):
+            positions, distances = self.query(value, radius)
+            for position, distance in zip(positions.tolist(), distances.tolist()):
+                if self.owners[position] != listing:
+                    matches.append({
+                        'image': image_index,
+                        'listing': self.owners[position],
+                        'path': self.paths[position],
+                        'distance': distance,
+                    })
+        return sorted(matches, key=lambda m: m['distance'])
+
+    def save(self, path: str) -> None:
+        listings, owner_ids = np.unique(np.array(self.owners, dtype=str), return_inverse=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez_compressed(tmp_path, hashes=self.hashes, listings=listings,
+                            owner_ids=owner_ids.astype(np.int32), paths=np.array(self.paths, dtype=str))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PhashIndex':
+        index = cls()
+        if os.path.exists(path):
+            with np.load(path) as data:
+                index.hashes = data['hashes'].astype(np.uint64)
+                index.owners = data['listings'][data['owner_ids']].tolist()
+                index.paths = data['paths'].tolist()
+            index.listings = set(index.owners)
+            index.rebuild()
+        return index
+
+
+def run_benchmark(size: int, queries: int, radius: int, seed: int = 42) -> Dict[str, Any]:
+    """Индекс из size случайных хэшей, запросы - искаженные копии существующих"""
+    rng = np.random.default_rng(seed)
+    hashes = rng.integers(0, 2**63, size=size, dtype=np.int64).astype(np.uint64) \
+        | (rng.integers(0, 2, size=size, dtype=np.int64).astype(np.uint64) << np.uint64(63))
+
+    index = PhashIndex()
+    start = time.perf_counter()
+    index.add('corpus', hashes)
+    index.rebuild()
+    build_s = time.perf_counter() - start
+
+    targets = rng.integers(0, size, size=queries)
+    probes = hashes[targets].copy()
+    for i in range(queries):
+        for bit in rng.choice(64, size=rng.integers(0, radius + 1), replace=False):
+            probes[i] ^= np.uint64(1) << np.uint64(int(bit))
+
+    def timed(fn):
+        latencies = []
+        hits = 0
+        for target, probe in zip(targets, probes):
+            start = time.perf_counter()
+            positions = fn(probe)
+            latencies.append((time.perf_counter() - start) * 1000)
+            hits += int(target in positions)
+        latencies.sort()
+        return {
+            'avg_ms': round(sum(latencies) / len(latencies), 3),
+            'p95_ms': round(latencies[int(0.95 * (len(latencies) - 1))], 3),
+            'recall': round(hits / len(latencies), 3),
+        }
+
+    return {
+        'size': size,
+        'queries': queries,
+        'radius': radius,
+        'build_ms': round(build_s * 1000, 1),
+        'multi_index': timed(lambda probe: index.query(probe, radius)[0]),
+        'full_scan': timed(lambda probe: np.nonzero(popcount64(hashes ^ probe) <= radius)[0]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Perceptual-hash index for listing photos')
+    parser.add_argument('--bench', type=int, metavar='N', help='Бенчмарк на N случайных хэшах (например 100000)')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--radius', type=int, default=DEFAULT_RADIUS)
+    parser.add_argument('--index', default=DEFAULT_INDEX_FILE, help='Файл индекса (.npz)')
+    parser.add_argument('--listing', help='ID/URL объявления для проверки и добавления в индекс')
+    parser.add_argument('--kind', choices=sorted(HASHERS), default='phash')
+    parser.add_argument('images', nargs='*', help='Файлы фото объявления')
+    args = parser.parse_args()
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.bench, args.queries, args.radius), indent=2))
+        return
+    if not args.listing or not args.images:
+        parser.error('нужны --listing и файлы фото (или --bench N)')
+
+    index = PhashIndex.load(args.index)
+    hashes = hash_files(args.images, args.kind)
+    matches = index.check_listing(args.listing, hashes, args.radius)
+    if args.listing not in index.listings:
+        index.add(args.listing, hashes, args.images)
+        index.save(args.index)
+    print(json.dumps({'listing': args.listing, 'matches': matches}, ensure_ascii=False, indent=2))
+    sys.exit(1 if matches else 0)
+
+
+if __name__ == '__main__':
+    main()
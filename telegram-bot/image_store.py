@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Gallery image extraction and content-addressed image store
+Извлечение галереи объявления и контентно-адресуемое хранилище фото
+
+Файлы называются по SHA-256 содержимого (<root>/ab/abcdef....jpg), поэтому
+одно и то же фото из разных объявлений хранится один раз. index.json хранит
+соответствие URL -> хэш: уже скачанные URL пропускаются, а прерванная загрузка
+продолжается с места остановки (файлы пишутся через .part + rename).
+"""
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+# Та же папка, что и у image-handler.js
+DEFAULT_IMAGES_DIR = os.getenv('IMAGE_STORE_DIR', os.path.join(SCRIPT_DIR, '..', 'backend', 'public', 'images', 'bikes'))
+INDEX_FILE = 'index.json'
+MAX_FILE_SIZE = int(os.getenv('IMAGE_MAX_FILE_SIZE', str(20 * 1024 * 1024)))
+INDEX_SAVE_EVERY = 50
+
+# Галерея: (якорь, искать <img> внутри элемента); из этого же списка строятся
+# CSS-селекторы для BeautifulSoup и якоря байтового пути html_pool
+GALLERY_ANCHORS = [
+    (('class', 'galleryimage-element'), True),
+    (('id', 'viewad-image'), False),
+    (('class', 'galleryimage--navigation'), True),
+]
+GALLERY_SELECTORS = [('.' if kind == 'class' else '#') + value + (' img' if nested else '')
+                     for (kind, value), nested in GALLERY_ANCHORS]
+IMAGE_ATTRS = ['data-imgsrc', 'data-src', 'src']
+
+CONTENT_TYPE_EXT = {
+    'image/jpeg': 'jpg',
+    'image/png': 'png',
+    'image/webp': 'webp',
+    'image/gif': 'gif',
+}
+
+
+def gallery_urls_from_soup(soup) -> List[str]:
+    """URL фотографий галереи из уже разобранного документа (без дублей по пути)"""
+    urls = []
+    seen_paths = set()
+
+    def add(url):
+        if not url or not url.startswith(('http://', 'https://', '//')):
+            return
+        if url.startswith('//'):
+            url = 'https:' + url
+        # Миниатюры и крупные версии отличаются только параметром ?rule=
+        path = urlsplit(url).path
+        if path not in seen_paths:
+            seen_paths.add(path)
+            urls.append(url)
+
+    for selector in GALLERY_SELECTORS:
+        for img in soup.select(selector):
+            for attr in IMAGE_ATTRS:
+                if img.get(attr):
+                    add(img.get(attr))
+                    break
+
+    if not urls:
+        og_image = soup.find('meta', attrs={'property': 'og:image'})
+        if og_image:
+            add(og_image.get('content'))
+    return urls
+
+
+def extract_gallery_urls(html: str) -> List[str]:
+    from bs4 import BeautifulSoup
+    return gallery_urls_from_soup(BeautifulSoup(html, 'html.parser'))
+
+
+def detect_ext(data: bytes, content_type: Optional[str]) -> str:
+    if data[:3] == b'\xff\xd8\xff':
+        return 'jpg'
+    if data[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'png'
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'webp'
+    if data[:4] == b'GIF8':
+        return 'gif'
+    return CONTENT_TYPE_EXT.get((content_type or '').split(';')[0].strip(), 'jpg')
+
+
+class ImageStore:
+    """Контентно-адресуемое хранилище с параллельной загрузкой"""
+
+    def __init__(self, root: str = DEFAULT_IMAGES_DIR, workers: int = 8, timeout: int = 15):
+        self.root = os.path.abspath(root)
+        self.workers = max(1, workers)
+        self.timeout = timeout
+        self.index_path = os.path.join(self.root, INDEX_FILE)
+        self._lock = threading.Lock()
+        self._session = None
+        self._dirty = 0
+        os.makedirs(self.root, exist_ok=True)
+        self.index = self._load_index()
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+    def save_index(self) -> None:
+        with self._lock:
+            snapshot = json.dumps(self.index, ensure_ascii=False)
+            self._dirty = 0
+        tmp_path = f'{self.index_path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(snapshot)
+        os.replace(tmp_path, self.index_path)
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            self._session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=self.workers, pool_maxsize=self.workers, max_retries=2)
+            self._session.mount('https://', adapter)
+            self._session.mount('http://', adapter)
+            self._session.headers['User-Agent'] = (
+                'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                '(KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+            )
+        return self._session
+
+    def relative_path(self, digest: str, ext: str) -> str:
+        return f'{digest[:2]}/{digest}.{ext}'
+
+    def cached(self, url: str) -> Optional[str]:
+        entry = self.index.get(url)
+        if entry and os.path.exists(os.path.join(self.root, entry['path'])):
+            return entry['path']
+        return None
+
+    def _fetch_one(self, url: str) -> Dict[str, Any]:
+        """Загрузка одного URL; возвращает исход для статистики"""
+        path = self.cached(url)
+        if path:
+            return {'url': url, 'path': path, 'status': 'cached', 'bytes': 0}
+        try:
+            response = self.session.get(url, timeout=self.timeout)
+            response.raise_for_status()
+            data = response.content
+        except Exception as e:
+            return {'url': url, 'path': None, 'status': 'failed', 'bytes': 0, 'error': str(e)}
+        if not data or len(data) > MAX_FILE_SIZE:
+            return {'url': url, 'path': None, 'status': 'failed', 'bytes': len(data), 'error': 'size'}
+
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.relative_path(digest, detect_ext(data, response.headers.get('Content-Type')))
+        full_path = os.path.join(self.root, path)
+        status = 'duplicate'
+        if not os.path.exists(full_path):
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            tmp_path = f'{full_path}.{threading.get_ident()}.part'
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, full_path)
+            status = 'downloaded'
+
+        with self._lock:
+            self.index[url] = {'path': path, 'sha256': digest, 'bytes': len(data)}
+            self._dirty += 1
+            save_now = self._dirty >= INDEX_SAVE_EVERY
+        if save_now:
+            self.save_index()
+        return {'url': url, 'path': path, 'status': status, 'bytes': len(data)}
+
+    def download_listings(self, listings: Dict[str, List[str]]) -> Dict[str, Any]:
+        """
+        Параллельная загрузка галерей нескольких объявлений.
+        listings: URL объявления -> список URL фото.
+        Возвращает {'files': {объявление: [относительные пути]}, 'stats': {...}}.
+        """
+        unique_urls = list(dict.fromkeys(url for urls in listings.values() for url in urls))
+        requested = sum(len(urls) for urls in listings.values())
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            outcomes = {o['url']: o for o in executor.map(self._fetch_one, unique_urls)}
+        elapsed = time.perf_counter() - start
+        self.save_index()
+
+        files = {
+            listing: [outcomes[url]['path'] for url in urls if outcomes[url]['path']]
+            for listing, urls in listings.items()
+        }
+        counts = {'cached': 0, 'downloaded': 0, 'duplicate': 0, 'failed': 0}
+        for outcome in outcomes.values():
+            counts[outcome['status']] += 1
+        transferred = sum(o['bytes'] for o in outcomes.values())
+        fetched = counts['downloaded'] + counts['duplicate']
+        # Повторы: тот же URL в нескольких объявлениях, уже скачанный URL, тот же контент под другим URL
+        reused = (requested - len(unique_urls)) + counts['cached'] + counts['duplicate']
+
+        stats = {
+            'listings': len(listings),
+            'requested': requested,
+            'unique_urls': len(unique_urls),
+            **counts,
+            'bytes': transferred,
+            'seconds': round(elapsed, 3),
+            'files_per_sec': round(fetched / elapsed, 1) if elapsed else 0.0,
+            'mb_per_sec': round(transferred / elapsed / 1024 / 1024, 2) if elapsed else 0.0,
+            'dedup_ratio': round(reused / requested, 3) if requested else 0.0,
+        }
+        return {'files': files, 'stats': stats}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Download listing galleries into the content-addressed store')
+    parser.add_argument('html', nargs='+', help='Сохраненные страницы объявлений (.html)')
+    parser.add_argument('--images-dir', default=DEFAULT_IMAGES_DIR)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    listings = {}
+    for path in args.html:
+        with open(path, 'r', encoding='utf-8', errors='replace') as f:
+            listings[path] = extract_gallery_urls(f.read())
+
+    result = ImageStore(args.images_dir, args.workers).download_listings(listings)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
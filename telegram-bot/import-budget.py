@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Import-time budget check for groq-parser.py
+Проверка бюджета времени импорта для groq-parser.py
+
+Запускает парсер под `python -X importtime` в сценариях холодного старта
+(--help и отсутствующий GROQ_API_KEY), разбирает stderr и выводит самые
+дорогие импорты. Импорты самого интерпретатора (site, encodings...) берутся из
+пустого запуска и не учитываются. Код выхода 1, если время импорта скрипта
+превышает бюджет или на холодном пути загрузился тяжелый модуль.
+"""
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+from typing import Dict, List, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+PARSER_SCRIPT = os.path.join(SCRIPT_DIR, 'groq-parser.py')
+
+# Сценарии холодного старта: ни один из них не должен тянуть requests/bs4/groq
+SCENARIOS = {
+    'help': ['--help'],
+    'missing-key': ['https://www.kleinanzeigen.de/s-anzeige/example'],
+}
+HEAVY_MODULES = ('requests', 'bs4', 'groq', 'html_pool')
+
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int]]:
+    """Разбор строк 'import time: self [us] | cumulative | imported package'"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+            rows.append((name.rstrip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue
+    return rows
+
+
+def run_importtime(argv: List[str]) -> Tuple[float, List[Tuple[str, int, int]]]:
+    env = dict(os.environ)
+    env.pop('GROQ_API_KEY', None)
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + argv,
+        capture_output=True, text=True, env=env, cwd=SCRIPT_DIR,
+    )
+    return (time.perf_counter() - start) * 1000, parse_importtime(proc.stderr)
+
+
+def measure(args: List[str], startup_modules: set) -> Dict:
+    wall_ms, rows = run_importtime([PARSER_SCRIPT] + args)
+    # Модули верхнего уровня записаны без отступа, их cumulative не пересекаются
+    top_level = [
+        (name.strip(), cum) for name, _, cum in rows
+        if not name.startswith('  ') and name.strip() not in startup_modules
+    ]
+    loaded = {name.strip().split('.')[0] for name, _, _ in rows}
+    return {
+        'wall_ms': wall_ms,
+        'import_ms': sum(cum for _, cum in top_level) / 1000,
+        'top': sorted(top_level, key=lambda item: item[1], reverse=True),
+        'heavy': sorted(loaded.intersection(HEAVY_MODULES)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='groq-parser.py import-time budget check')
+    parser.add_argument('--budget-ms', type=float, default=float(os.getenv('GROQ_PARSER_IMPORT_BUDGET_MS', '30')),
+                        help='Максимальное время импорта модулей скрипта (мс)')
+    parser.add_argument('--top', type=int, default=10, help='Сколько самых дорогих импортов показать')
+    args = parser.parse_args()
+
+    startup_ms, startup_rows = run_importtime(['-c', 'pass'])
+    startup_modules = {name.strip() for name, _, _ in startup_rows}
+    print(f"interpreter startup: {startup_ms:.1f} ms wall, {len(startup_modules)} modules (excluded)")
+
+    failed = False
+    for scenario, scenario_args in SCENARIOS.items():
+        result = measure(scenario_args, startup_modules)
+        over_budget = result['import_ms'] > args.budget_ms
+        status = 'FAIL' if over_budget or result['heavy'] else 'OK'
+        failed = failed or status == 'FAIL'
+
+        print(f"[{scenario}] {status}: imports {result['import_ms']:.1f} ms "
+              f"(budget {args.budget_ms:.0f} ms), process wall {result['wall_ms']:.1f} ms")
+        if result['heavy']:
+            print(f"  heavy modules imported on cold path: {', '.join(result['heavy'])}")
+        for name, cumulative_us in result['top'][:args.top]:
+            print(f"  {cumulative_us / 1000:8.2f} ms  {name}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
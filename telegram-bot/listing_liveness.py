@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Bulk liveness checks for catalog listings
+Массовая проверка актуальности объявлений каталога (live / sold / deleted)
+
+Вместо загрузки и полного разбора страницы на каждое объявление делается
+легкий запрос: условный GET (If-None-Match / If-Modified-Since) без
+следования редиректам, тело читается потоком только до первых маркеров
+статуса и не дальше MAX_SCAN_BYTES. 404/410 и редирект с объявления на
+поиск или категорию - удалено; маркеры "Reserviert"/"deaktiviert" - продано;
+304 или страница объявления без маркеров - живое. Ошибки сети, 429, 5xx и
+прочие редиректы (логин, согласие, проверка на бота) дают 'unknown' и никогда
+не снимают объявление с публикации.
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(SCRIPT_DIR, '..', 'backend', 'database', 'eubike.db')
+VALIDATORS_FILE = os.getenv('LIVENESS_VALIDATORS_FILE', os.path.join(SCRIPT_DIR, 'liveness-validators.json'))
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36'
+MAX_SCAN_BYTES = 256 * 1024
+CHUNK_SIZE = 16 * 1024
+DEFAULT_WORKERS = 32
+DEFAULT_TIMEOUT = 15
+
+LIVE, SOLD, DELETED, UNKNOWN = 'live', 'sold', 'deleted', 'unknown'
+
+# Маркеры по площадкам (как в backend/services/availability-checker.js), в нижнем регистре
+MARKERS = {
+    'kleinanzeigen': {
+        DELETED: [b'anzeige wurde gel\xc3\xb6scht', b'leider nicht gefunden',
+                  b'diese anzeige ist nicht mehr verf\xc3\xbcgbar', b'>gel\xc3\xb6scht<'],
+        SOLD: [b'anzeige ist deaktiviert', b'>reserviert<', b'>verkauft<'],
+    },
+    'buycycle': {
+        DELETED: [b'page not found'],
+        SOLD: [b'>sold<', b'>verkauft<'],
+    },
+    'bikeflip': {
+        SOLD: [b'>sold<', b'>verkauft<'],
+    },
+}
+# Ниже этих якорей маркеров статуса уже нет (бейджи стоят у заголовка) - дальше не читаем
+STOP_ANCHORS = {
+    'kleinanzeigen': b'id="viewad-description"',
+}
+# Признак того, что редирект ведет на страницу того же объявления (id в пути)
+AD_ID_RE = re.compile(r'/(\d{6,})(?:-|$|/|\?)')
+# Куда площадка уводит с удаленного объявления: поиск и категории того же сайта
+REMOVED_REDIRECT_PATHS = {
+    'kleinanzeigen': re.compile(r'^/s-(?!anzeige/)'),
+    'buycycle': re.compile(r'/shop(?:/|$)'),
+    'bikeflip': re.compile(r'/(?:search|suche|bikes|fahrraeder)(?:/|$)'),
+}
+
+
+def platform_of(url: str) -> str:
+    host = urlsplit(url).netloc.lower()
+    for name in MARKERS:
+        if name in host:
+            return name
+    return 'kleinanzeigen'
+
+
+def scan_markers(chunks: Iterable[bytes], platform: str, limit: int = MAX_SCAN_BYTES) -> Tuple[Optional[str], int]:
+    """(статус по первому найденному маркеру или None, сколько байт прочитано)"""
+    markers = MARKERS.get(platform, {})
+    stop = STOP_ANCHORS.get(platform)
+    longest = max([len(m) for group in markers.values() for m in group] + [len(stop or b'')])
+    tail = b''
+    read = 0
+    for chunk in chunks:
+        read += len(chunk)
+        window = tail + chunk.lower()
+        for status in (DELETED, SOLD):
+            if any(marker in window for marker in markers.get(status, ())):
+                return status, read
+        if stop and stop in window:
+            break
+        tail = window[-longest:]
+        if read >= limit:
+            break
+    return None, read
+
+
+def classify_response(url: str, status: int, location: Optional[str] = None) -> Optional[str]:
+    """Статус только по коду ответа и редиректу; None - нужно посмотреть тело"""
+    if status == 304:
+        return LIVE
+    if status in (404, 410):
+        return DELETED
+    if 300 <= status < 400:
+        # Редирект на тот же id - живое (смена slug); на поиск/категорию той же площадки - удалено;
+        # любой другой (логин, согласие, проверка на бота, чужой хост, нет Location) - неизвестно
+        if not location:
+            return UNKNOWN
+        target = urlsplit(urljoin(url, location))
+        source_id = AD_ID_RE.search(urlsplit(url).path)
+        target_id = AD_ID_RE.search(target.path)
+        if source_id and target_id and source_id.group(1) == target_id.group(1):
+            return LIVE
+        platform = platform_of(url)
+        removed_path = REMOVED_REDIRECT_PATHS.get(platform)
+        if platform in target.netloc.lower() and removed_path and removed_path.search(target.path):
+            return DELETED
+        return UNKNOWN
+    if status == 200:
+        return None
+    return UNKNOWN
+
+
+class LivenessChecker:
+    """Пул легких запросов с общей сессией (keep-alive) и ограничением частоты"""
+
+    def __init__(self, workers: int = DEFAULT_WORKERS, timeout: float = DEFAULT_TIMEOUT, rate: Optional[float] = None,
+                 method: str = 'get', validators_path: Optional[str] = VALIDATORS_FILE, session=None):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.workers = workers
+        self.timeout = timeout
+        self.method = method
+        self.validators_path = validators_path
+        self.validators: Dict[str, Dict[str, str]] = {}
+        if validators_path and os.path.exists(validators_path):
+            with open(validators_path, 'r', encoding='utf-8') as f:
+                self.validators = json.load(f)
+        if session is None:
+            session = requests.Session()
+            session.headers['User-Agent'] = USER_AGENT
+            session.headers['Accept-Language'] = 'de-DE,de;q=0.9'
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        self._interval = 1.0 / rate if rate else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'not_modified': 0, 'redirects': 0, 'bytes_read': 0, 'errors': 0}
+
+    def _throttle(self) -> None:
+        if not self._interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self._interval
+        if wait > 0:
+            time.sleep(wait)
+
+    def _count(self, key: str, value: int = 1) -> None:
+        with self._lock:
+            self.stats[key] += value
+
+    def check(self, url: str) -> Dict[str, Any]:
+        self._throttle()
+        headers = {}
+        known = self.validators.get(url, {})
+        if known.get('etag'):
+            headers['If-None-Match'] = known['etag']
+        if known.get('last_modified'):
+            headers['If-Modified-Since'] = known['last_modified']
+        self._count('requests')
+        try:
+            if self.method == 'head':
+                response = self.session.head(url, headers=headers, allow_redirects=False, timeout=self.timeout)
+            else:
+                response = self.session.get(url, headers=headers, allow_redirects=False,
+                                            timeout=self.timeout, stream=True)
+        except Exception as e:
+            self._count('errors')
+            return {'url': url, 'state': UNKNOWN, 'http_status': None, 'reason': str(e)[:200], 'bytes': 0}
+
+        read = 0
+        try:
+            state = classify_response(url, response.status_code, response.headers.get('Location'))
+            reason = f'http {response.status_code}'
+            if response.status_code == 304:
+                self._count('not_modified')
+            elif 300 <= response.status_code < 400:
+                self._count('redirects')
+                reason = f"redirect -> {response.headers.get('Location')}"
+            if state is None:
+                marker_state = None
+                if self.method != 'head':
+                    marker_state, read = scan_markers(response.iter_content(CHUNK_SIZE), platform_of(url))
+                state = marker_state or LIVE
+                reason = 'marker' if marker_state else 'no markers'
+                with self._lock:
+                    validators = {key: response.headers[header] for key, header in
+                                  (('etag', 'ETag'), ('last_modified', 'Last-Modified')) if response.headers.get(header)}
+                    if validators and state == LIVE:
+                        self.validators[url] = validators
+                    else:
+                        self.validators.pop(url, None)
+        finally:
+            response.close()  # недочитанное тело не тянем: соединение закрывается, а не дочитывается
+        self._count('bytes_read', read)
+        return {'url': url, 'state': state, 'http_status': response.status_code, 'reason': reason, 'bytes': read}
+
+    def check_many(self, urls: List[str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            results = list(executor.map(self.check, urls))
+        elapsed = time.perf_counter() - start
+        counts: Dict[str, int] = {}
+        for result in results:
+            counts[result['state']] = counts.get(result['state'], 0) + 1
+        summary = dict(self.stats, urls=len(urls), states=counts, seconds=round(elapsed, 3),
+                       urls_per_sec=round(len(urls) / elapsed, 2) if elapsed else 0.0,
+                       avg_bytes=round(self.stats['bytes_read'] / len(urls)) if urls else 0)
+        return {'results': results, 'summary': summary}
+
+    def save_validators(self) -> None:
+        if not self.validators_path:
+            return
+        tmp_path = f'{self.validators_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.validators, f)
+        os.replace(tmp_path, self.validators_path)
+
+
+def active_listings(db_path: str, limit: Optional[int] = None) -> List[Tuple[int, str]]:
+    """(id, source_url) активных байков, давно проверенные - первыми"""
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    try:
+        query = ("SELECT id, source_url FROM bikes WHERE is_active = 1 AND source_url LIKE 'http%' "
+                 "ORDER BY last_checked IS NOT NULL, last_checked ASC")
+        if limit:
+            query += f' LIMIT {int(limit)}'
+        return conn.execute(query).fetchall()
+    finally:
+        conn.close()
+
+
+def apply_results(db_path: str, listings: List[Tuple[int, str]], results: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Одна транзакция: sold/deleted снимаются с публикации, live - отметка last_checked"""
+    by_url = {result['url']: result['state'] for result in results}
+    deactivate = [(by_url[url], bike_id) for bike_id, url in listings if by_url.get(url) in (SOLD, DELETED)]
+    touched = [(bike_id,) for bike_id, url in listings if by_url.get(url) == LIVE]
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            conn.executemany("UPDATE bikes SET is_active = 0, deactivation_reason = ?, "
+                             "deactivated_at = datetime('now') WHERE id = ? AND is_active = 1", deactivate)
+            conn.executemany("UPDATE bikes SET last_checked = datetime('now') WHERE id = ?", touched)
+    finally:
+        conn.close()
+    return {'deactivated': len(deactivate), 'last_checked': len(touched)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk liveness check for catalog listings')
+    parser.add_argument('urls', nargs='*', help='URL объявлений (без них - активные байки из базы)')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite база каталога')
+    parser.add_argument('--limit', type=int, help='Сколько активных байков проверить')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--rate', type=float, help='Не больше N запросов в секунду')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT)
+    parser.add_argument('--head', action='store_true', help='Только HEAD: статус и редирект, без маркеров в теле')
+    parser.add_argument('--dry-run', action='store_true', help='Не обновлять каталог')
+    parser.add_argument('--details', action='store_true', help='Вывести результат по каждому URL')
+    args = parser.parse_args()
+
+    listings = [(None, url) for url in args.urls] if args.urls else active_listings(args.db, args.limit)
+    checker = LivenessChecker(args.workers, args.timeout, args.rate, 'head' if args.head else 'get')
+    checked = checker.check_many([url for _, url in listings])
+    checker.save_validators()
+
+    output: Dict[str, Any] = {'summary': checked['summary']}
+    if not args.urls and not args.dry_run:
+        output['catalog'] = apply_results(args.db, listings, checked['results'])
+    if args.details or args.urls:
+        output['results'] = checked['results']
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
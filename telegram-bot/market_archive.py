@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Columnar archive for market_history
+Колоночный архив market_history с быстрыми агрегатами
+
+Старые строки market_history переносятся в помесячные партиции
+(market_history-YYYY-MM.npz, сжатые массивы NumPy) и удаляются из горячей
+таблицы. Категориальные поля (бренд, модель, категория, ...) хранятся кодами
+со словарем партиции, тексты (title, source_url) - одним блоком байтов со
+смещениями. Запрос читает только партиции нужного окна и только нужные
+колонки; группировка и квантили считаются векторно, при желании вместе со
+свежими строками из SQLite.
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DB = os.path.join(SCRIPT_DIR, '..', 'backend', 'database', 'eubike.db')
+DEFAULT_ARCHIVE_DIR = os.getenv('MARKET_ARCHIVE_DIR',
+                                os.path.join(SCRIPT_DIR, '..', 'backend', 'database', 'market-archive'))
+PARTITION_PREFIX = 'market_history-'
+DEFAULT_OLDER_THAN_DAYS = 90
+BATCH_SIZE = 50000
+FLUSH_ROWS = 500000         # сколько строк держать в памяти до записи партиций
+
+NUMERIC_COLUMNS = {'price_eur': np.float64, 'year': np.int16, 'quality_score': np.float32}
+CATEGORICAL_COLUMNS = ('brand', 'model', 'category', 'frame_size', 'condition',
+                       'frame_material', 'trim_level', 'source_platform')
+TEXT_COLUMNS = ('title', 'source_url', 'source_ad_id')
+ROW_COLUMNS = ('id', 'ts') + tuple(NUMERIC_COLUMNS) + CATEGORICAL_COLUMNS + TEXT_COLUMNS
+STATS = ('count', 'mean', 'median', 'p25', 'p75', 'min', 'max')
+QUANTILES = {'median': 0.5, 'p25': 0.25, 'p75': 0.75}
+
+# Момент наблюдения в секундах; ISO-строки с 'T'/'Z' SQLite тоже понимает
+TS_EXPR = "CAST(COALESCE(strftime('%s', COALESCE(scraped_at, created_at)), 0) AS INTEGER)"
+
+
+def _select_list(conn: sqlite3.Connection) -> List[str]:
+    """SELECT-список под фактическую схему (model или model_name, отсутствующие колонки - NULL)"""
+    present = {row[1] for row in conn.execute('PRAGMA table_info(market_history)')}
+    if not present:
+        raise RuntimeError('Таблица market_history не найдена')
+
+    def column(name: str) -> str:
+        if name == 'model':
+            names = [n for n in ('model', 'model_name') if n in present]
+            return f"COALESCE({', '.join(names)})" if len(names) > 1 else (names[0] if names else 'NULL')
+        if name == 'ts':
+            return TS_EXPR if {'scraped_at', 'created_at'} <= present else \
+                TS_EXPR.replace('COALESCE(scraped_at, created_at)', 'scraped_at' if 'scraped_at' in present else 'created_at')
+        return name if name in present else 'NULL'
+
+    return [column(name) for name in ROW_COLUMNS]
+
+
+def _month(ts: int) -> str:
+    return str(np.datetime64(int(ts), 's').astype('datetime64[M]'))
+
+
+def _month_start(month: str) -> int:
+    return int(np.datetime64(month, 'M').astype('datetime64[s]').astype(np.int64))
+
+
+def _to_epoch(value: Any) -> Optional[int]:
+    if value is None or isinstance(value, (int, float)):
+        return value
+    return int(np.datetime64(str(value).replace('Z', ''), 's').astype(np.int64))
+
+
+def _encode_rows(rows: Sequence[Tuple], names: Sequence[str] = ROW_COLUMNS) -> Dict[str, np.ndarray]:
+    """Строки (колонки names) -> словарь колонок партиции"""
+    data = dict(zip(names, zip(*rows))) if rows else {name: () for name in names}
+    arrays: Dict[str, np.ndarray] = {}
+    for name in names:
+        values = data[name]
+        if name in ('id', 'ts'):
+            arrays[name] = np.asarray(values, dtype=np.int64)
+        elif name in NUMERIC_COLUMNS:
+            dtype = NUMERIC_COLUMNS[name]
+            if np.issubdtype(dtype, np.integer):
+                arrays[name] = np.asarray([v or 0 for v in values], dtype=dtype)  # 0 = нет значения
+            else:
+                arrays[name] = np.asarray([np.nan if v is None else v for v in values], dtype=dtype)
+        elif name in CATEGORICAL_COLUMNS:
+            vocab: Dict[str, int] = {}
+            arrays[name] = np.fromiter((-1 if v is None else vocab.setdefault(str(v), len(vocab)) for v in values),
+                                       dtype=np.int32, count=len(values))
+            arrays[f'{name}.vocab'] = np.asarray(list(vocab), dtype=str)
+        else:
+            encoded = [('' if v is None else str(v)).encode('utf-8') for v in values]
+            arrays[f'{name}.offsets'] = np.concatenate(([0], np.cumsum([len(b) for b in encoded], dtype=np.int64)))
+            arrays[f'{name}.blob'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return arrays
+
+
+def _decode_rows(npz) -> List[Tuple]:
+    """Партиция -> строки ROW_COLUMNS (для слияния с новыми строками)"""
+    columns: Dict[str, List] = {'id': npz['id'].tolist(), 'ts': npz['ts'].tolist()}
+    for name, dtype in NUMERIC_COLUMNS.items():
+        values = npz[name]
+        if np.issubdtype(dtype, np.integer):
+            columns[name] = [int(v) or None for v in values]
+        else:
+            columns[name] = [None if np.isnan(v) else float(v) for v in values]
+    for name in CATEGORICAL_COLUMNS:
+        vocab = npz[f'{name}.vocab'].tolist()
+        columns[name] = [None if c < 0 else vocab[c] for c in npz[name]]
+    for name in TEXT_COLUMNS:
+        offsets, blob = npz[f'{name}.offsets'], npz[f'{name}.blob'].tobytes()
+        columns[name] = [blob[offsets[i]:offsets[i + 1]].decode('utf-8') or None for i in range(len(offsets) - 1)]
+    return list(zip(*(columns[name] for name in ROW_COLUMNS)))
+
+
+class MarketArchive:
+    """Каталог помесячных партиций market_history"""
+
+    def __init__(self, root: str = DEFAULT_ARCHIVE_DIR):
+        self.root = root
+
+    def partition_path(self, month: str) -> str:
+        return os.path.join(self.root, f'{PARTITION_PREFIX}{month}.npz')
+
+    def months(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(name[len(PARTITION_PREFIX):-4] for name in os.listdir(self.root)
+                      if name.startswith(PARTITION_PREFIX) and name.endswith('.npz'))
+
+    def write_partition(self, month: str, rows: Sequence[Tuple]) -> int:
+        """Добавить строки в партицию месяца (повтор по id заменяет старую строку), атомарная запись"""
+        os.makedirs(self.root, exist_ok=True)
+        path = self.partition_path(month)
+        merged: Dict[int, Tuple] = {}
+        if os.path.exists(path):
+            with np.load(path) as npz:
+                merged = {row[0]: row for row in _decode_rows(npz)}
+        merged.update((row[0], row) for row in rows)
+        ordered = sorted(merged.values(), key=lambda row: (row[1], row[0]))
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(f, **_encode_rows(ordered))
+        os.replace(tmp_path, path)
+        return len(ordered)
+
+    def _window_months(self, since: Optional[int], until: Optional[int]) -> List[str]:
+        result = []
+        for month in self.months():
+            start = _month_start(month)
+            end = _month_start(str(np.datetime64(month, 'M') + 1))
+            if (since is None or end > since) and (until is None or start < until):
+                result.append(month)
+        return result
+
+    def _chunks(self, columns: Sequence[str], since: Optional[int], until: Optional[int],
+                db_path: Optional[str]) -> Iterable[Dict[str, Any]]:
+        """Колонки (категории - кодами со словарем) из партиций окна и, при db_path, из горячей таблицы"""
+        for month in self._window_months(since, until):
+            with np.load(self.partition_path(month)) as npz:
+                chunk = {'ts': npz['ts']}
+                for name in columns:
+                    chunk[name] = npz[name]
+                    if name in CATEGORICAL_COLUMNS:
+                        chunk[f'{name}.vocab'] = npz[f'{name}.vocab']
+            yield chunk
+        if db_path:
+            conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+            try:
+                # Только нужные колонки и только строки окна
+                names = ['ts'] + list(columns)
+                expressions = dict(zip(ROW_COLUMNS, _select_list(conn)))
+                query = f"SELECT {', '.join(expressions[name] for name in names)} FROM market_history WHERE 1"
+                params = []
+                if since is not None:
+                    query += f" AND {expressions['ts']} >= ?"
+                    params.append(since)
+                if until is not None:
+                    query += f" AND {expressions['ts']} < ?"
+                    params.append(until)
+                cursor = conn.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(BATCH_SIZE)
+                    if not rows:
+                        break
+                    yield _encode_rows(rows, names)
+            finally:
+                conn.close()
+
+    def aggregate(self, group_by: Sequence[str] = ('brand', 'model'), value: str = 'price_eur',
+                  since: Any = None, until: Any = None, where: Optional[Dict[str, str]] = None,
+                  db_path: Optional[str] = None, min_count: int = 1) -> List[Dict[str, Any]]:
+        """
+        Агрегаты value по группам group_by за окно [since, until).
+
+        since/until - epoch-секунды или дата ('2026-01-01'). where - точное
+        совпадение категориальных полей. db_path добавляет строки горячей
+        таблицы. Возвращает count/mean/median/p25/p75/min/max по группам.
+        """
+        since, until = _to_epoch(since), _to_epoch(until)
+        where = where or {}
+        for name in list(group_by) + list(where):
+            if name not in CATEGORICAL_COLUMNS:
+                raise ValueError(f'Группировать и фильтровать можно только по {", ".join(CATEGORICAL_COLUMNS)}')
+        columns = list(dict.fromkeys(list(group_by) + list(where) + [value]))
+        vocabs: Dict[str, Dict[str, int]] = {name: {} for name in group_by}
+        keys: List[List[np.ndarray]] = [[] for _ in group_by]
+        values: List[np.ndarray] = []
+
+        for chunk in self._chunks(columns, since, until, db_path):
+            mask = np.ones(len(chunk['ts']), dtype=bool)
+            if since is not None:
+                mask &= chunk['ts'] >= since
+            if until is not None:
+                mask &= chunk['ts'] < until
+            for name, wanted in where.items():
+                matches = np.flatnonzero(chunk[f'{name}.vocab'] == wanted)
+                mask &= np.isin(chunk[name], matches)
+            chunk_values = chunk[value].astype(np.float64)
+            mask &= ~np.isnan(chunk_values) if value != 'year' else chunk_values > 0
+            if not mask.any():
+                continue
+            values.append(chunk_values[mask])
+            for i, name in enumerate(group_by):
+                # Коды партиции -> общие коды запроса (словарь партиции мал, перевод - один take)
+                vocab = vocabs[name]
+                remap = np.asarray([vocab.setdefault(label, len(vocab)) for label in chunk[f'{name}.vocab'].tolist()] + [-1],
+                                   dtype=np.int64)
+                keys[i].append(remap[chunk[name][mask]])
+
+        if not values:
+            return []
+        all_values = np.concatenate(values)
+        combined = np.zeros(len(all_values), dtype=np.int64)
+        for i, name in enumerate(group_by):
+            size = len(vocabs[name]) + 1
+            combined = combined * size + (np.concatenate(keys[i]) + 1)  # 0 = NULL
+
+        order = np.lexsort((all_values, combined))
+        combined, all_values = combined[order], all_values[order]
+        starts = np.flatnonzero(np.r_[True, combined[1:] != combined[:-1]])
+        counts = np.diff(np.r_[starts, len(combined)])
+        sums = np.add.reduceat(all_values, starts)
+        stats = {
+            'count': counts,
+            'mean': sums / counts,
+            'min': all_values[starts],
+            'max': all_values[starts + counts - 1],
+        }
+        for name, q in QUANTILES.items():
+            # Линейная интерполяция, как np.percentile внутри каждой группы
+            position = starts + (counts - 1) * q
+            low = np.floor(position).astype(np.int64)
+            high = np.ceil(position).astype(np.int64)
+            stats[name] = all_values[low] + (all_values[high] - all_values[low]) * (position - low)
+
+        labels = {name: [None] + list(vocabs[name]) for name in group_by}
+        result = []
+        for index in np.flatnonzero(counts >= min_count):
+            key = int(combined[starts[index]])
+            group = {}
+            for name in reversed(group_by):
+                size = len(labels[name])
+                group[name] = labels[name][key % size]
+                key //= size
+            row = {name: group[name] for name in group_by}
+            for stat in STATS:
+                row[stat] = int(stats[stat][index]) if stat == 'count' else round(float(stats[stat][index]), 2)
+            result.append(row)
+        result.sort(key=lambda row: -row['count'])
+        return result
+
+    def info(self) -> Dict[str, Any]:
+        partitions = {}
+        for month in self.months():
+            path = self.partition_path(month)
+            with np.load(path) as npz:
+                partitions[month] = {'rows': len(npz['id']), 'bytes': os.path.getsize(path)}
+        return {
+            'root': os.path.abspath(self.root),
+            'partitions': partitions,
+            'rows': sum(p['rows'] for p in partitions.values()),
+            'bytes': sum(p['bytes'] for p in partitions.values()),
+        }
+
+
+def compact(db_path: str, archive: MarketArchive, older_than_days: float = DEFAULT_OLDER_THAN_DAYS,
+            batch_size: int = BATCH_SIZE, delete: bool = True, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Перенести строки старше older_than_days в архив и удалить их из таблицы.
+
+    Сначала пишутся все партиции, потом строки удаляются пачками по id (каждая
+    пачка - отдельная транзакция). Повторный запуск безопасен: партиция
+    заменяет строку с тем же id. dry_run - только посчитать строки для переноса.
+    """
+    start = time.perf_counter()
+    cutoff = int(time.time() - older_than_days * 86400)
+    conn = sqlite3.connect(db_path, timeout=30)
+    stats = {'rows': 0, 'deleted': 0, 'months': {}, 'cutoff': str(np.datetime64(cutoff, 's'))}
+    try:
+        expressions = _select_list(conn)
+        select, ts_expr = ', '.join(expressions), expressions[1]
+        if dry_run:
+            stats['matching'] = conn.execute(f'SELECT COUNT(*) FROM market_history WHERE {ts_expr} < ?',
+                                             (cutoff,)).fetchone()[0]
+            return stats
+        pending: Dict[str, List[Tuple]] = {}
+        pending_rows = 0
+        last_id = max_id = None
+
+        def flush():
+            for month, rows in pending.items():
+                archive.write_partition(month, rows)
+                stats['months'][month] = stats['months'].get(month, 0) + len(rows)
+            pending.clear()
+
+        while True:
+            query = f'SELECT {select} FROM market_history WHERE {ts_expr} < ?'
+            params: List[Any] = [cutoff]
+            if last_id is not None:
+                query += ' AND id > ?'
+                params.append(last_id)
+            rows = conn.execute(query + ' ORDER BY id LIMIT ?', params + [batch_size]).fetchall()
+            if not rows:
+                break
+            for row in rows:
+                pending.setdefault(_month(row[1]), []).append(row)
+            stats['rows'] += len(rows)
+            pending_rows += len(rows)
+            last_id = max_id = rows[-1][0]
+            if pending_rows >= FLUSH_ROWS:
+                flush()
+                pending_rows = 0
+        flush()
+
+        if delete and max_id is not None:
+            while True:
+                with conn:
+                    deleted = conn.execute(
+                        f'DELETE FROM market_history WHERE id IN (SELECT id FROM market_history '
+                        f'WHERE id <= ? AND {ts_expr} < ? LIMIT ?)', (max_id, cutoff, batch_size)).rowcount
+                stats['deleted'] += deleted
+                if deleted < batch_size:
+                    break
+        stats['hot_rows_left'] = conn.execute('SELECT COUNT(*) FROM market_history').fetchone()[0]
+    finally:
+        conn.close()
+    stats['seconds'] = round(time.perf_counter() - start, 3)
+    stats['rows_per_sec'] = round(stats['rows'] / stats['seconds']) if stats['seconds'] else 0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Columnar archive for market_history')
+    parser.add_argument('--archive', default=DEFAULT_ARCHIVE_DIR, help='Папка партиций')
+    parser.add_argument('--db', default=DEFAULT_DB, help='SQLite база с market_history')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    compact_parser = commands.add_parser('compact', help='Перенести старые строки в архив')
+    compact_parser.add_argument('--older-than-days', type=float, default=DEFAULT_OLDER_THAN_DAYS,
+                                help='Возраст строк для переноса (0 - все строки)')
+    compact_parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    compact_parser.add_argument('--keep', action='store_true', help='Не удалять перенесенные строки из таблицы')
+    compact_parser.add_argument('--dry-run', action='store_true', help='Только посчитать строки для переноса')
+
+    query_parser = commands.add_parser('query', help='Агрегаты цены по группам')
+    query_parser.add_argument('--group-by', default='brand,model', help='Поля через запятую')
+    query_parser.add_argument('--value', default='price_eur', choices=list(NUMERIC_COLUMNS))
+    query_parser.add_argument('--days', type=float, help='Окно: последние N дней')
+    query_parser.add_argument('--since', help='Начало окна (YYYY-MM-DD)')
+    query_parser.add_argument('--until', help='Конец окна (YYYY-MM-DD, не включительно)')
+    query_parser.add_argument('--where', action='append', default=[], metavar='FIELD=VALUE')
+    query_parser.add_argument('--include-hot', action='store_true', help='Добавить строки из горячей таблицы')
+    query_parser.add_argument('--min-count', type=int, default=1)
+    query_parser.add_argument('--limit', type=int, default=50)
+
+    commands.add_parser('info', help='Партиции и размер архива')
+    args = parser.parse_args()
+
+    archive = MarketArchive(args.archive)
+    if args.command == 'compact':
+        output = compact(args.db, archive, args.older_than_days, args.batch_size, delete=not args.keep,
+                         dry_run=args.dry_run)
+    elif args.command == 'query':
+        since = int(time.time() - args.days * 86400) if args.days else args.since
+        start = time.perf_counter()
+        groups = archive.aggregate([name.strip() for name in args.group_by.split(',') if name.strip()],
+                                   args.value, since, args.until,
+                                   dict(item.split('=', 1) for item in args.where),
+                                   args.db if args.include_hot else None, args.min_count)
+        print(f"{len(groups)} групп за {time.perf_counter() - start:.3f} с", file=sys.stderr)
+        output = groups[:args.limit]
+    else:
+        output = archive.info()
+    print(json.dumps(output, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
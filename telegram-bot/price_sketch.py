@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+"""
+Streaming market-price quantiles for deal scoring
+Потоковые квантили рыночных цен для оценки выгодности объявления
+
+Для каждого ключа (бренд+модель, бренд, категория, весь рынок) хранится
+KLL-скетч: иерархия компакторов, где элемент уровня h весит 2**h. Обновление
+- амортизированно O(1), память - O(k), скетчи объединяются (merge) без потери
+гарантий, ошибка ранга ~ 1/k. Процентиль новой цены ищется бинарным поиском
+по закэшированному отсортированному виду скетча, без прохода по market_history.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import sqlite3
+import argparse
+from bisect import bisect_right
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+SKETCH_FILE = os.getenv('PRICE_SKETCH_FILE', os.path.join(SCRIPT_DIR, 'price-sketches.json'))
+DEFAULT_DB = os.path.join(SCRIPT_DIR, '..', 'backend', 'database', 'eubike.db')
+DEFAULT_K = 200
+MIN_SAMPLES = 20            # меньше точек - берем более общий ключ
+DEAL_PERCENTILE = 0.25      # дешевле 25% рынка - выгодно
+CAPACITY_DECAY = 2 / 3
+MIN_LEVEL_CAPACITY = 2
+
+
+class KllSketch:
+    """KLL-скетч для квантилей потока чисел"""
+
+    def __init__(self, k: int = DEFAULT_K, seed: Optional[int] = None):
+        self.k = k
+        self.levels: List[List[float]] = [[]]
+        self.count = 0
+        self.min = float('inf')
+        self.max = float('-inf')
+        self._random = random.Random(seed)
+        self._sorted: Optional[Tuple[List[float], List[float]]] = None
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(MIN_LEVEL_CAPACITY, int(self.k * CAPACITY_DECAY ** depth) + 1)
+
+    def _size(self) -> int:
+        return sum(len(level) for level in self.levels)
+
+    def _total_capacity(self) -> int:
+        return sum(self._capacity(level) for level in range(len(self.levels)))
+
+    def update(self, value: float) -> None:
+        self.levels[0].append(value)
+        self.count += 1
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self._sorted = None
+        if self._size() > self._total_capacity():
+            self._compress()
+
+    def update_many(self, values: Iterable[float]) -> None:
+        for value in values:
+            self.update(value)
+
+    def _compress(self) -> None:
+        for level in range(len(self.levels)):
+            if len(self.levels[level]) >= self._capacity(level):
+                if level + 1 == len(self.levels):
+                    self.levels.append([])
+                items = sorted(self.levels[level])
+                # Нечетный элемент остается на уровне, из пар поднимается случайная половина
+                keep = [items.pop()] if len(items) % 2 else []
+                offset = self._random.randint(0, 1)
+                self.levels[level + 1].extend(items[offset::2])
+                self.levels[level] = keep
+                if self._size() <= self._total_capacity():
+                    break
+
+    def merge(self, other: 'KllSketch') -> None:
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for level, items in enumerate(other.levels):
+            self.levels[level].extend(items)
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._sorted = None
+        while self._size() > self._total_capacity():
+            self._compress()
+
+    def _view(self) -> Tuple[List[float], List[float]]:
+        """Отсортированные значения и накопленные веса (кэш до следующего обновления)"""
+        if self._sorted is None:
+            weighted = sorted((value, 1 << level) for level, items in enumerate(self.levels) for value in items)
+            values, cumulative, total = [], [], 0
+            for value, weight in weighted:
+                total += weight
+                values.append(value)
+                cumulative.append(total)
+            self._sorted = (values, cumulative)
+        return self._sorted
+
+    def rank(self, value: float) -> float:
+        """Доля потока <= value"""
+        values, cumulative = self._view()
+        if not values:
+            return 0.0
+        index = bisect_right(values, value)
+        return cumulative[index - 1] / cumulative[-1] if index else 0.0
+
+    def quantile(self, q: float) -> Optional[float]:
+        values, cumulative = self._view()
+        if not values:
+            return None
+        if q <= 0:
+            return self.min
+        if q >= 1:
+            return self.max
+        target = q * cumulative[-1]
+        return values[min(bisect_right(cumulative, target - 1e-9), len(values) - 1)]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'k': self.k, 'count': self.count, 'min': self.min, 'max': self.max, 'levels': self.levels}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'KllSketch':
+        sketch = cls(data['k'])
+        sketch.levels = [list(items) for items in data['levels']] or [[]]
+        sketch.count = data['count']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        return sketch
+
+
+def _norm(value: Any) -> str:
+    return ' '.join(str(value).lower().split()) if value else ''
+
+
+# Рубрики и типы Kleinanzeigen (dimension21 трекинга, "Typ: ...") -> категории Groq,
+# которыми размечены скетчи (groq-parser, market_history.category)
+MARKET_CATEGORIES = {
+    'mountainbike': 'Mountainbike', 'mountainbikes': 'Mountainbike', 'mtb': 'Mountainbike',
+    'rennrad': 'Rennrad', 'rennräder': 'Rennrad', 'rennraeder': 'Rennrad',
+    'citybike': 'Citybike', 'citybikes': 'Citybike', 'cityrad': 'Citybike', 'cityräder': 'Citybike',
+    'e-bike': 'E-Bike', 'e-bikes': 'E-Bike', 'elektrofahrrad': 'E-Bike', 'elektrofahrräder': 'E-Bike',
+    'pedelec': 'E-Bike', 'pedelecs': 'E-Bike',
+    'trekkingbike': 'Trekkingbike', 'trekkingrad': 'Trekkingbike', 'trekkingräder': 'Trekkingbike',
+    'bmx': 'BMX',
+    'kinderfahrrad': 'Kinderfahrrad', 'kinderfahrräder': 'Kinderfahrrad',
+}
+
+
+def market_category(value: Any) -> Optional[str]:
+    """Категория объявления в словаре скетчей; None - рубрика без соответствия (оценка по 'all')"""
+    return MARKET_CATEGORIES.get(_norm(value))
+
+
+def sketch_keys(brand: Any, model: Any, category: Any) -> List[str]:
+    """Ключи от самого точного к самому общему"""
+    brand, model, category = _norm(brand), _norm(model), _norm(category)
+    keys = []
+    if brand and model:
+        keys.append(f'model:{brand}|{model}')
+    if brand:
+        keys.append(f'brand:{brand}')
+    if category:
+        keys.append(f'category:{category}')
+    keys.append('all')
+    return keys
+
+
+class DealScorer:
+    """Набор скетчей по ключам: observe() при разборе объявления, score() для новой цены"""
+
+    def __init__(self, path: Optional[str] = SKETCH_FILE, k: int = DEFAULT_K, min_samples: int = MIN_SAMPLES):
+        self.path = path
+        self.k = k
+        self.min_samples = min_samples
+        self.sketches: Dict[str, KllSketch] = {}
+        if path and os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.k = data.get('k', k)
+            self.sketches = {key: KllSketch.from_dict(value) for key, value in data['sketches'].items()}
+
+    def observe(self, brand: Any, model: Any, category: Any, price: Optional[float]) -> None:
+        if not price or price <= 0:
+            return
+        for key in sketch_keys(brand, model, category):
+            sketch = self.sketches.get(key)
+            if sketch is None:
+                sketch = self.sketches[key] = KllSketch(self.k)
+            sketch.update(float(price))
+
+    def score(self, brand: Any, model: Any, category: Any, price: Optional[float]) -> Optional[Dict[str, Any]]:
+        """Процентиль цены на самом точном ключе, где достаточно данных"""
+        if not price or price <= 0:
+            return None
+        for key in sketch_keys(brand, model, category):
+            sketch = self.sketches.get(key)
+            if sketch is not None and sketch.count >= self.min_samples:
+                percentile = sketch.rank(float(price))
+                return {
+                    'key': key,
+                    'samples': sketch.count,
+                    'percentile': round(percentile, 3),
+                    'median': sketch.quantile(0.5),
+                    'p25': sketch.quantile(0.25),
+                    'p75': sketch.quantile(0.75),
+                    'isDeal': percentile <= DEAL_PERCENTILE,
+                }
+        return None
+
+    def score_and_observe(self, brand: Any, model: Any, category: Any, price: Optional[float]) -> Optional[Dict[str, Any]]:
+        # Сначала оценка (объявление не сравнивается само с собой), затем в поток
+        result = self.score(brand, model, category, price)
+        self.observe(brand, model, category, price)
+        return result
+
+    def seed_from_db(self, db_path: str, since: Optional[str] = None) -> int:
+        """Начальное наполнение из market_history (курсор, без загрузки таблицы в память)"""
+        conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+        try:
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(market_history)')}
+            # В старой схеме модель лежит в model_name, в 003_enhanced_fmv_schema - в model
+            model = 'COALESCE(model, model_name)' if {'model', 'model_name'} <= columns else \
+                'model' if 'model' in columns else 'model_name'
+            category = 'category' if 'category' in columns else 'NULL'
+            query = f'SELECT brand, {model}, {category}, price_eur FROM market_history WHERE price_eur > 0'
+            params: Tuple[Any, ...] = ()
+            if since:
+                query += ' AND scraped_at >= ?'
+                params = (since,)
+            rows = 0
+            for brand, model_name, category_name, price in conn.execute(query, params):
+                self.observe(brand, model_name, category_name, price)
+                rows += 1
+            return rows
+        finally:
+            conn.close()
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        tmp_path = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'k': self.k, 'sketches': {key: sketch.to_dict() for key, sketch in self.sketches.items()}}, f)
+        os.replace(tmp_path, self.path)
+
+
+def run_benchmark(size: int, queries: int, k: int) -> Dict[str, Any]:
+    """Точность ранга и время запроса против точного пересчета по всем ценам"""
+    rng = random.Random(11)
+    prices = [round(rng.lognormvariate(7.2, 0.6), 2) for _ in range(size)]
+
+    start = time.perf_counter()
+    sketch = KllSketch(k, seed=3)
+    sketch.update_many(prices)
+    build_s = time.perf_counter() - start
+
+    probes = [rng.choice(prices) * rng.uniform(0.7, 1.3) for _ in range(queries)]
+    start = time.perf_counter()
+    estimated = [sketch.rank(p) for p in probes]
+    sketch_s = time.perf_counter() - start
+    start = time.perf_counter()
+    exact = [sum(1 for x in prices if x <= p) / size for p in probes]
+    scan_s = time.perf_counter() - start
+
+    errors = sorted(abs(a - b) for a, b in zip(estimated, exact))
+    return {
+        'values': size,
+        'k': k,
+        'retained': sketch._size(),
+        'build_s': round(build_s, 3),
+        'updates_per_sec': round(size / build_s),
+        'sketch_query_us': round(sketch_s / queries * 1e6, 2),
+        'full_scan_query_us': round(scan_s / queries * 1e6, 2),
+        'rank_error_max': round(errors[-1], 4),
+        'rank_error_p95': round(errors[int(0.95 * (len(errors) - 1))], 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Market price sketches for deal scoring')
+    parser.add_argument('--file', default=SKETCH_FILE, help='Файл скетчей (.json)')
+    parser.add_argument('--seed-db', nargs='?', const=DEFAULT_DB, help='Заполнить из market_history (SQLite)')
+    parser.add_argument('--since', help='Только записи с scraped_at >= даты (YYYY-MM-DD)')
+    parser.add_argument('--score', nargs=4, metavar=('BRAND', 'MODEL', 'CATEGORY', 'PRICE'), help='Оценить цену')
+    parser.add_argument('--bench', type=int, metavar='N', help='Бенчмарк на N синтетических ценах')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('-k', type=int, default=DEFAULT_K)
+    args = parser.parse_args()
+
+    if args.bench:
+        print(json.dumps(run_benchmark(args.bench, args.queries, args.k), indent=2))
+        return
+
+    scorer = DealScorer(args.file, args.k)
+    if args.seed_db:
+        scorer.sketches = {}
+        start = time.perf_counter()
+        rows = scorer.seed_from_db(args.seed_db, args.since)
+        scorer.save()
+        print(f"{rows} цен из market_history -> {len(scorer.sketches)} скетчей за {time.perf_counter() - start:.2f} с",
+              file=sys.stderr)
+    if args.score:
+        brand, model, category, price = args.score
+        print(json.dumps(scorer.score(brand, model, category, float(price)), ensure_ascii=False, indent=2))
+    elif not args.seed_db:
+        summary = sorted(((key, s.count) for key, s in scorer.sketches.items()), key=lambda item: -item[1])
+        print(json.dumps({'sketches': len(summary), 'largest': summary[:20]}, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
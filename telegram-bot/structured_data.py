@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+"""
+Fast path over embedded structured data and anchored elements
+Быстрый путь: встроенные структурированные данные и якорные элементы страницы
+
+Страница Kleinanzeigen уже содержит машиночитаемые данные: meta-теги (og:*,
+itemprop), JSON-LD и объект трекинга (BelenConf) с ценой, PLZ, городом и
+категорией. Они извлекаются регулярными выражениями прямо по байтам, без
+построения DOM. Тексты элементов с известным id/классом (заголовок, цена,
+описание, контакт) вырезаются по сбалансированным тегам. Если что-то не
+найдено или разметка неоднозначна, поле возвращается как None и вызывающий
+код переходит к полному разбору BeautifulSoup. Неоднозначной считается
+разметка, которую html.parser может прочитать иначе: '<' без имени тега в
+тексте или якорь внутри вырезаемого элемента.
+"""
+
+import re
+import sys
+import json
+import html
+import argparse
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+# Атрибуты тега до '>': name, name=value, name="..." или name='...' ('>' в кавычках не закрывает тег).
+# Текст вида '<y";' (например, '<' внутри строки JS) с этим не совпадает и сразу отбрасывается
+ATTR_TOKEN = rb'(?:\s+[^\s=>/"\'<]+(?:\s*=\s*(?:"[^"]*"|\'[^\']*\'|[^\s"\'>]+))?)'
+TAG_BODY = ATTR_TOKEN + rb'*[\s/]*'
+# <meta property|name|itemprop="..." content="...">, атрибуты в любом порядке
+META_TAG_RE = re.compile(rb'<meta\b' + TAG_BODY + rb'>', re.IGNORECASE)
+ATTR_RE = re.compile(rb'([a-zA-Z_:][-a-zA-Z0-9_:.]*)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+JSONLD_RE = re.compile(rb'<script\b[^>]*type\s*=\s*["\']application/ld\+json["\'][^>]*>(.*?)</script\s*>',
+                       re.IGNORECASE | re.DOTALL)
+TRACKING_PAIR_RE = re.compile(rb'"([A-Za-z0-9_]+)"\s*:\s*"([^"\\]{0,200})"')
+# Только настоящие теги: '<' перед пробелом или цифрой html.parser оставляет текстом
+TAG_RE = re.compile(rb'<(?:[a-zA-Z][^\s/>]*' + TAG_BODY + rb'|/[a-zA-Z][^\s>]*\s*|![^>]*|\?[^>]*)>')
+INVISIBLE_RE = re.compile(rb'<!--.*?-->|<(script|style)\b' + TAG_BODY + rb'>.*?</\1\s*>', re.IGNORECASE | re.DOTALL)
+ZIP_RE = re.compile(r'^\d{5}$')
+
+META_FIELDS = {
+    'og:title': 'title',
+    'og:description': 'description',
+    'og:image': 'image',
+    'price': 'price',
+    'pricecurrency': 'currency',
+    'og:price:amount': 'price',
+    'og:price:currency': 'currency',
+}
+# Ключи объекта трекинга -> поле (первый найденный ключ выигрывает)
+TRACKING_FIELDS = {
+    'dimension92': 'zip',
+    'ad_zip': 'zip',
+    'ad_location': 'location',
+    'ad_price': 'price',
+    'ad_price_type': 'price_type',
+    'dimension21': 'category',
+    'l3_category_id': 'category_id',
+}
+VOID_TAGS = {b'area', b'base', b'br', b'col', b'embed', b'hr', b'img', b'input',
+             b'link', b'meta', b'source', b'track', b'wbr'}
+
+_anchor_cache: Dict[Tuple[str, str], 're.Pattern'] = {}
+_tag_cache: Dict[bytes, 're.Pattern'] = {}
+
+Page = Union[bytes, str]
+
+
+def as_bytes(page: Page) -> bytes:
+    return page.encode('utf-8') if isinstance(page, str) else page
+
+
+def _decode(data: bytes) -> str:
+    return html.unescape(data.decode('utf-8', errors='replace'))
+
+
+def _to_price(value: Any) -> Optional[float]:
+    try:
+        return float(str(value).replace(',', '.'))
+    except (TypeError, ValueError):
+        return None
+
+
+def scan_structured(page: Page) -> Dict[str, Any]:
+    """
+    Поля из meta-тегов, JSON-LD и объекта трекинга.
+
+    Возвращает dict с найденными полями (title, description, price, currency,
+    images, zip, location, category, ...) и 'sources' - откуда взято каждое поле.
+    Более структурированный источник выигрывает: JSON-LD > meta > трекинг.
+    """
+    raw = as_bytes(page)
+    data: Dict[str, Any] = {}
+    sources: Dict[str, str] = {}
+    images: List[str] = []
+
+    def put(field: str, value: Any, source: str) -> None:
+        if value in (None, '', []) or field in data:
+            return
+        data[field] = value
+        sources[field] = source
+
+    for match in JSONLD_RE.finditer(raw):
+        try:
+            doc = json.loads(match.group(1))
+        except ValueError:
+            continue
+        nodes = doc if isinstance(doc, list) else doc.get('@graph', [doc]) if isinstance(doc, dict) else []
+        for node in nodes:
+            if not isinstance(node, dict):
+                continue
+            put('title', node.get('name'), 'jsonld')
+            put('description', node.get('description'), 'jsonld')
+            image = node.get('image')
+            images.extend([image] if isinstance(image, str) else [i for i in image or [] if isinstance(i, str)])
+            offers = node.get('offers')
+            if isinstance(offers, list):
+                offers = offers[0] if offers else None
+            if isinstance(offers, dict):
+                put('price', _to_price(offers.get('price')), 'jsonld')
+                put('currency', offers.get('priceCurrency'), 'jsonld')
+
+    for match in META_TAG_RE.finditer(raw):
+        attrs = {k.lower(): (v1 if v1 is not None else v2) for k, v1, v2 in
+                 ((m.group(1), m.group(2), m.group(3)) for m in ATTR_RE.finditer(match.group(0)))}
+        key = (attrs.get(b'property') or attrs.get(b'name') or attrs.get(b'itemprop') or b'').lower()
+        field = META_FIELDS.get(key.decode('latin-1'))
+        content = attrs.get(b'content')
+        if not field or content is None:
+            continue
+        value = _decode(content)
+        if field == 'image':
+            images.append(value)
+        elif field == 'price':
+            put('price', _to_price(value), 'meta')
+        else:
+            put(field, value, 'meta')
+
+    for match in TRACKING_PAIR_RE.finditer(raw):
+        field = TRACKING_FIELDS.get(match.group(1).decode('latin-1'))
+        if field:
+            value = _decode(match.group(2))
+            if field == 'price':
+                put('price', _to_price(value), 'tracking')
+            elif field != 'zip' or ZIP_RE.match(value):
+                put(field, value, 'tracking')
+
+    # Дубли одной картинки отличаются только ?rule=
+    seen_paths = set()
+    for url in images:
+        path = urlsplit(url).path
+        if url.startswith(('http://', 'https://')) and path not in seen_paths:
+            seen_paths.add(path)
+            data.setdefault('images', []).append(url)
+    if 'images' in data:
+        sources['images'] = 'jsonld/meta'
+    data['sources'] = sources
+    return data
+
+
+def _anchor_re(kind: str, value: str):
+    key = (kind, value)
+    if key not in _anchor_cache:
+        name = re.escape(value.encode())
+        if kind == 'tag':
+            _anchor_cache[key] = re.compile(rb'<(' + name + rb')(?=[\s/>])' + TAG_BODY + rb'>', re.IGNORECASE)
+            return _anchor_cache[key]
+        if kind == 'id':
+            attr = rb'\s+id\s*=\s*(?:"' + name + rb'"|\'' + name + rb'\')'
+        else:
+            attr = rb'\s+class\s*=\s*(?:"(?:[^"]*\s)?' + name + rb'(?:\s[^"]*)?"|\'(?:[^\']*\s)?' + name + rb'(?:\s[^\']*)?\')'
+        # Атрибут ищется только на границе атрибутов, не внутри значений в кавычках
+        _anchor_cache[key] = re.compile(rb'<([a-zA-Z][a-zA-Z0-9]*)' + ATTR_TOKEN + rb'*?' + attr + TAG_BODY + rb'>',
+                                        re.IGNORECASE)
+    return _anchor_cache[key]
+
+
+def _closing(raw: bytes, opening, end: int) -> Optional[Tuple[int, int]]:
+    """(начало содержимого, начало закрывающего тега) для найденного открывающего тега"""
+    name = opening.group(1).lower()
+    if name in VOID_TAGS or opening.group(0).endswith(b'/>'):
+        return opening.end(), opening.end()
+    if name not in _tag_cache:
+        escaped = re.escape(name)
+        _tag_cache[name] = re.compile(rb'<(/)' + escaped + rb'\s*>|<' + escaped + TAG_BODY + rb'>', re.IGNORECASE)
+    depth = 1
+    for tag in _tag_cache[name].finditer(raw, opening.end(), end):
+        if tag.group(1):
+            depth -= 1
+            if depth == 0:
+                return opening.end(), tag.start()
+        elif not tag.group(0).endswith(b'/>'):
+            depth += 1
+    return None
+
+
+def element_span(raw: bytes, kind: str, value: str, start: int = 0, end: Optional[int] = None) -> Optional[Tuple[int, int]]:
+    """
+    (начало, конец) содержимого первого элемента kind='id'|'class'|'tag' = value.
+
+    Закрывающий тег ищется подсчетом вложенности одноименных тегов. None - если
+    элемента нет или разметку не удалось сбалансировать (тогда нужен DOM).
+    """
+    end = len(raw) if end is None else end
+    if kind != 'tag' and raw.find(value.encode(), start, end) < 0:
+        return None
+    match = _anchor_re(kind, value).search(raw, start, end)
+    return _closing(raw, match, end) if match else None
+
+
+def element_spans(raw: bytes, kind: str, value: str, start: int = 0, end: Optional[int] = None):
+    """Все такие элементы в порядке документа: (открывающий тег, span или None)"""
+    end = len(raw) if end is None else end
+    # id/class чувствительны к регистру (как в DOM): без подстроки регулярку можно не запускать
+    if kind != 'tag' and raw.find(value.encode(), start, end) < 0:
+        return
+    for match in _anchor_re(kind, value).finditer(raw, start, end):
+        yield match.group(0), _closing(raw, match, end)
+
+
+def tag_attrs(tag: bytes) -> Dict[str, str]:
+    return {k.decode('latin-1').lower(): _decode(v1 if v1 is not None else v2)
+            for k, v1, v2 in ((m.group(1), m.group(2), m.group(3)) for m in ATTR_RE.finditer(tag))}
+
+
+def strip_elements(fragment: bytes, names) -> Optional[bytes]:
+    """Фрагмент без элементов с данными именами тегов (как decompose); None - не сбалансировано"""
+    for name in names:
+        while True:
+            match = _anchor_re('tag', name).search(fragment)
+            if not match:
+                break
+            span = _closing(fragment, match, len(fragment))
+            if span is None:
+                return None
+            close = fragment.find(b'>', span[1])
+            fragment = fragment[:match.start()] + b'<br>' + fragment[close + 1:]
+    return fragment
+
+
+def fragment_text(fragment: bytes, strip: bool = False, separator: str = '') -> Optional[str]:
+    """
+    Текст фрагмента как у BeautifulSoup.get_text (без script/style/комментариев).
+    None - если после вырезания тегов остался '<' (разметка неоднозначна, нужен DOM).
+    """
+    raw_pieces = TAG_RE.split(INVISIBLE_RE.sub(b'<br>', fragment))
+    if any(b'<' in piece for piece in raw_pieces):
+        return None
+    pieces = [_decode(piece) for piece in raw_pieces]
+    if strip:
+        pieces = [piece.strip() for piece in pieces]
+        pieces = [piece for piece in pieces if piece]
+    return separator.join(pieces)
+
+
+def element_text(raw: bytes, kind: str, value: str, strip: bool = True,
+                 start: int = 0, end: Optional[int] = None) -> Optional[str]:
+    span = element_span(raw, kind, value, start, end)
+    if span is None:
+        return None
+    return fragment_text(raw[span[0]:span[1]], strip=strip)
+
+
+class FastPathStats:
+    """Сколько страниц обслужено быстрым путем целиком и каких полей не хватало"""
+
+    def __init__(self):
+        self.pages = 0
+        self.fast = 0
+        self.missing: Dict[str, int] = {}
+
+    def record(self, missing: List[str]) -> None:
+        self.pages += 1
+        if not missing:
+            self.fast += 1
+        for field in missing:
+            self.missing[field] = self.missing.get(field, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'pages': self.pages,
+            'fast_path': self.fast,
+            'dom_fallback': self.pages - self.fast,
+            'fast_path_ratio': round(self.fast / self.pages, 3) if self.pages else 0.0,
+            'missing_fields': dict(sorted(self.missing.items(), key=lambda item: -item[1])),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Structured data from saved Kleinanzeigen pages')
+    parser.add_argument('html', nargs='+', help='Сохраненные .html страницы')
+    args = parser.parse_args()
+
+    output = {}
+    for path in args.html:
+        with open(path, 'rb') as f:
+            output[path] = scan_structured(f.read())
+    json.dump(output, sys.stdout, ensure_ascii=False, indent=2)
+    print()
+
+
+if __name__ == '__main__':
+    main()